@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Benchmark for batch mode, run from the repository's root directory.
+# It renders the same messages once with one ponysay process for each
+# message and once with a single `ponysay --batch` process, and prints
+# the number of renders per second for both. The exit value is non-zero
+# if batch mode is not faster.
+
+import os
+import sys
+import time
+import subprocess
+
+program = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'src', '__main__.py')
+count = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+messages = ['Message number %i, friendship is magic!' % i for i in range(0, count)]
+command = [sys.executable, program, '-f', 'twilight']
+
+
+def separate():
+    '''
+    Render each message with a ponysay process of its own
+
+    @return  :float  The time, in seconds, the rendering took
+    '''
+    start = time.perf_counter()
+    for message in messages:
+        subprocess.run(command + ['--', message], stdout = subprocess.DEVNULL, check = True)
+    return time.perf_counter() - start
+
+
+def batch():
+    '''
+    Render all messages with one ponysay process
+
+    @return  :float  The time, in seconds, the rendering took
+    '''
+    start = time.perf_counter()
+    subprocess.run(command + ['--batch'], input = '\n'.join(messages).encode('utf-8'),
+                   stdout = subprocess.DEVNULL, check = True)
+    return time.perf_counter() - start
+
+
+(a, b) = (separate(), batch())
+print('separate processes: %8.1f renders/s' % (count / a))
+print('batch mode:         %8.1f renders/s' % (count / b))
+print('speedup:            %8.1f ×' % (a / b))
+
+if b >= a:
+    print('batch mode is not faster than separate processes')
+    exit(1)
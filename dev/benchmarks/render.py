@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Benchmark for the pony renderer (Backend), run from the repository's
+# root directory. It renders synthetic ponies of doubling size, with a
+# wide balloon, and prints the time for each size and the ratio to the
+# previous size. Ratios close to 2 mean that the rendering time grows
+# linearly with the size of the pony file, ratios close to 4 would mean
+# that it grows quadratically. The exit value is non-zero if the growth
+# looks worse than linear.
+
+import os
+import sys
+import time
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'src'))
+from backend import *
+
+
+def makepony(lines):
+    '''
+    Create a synthetic pony file
+    
+    @param   lines:int  The number of lines in the pony image
+    @return  :str       The content of the pony file
+    '''
+    rc = '$$$\nNAME: Benchmark\n$$$\n$balloon5$\n'
+    for y in range(0, 4):
+        rc += ' ' * (4 + y) + '$\\$\n'
+    for y in range(0, lines):
+        rc += '\t\033[38;5;%im▄▀\033[0m' % (y % 256)
+        rc += ''.join('\033[48;5;%im\033[38;5;%im▄' % ((x + y) % 256, x % 256) for x in range(0, 40))
+        rc += '\033[0m\n'
+    return rc
+
+
+def bench(lines, message):
+    '''
+    Time the rendering of a synthetic pony
+    
+    @param   lines:int    The number of lines in the pony image
+    @param   message:str  The message in the balloon
+    @return  :float       The time, in seconds, the rendering took
+    '''
+    with tempfile.NamedTemporaryFile('wb', suffix = '.pony') as file:
+        file.write(makepony(lines).encode('utf-8'))
+        file.flush()
+        backend = Backend(message = message, ponyfile = file.name, wrapcolumn = None, width = None,
+                          balloon = Balloon.fromFile(None, False), hyphen = '-', linkcolour = '',
+                          ballooncolour = '', mode = '\033[0m', infolevel = 0)
+        start = time.perf_counter()
+        backend.parse()
+        return time.perf_counter() - start
+
+
+message = '\n'.join('%i %s' % (i, 'Friendship is magic! ' * 6) for i in range(0, 40))
+last = None
+worst = 0
+for lines in (250, 500, 1000, 2000, 4000):
+    elapsed = min(bench(lines, message) for _ in range(0, 3))
+    ratio = '' if last is None else '  ×%.2f' % (elapsed / last)
+    if last is not None:
+        worst = max(worst, elapsed / last)
+    print('%6i lines: %8.3f s%s' % (lines, elapsed, ratio))
+    last = elapsed
+
+if worst > 3:
+    print('rendering time grows faster than linearly')
+    exit(1)
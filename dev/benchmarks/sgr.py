@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Benchmark for the escape sequence minimiser, run from the repository's
+# root directory. It renders every pony in the given directories, by
+# default ponies/ and ttyponies/, with a message in a coloured balloon,
+# once as is and once with minimised escape sequences, and prints the
+# total size of the output and how much the minimiser saves. The exit
+# value is non-zero if a minimised rendering does not print the same
+# characters with the same colours as the original rendering.
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'src'))
+from backend import *
+
+
+dirs = sys.argv[1:] or ['ponies', 'ttyponies']
+message = '\033[1mFriendship\033[21m is \033[35mmagic\033[39m! ' * 8
+
+
+def bench(ponyfile, minimise):
+    '''
+    Render a pony
+
+    @param   ponyfile:str                   The pony file
+    @param   minimise:bool                  Whether to minimise the escape sequences
+    @return  (output, elapsed):(str, float)  The rendered pony, and the time, in seconds, the rendering took
+    '''
+    backend = Backend(message = message, ponyfile = ponyfile, wrapcolumn = 60, width = None,
+                      balloon = Balloon.fromFile(None, False), hyphen = '\033[31m-', linkcolour = '\033[33m',
+                      ballooncolour = '\033[36m', mode = '\033[0m', infolevel = 0, quiet = True, minimise = minimise)
+    start = time.perf_counter()
+    backend.parse()
+    return (backend.output, time.perf_counter() - start)
+
+
+(count, failed, before, after, plain, minimised) = (0, [], 0, 0, 0, 0)
+for ponydir in dirs:
+    for ponyfile in sorted(os.listdir(ponydir)):
+        if not ponyfile.endswith('.pony'):
+            continue
+        ponyfile = os.path.join(ponydir, ponyfile)
+        try:
+            (a, elapsed) = bench(ponyfile, False)
+        except Exception as err:
+            print('cannot render %s: %s' % (ponyfile, str(err)))
+            continue
+        plain += elapsed
+        (b, elapsed) = bench(ponyfile, True)
+        minimised += elapsed
+        count += 1
+        before += len(a.encode('utf-8'))
+        after += len(b.encode('utf-8'))
+        if SGRMinimiser.cells(a) != SGRMinimiser.cells(b):
+            failed.append(ponyfile)
+
+print('ponies:     %12i' % count)
+print('output:     %12i bytes' % before)
+print('minimised:  %12i bytes (%.1f %% saved)' % (after, 100 * (before - after) / max(before, 1)))
+print('render:     %12.2f s' % plain)
+print('+ minimise: %12.2f s' % minimised)
+
+if len(failed) > 0:
+    for ponyfile in failed:
+        print('not the same colours: %s' % ponyfile)
+    exit(1)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Benchmark for the spello correction index, run from the repository's
+# root directory. For dictionaries of synthetic pony names of growing
+# size it prints the time it takes to build the index, the time of a
+# lookup in the index and the time of a lookup by comparing the word
+# with every name. The sizes can be given as arguments. Last it checks
+# a list of 10000 names, half of them misspelled, in one batch against
+# a dictionary of 500 names. The exit value is non-zero if a lookup in
+# the index does not return the same corrections as the linear scan.
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'src'))
+from spellocorrecter import *
+
+
+sizes = [int(size) for size in sys.argv[1:]] or [300, 3000, 30000, 100000]
+syllables = ['twi', 'light', 'rar', 'ity', 'flut', 'ter', 'shy', 'pin', 'kie', 'pie', 'ap', 'ple',
+             'jack', 'rain', 'bow', 'dash', 'spike', 'cel', 'es', 'tia', 'lu', 'na', 'star', 'swirl',
+             'dis', 'cord', 'trix', 'ie', 'der', 'py', 'mac', 'big', 'sweet', 'ie', 'belle', 'scoot', 'a', 'loo']
+rnd = random.Random(0)
+
+
+def makenames(count):
+    '''
+    Create synthetic pony names
+
+    @param   count:int        The number of names
+    @return  :list<str>       The names, sorted and without duplicates
+    '''
+    names = set()
+    while len(names) < count:
+        names.add(''.join(rnd.choice(syllables) for i in range(rnd.randint(2, 4))))
+    return sorted(names)
+
+
+def misspell(name):
+    '''
+    Introduce a few typos in a name
+
+    @param   name:str  The name
+    @return  :str      The misspelled name
+    '''
+    name = list(name)
+    for i in range(rnd.randint(1, 3)):
+        (op, i, c) = (rnd.randint(0, 2), rnd.randrange(len(name)), rnd.choice('abcdefghijklmnopqrstuvwxyz'))
+        if op == 0:    name.insert(i, c)
+        elif op == 1:  name[i] = c
+        else:          del name[i]
+    return ''.join(name)
+
+
+def linear(names, used):
+    '''
+    Find the closest names by comparing the word with every name
+
+    @param   names:list<str>                        The names
+    @param   used:str                               The word to correct
+    @return  (words, distance):(list<string>, int)  The closest names and their distance
+    '''
+    (rc, best) = ([], 0x7FFFFFFF)
+    for name in names:
+        distance = SpelloCorrecter.distance(name, used)
+        if distance < best:
+            (rc, best) = ([name], distance)
+        elif distance == best:
+            rc.append(name)
+    return (rc, best)
+
+
+failed = False
+print('%8s %12s %14s %14s' % ('names', 'build', 'index lookup', 'linear lookup'))
+for size in sizes:
+    names = makenames(size)
+    start = time.perf_counter()
+    SpelloCorrecter.makeTree(names)
+    build = time.perf_counter() - start
+    correcter = SpelloCorrecter(names)
+    queries = [misspell(rnd.choice(names)) for i in range(20)]
+    start = time.perf_counter()
+    found = [correcter.correct(used) for used in queries]
+    indexed = (time.perf_counter() - start) / len(queries)
+    queries = queries[:5]
+    start = time.perf_counter()
+    expected = [linear(names, used) for used in queries]
+    scanned = (time.perf_counter() - start) / len(queries)
+    if found[:len(queries)] != expected:
+        failed = True
+    print('%8i %10.2f s %11.2f ms %11.2f ms' % (size, build, indexed * 1000, scanned * 1000))
+
+names = makenames(500)
+queries = [rnd.choice(names) for i in range(10000)]
+queries = [misspell(name) if i % 2 == 0 else name for (i, name) in enumerate(queries)]
+correcter = SpelloCorrecter(names)
+start = time.perf_counter()
+found = correcter.correctAll(queries)
+print('batch of %i names against %i names: %.2f s' % (len(queries), len(names), time.perf_counter() - start))
+if found[:20] != [linear(names, used) for used in queries[:20]]:
+    failed = True
+
+if failed:
+    print('the index did not return the same corrections as the linear scan')
+    exit(1)
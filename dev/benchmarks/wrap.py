@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Stress benchmark for the message wrapper (Wrapper), run from the
+# repository's root directory. It wraps synthetic piped logs of doubling
+# size, up to 10 MB, with ordinary words, indented lines, coloured words,
+# soft hyphenated words, no-break spaces, combining characters and long
+# unbroken words, and prints the time for each size and the ratio to the
+# previous size. The lines of the log are generated as they are wrapped,
+# so the log is never in memory. Ratios close to 2 mean that the wrapping
+# time grows linearly with the size of the message, ratios close to 4
+# would mean that it grows quadratically. The exit value is non-zero if
+# the growth looks worse than linear.
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'src'))
+from wrapper import *
+
+
+words = ['friendship', 'is', 'magic', 'pinkie', 'pie', '\033[35mtwilight\033[39m', '\033[1;33mfluttershy\033[0m',
+         'soft­hy­phen­ated', 'no break', 'naïve', 'combininǵ', '12:00:00', '[info]', '/usr/share/ponysay/ponies']
+
+
+def makelog(size):
+    '''
+    Generate the lines of a synthetic log
+    
+    @param   size:int   The number of characters in the log
+    @return  :itr<str>  The lines of the log
+    '''
+    rnd = random.Random(size)
+    while size > 0:
+        if rnd.random() < 0.02:
+            line = rnd.choice('abcdef0123456789') * rnd.randint(200, 20000)
+        else:
+            line = ' '.join(rnd.choice(words) for _ in range(0, rnd.randint(1, 30)))
+            if rnd.random() < 0.1:
+                line = '    ' + line
+        size -= len(line) + 1
+        yield line
+
+
+def bench(size):
+    '''
+    Time the wrapping of a synthetic log
+    
+    @param   size:int  The number of characters in the log
+    @return  :float    The time, in seconds, the wrapping took
+    '''
+    wrapper = Wrapper(60, 8, 5, '-')
+    start = time.perf_counter()
+    for line in wrapper.wrap(makelog(size)):
+        pass
+    return time.perf_counter() - start
+
+
+last = None
+worst = 0
+for size in (1250000, 2500000, 5000000, 10000000):
+    elapsed = min(bench(size) for _ in range(0, 2))
+    ratio = '' if last is None else '  ×%.2f' % (elapsed / last)
+    if last is not None:
+        worst = max(worst, elapsed / last)
+    print('%9i bytes: %8.3f s%s' % (size, elapsed, ratio))
+    last = elapsed
+
+if worst > 3:
+    print('wrapping time grows faster than linearly')
+    exit(1)
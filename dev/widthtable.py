@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Prints the table of character widths for src/width.py, from the
+# Unicode database of the Python that runs it. The table is a list of
+# the code points where the width changes, and a string with the width
+# from each of those code points.
+#
+# A character has the width 0 if it is combining, enclosing, a format
+# character (except the soft hyphen), a Hangul medial vowel or final
+# consonant, or the zero width space, or if it is in one of the ranges
+# that ponysay has always treated as combining. A character has the
+# width 2 if it is wide or fullwidth East Asian. Unassigned code points
+# have the width 1, except in the planes and blocks reserved for CJK
+# ideographs. All other characters have the width 1.
+
+import unicodedata
+
+
+def width(char):
+    '''
+    Gets the width of a character
+
+    @param   char:int  The code point of the character
+    @return  :int      The width of the character
+    '''
+    if (0x0300 <= char <= 0x036F) or (0x1DC0 <= char <= 0x1DFF) or (0x20D0 <= char <= 0x20FF) or (0xFE20 <= char <= 0xFE2F):
+        return 0
+    category = unicodedata.category(chr(char))
+    if (category in ('Mn', 'Me')) or ((category == 'Cf') and (char != 0x00AD)):
+        return 0
+    if (0x1160 <= char <= 0x11FF) or (char == 0x200B):
+        return 0
+    if category == 'Cn':
+        for (start, end) in ((0x3400, 0x4DBF), (0x4E00, 0x9FFF), (0xF900, 0xFAFF), (0x20000, 0x2FFFD), (0x30000, 0x3FFFD)):
+            if start <= char <= end:
+                return 2
+        return 1
+    return 2 if unicodedata.east_asian_width(chr(char)) in ('W', 'F') else 1
+
+
+(starts, widths, last) = ([], '', None)
+for char in range(0, 0x110000):
+    w = width(char)
+    if w != last:
+        starts.append(char)
+        widths += str(w)
+        last = w
+
+print('    ## Generated by dev/widthtable.py from Unicode %s' % unicodedata.unidata_version)
+line = '    __starts = ['
+for (i, start) in enumerate(starts):
+    item = '0x%04X' % start + (', ' if i + 1 < len(starts) else ']')
+    if len(line) + len(item) > 120:
+        print(line.rstrip())
+        line = ' ' * 16
+    line += item
+print(line)
+print('    __widths = (' + ('\n' + ' ' * 16).join(repr(widths[i : i + 96]) for i in range(0, len(widths), 96)) + ')')
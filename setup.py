@@ -760,7 +760,7 @@ class Setup():
                 files.append('completion/%s-completion.%s' % (shell, command))
                 files.append('completion/%s-completion.%s.install' % (shell, command))
         for sharedir in [sharedir[0] for sharedir in sharedirs]:
-            for dimfile in ('widths', 'heights', 'onlyheights'):
+            for dimfile in ('widths', 'heights', 'onlyheights', 'dimensions.bin'):
                 files.append(sharedir + '/' + dimfile)
 
         self.removeLists(files, dirs)
@@ -39,9 +39,8 @@ Authors:
          Jan Alexander "heftig" Steffens:  Major contributor of the first implementation
          Kyah "L-four" Rindlisbacher:      Patched the first implementation
 '''
-from common import *
-from argparser import *
-from ponysay import *
+import os
+import sys
 
 
 
@@ -56,9 +55,22 @@ if __name__ == '__main__':
         istool = istool[:istool.find(os.extsep)]
     istool = istool.endswith('-tool')
     if istool:
-        from ponysaytool import * ## will start ponysay-tool
+        from ponysaytool import *
+        PonysayTool(args = opts)
         exit(0)
     
+    ## Let the ponysay daemon do the work, if one is running and it is asked for,
+    ## this is done before the rest of ponysay is loaded as to save time
+    if ('PONYSAY_DAEMON' in os.environ) and (os.environ['PONYSAY_DAEMON'].lower() in ('yes', 'y', '1')):
+        from daemon import *
+        rc = Daemon.request(sys.argv)
+        if rc is not None:
+            exit(rc)
+    
+    from common import *
+    from argparser import *
+    from ponysay import *
+    
     isthink = sys.argv[0]
     if os.sep in isthink:
         isthink = isthink[isthink.rfind(os.sep) + 1:]
@@ -109,6 +121,7 @@ run `man ponysay`. Ponysay has so much more to offer than described here.''')
     opts.add_argumentless(['-i', '--info'])
     opts.add_argumentless(['+i', '++info'])
     opts.add_argumented(  ['-r', '--restrict'], arg = 'RESTRICTION')
+    opts.add_argumentless(['--explain'])
     
     opts.add_argumented(  ['+c', '--colour'],                      arg = 'COLOUR')
     opts.add_argumented(  ['--colour-bubble', '--colour-balloon'], arg = 'COLOUR')
@@ -137,6 +150,8 @@ run `man ponysay`. Ponysay has so much more to offer than described here.''')
     opts.add_argumented(  ['+f', '++file', '++pony'],              arg = 'PONY',   help = 'Select a non-MLP:FiM pony.')
     opts.add_argumented(  ['-F'] + _F,                             arg = 'PONY',   help = 'Select a pony, that can be a non-MLP:FiM pony.')
     opts.add_argumented(  ['-q', '--quote'],                       arg = 'PONY',   help = 'Select a pony which will quote herself.')
+    opts.add_argumentless(['--batch'],                                             help = 'Print a pony for each record read from stdin.')
+    opts.add_argumented(  ['--batch-delimiter'],                   arg = 'DELIM',  help = 'Specify the delimiter between records in batch mode.')
     opts.add_variadic(    ['--f', '--files', '--ponies'],          arg = 'PONY')
     opts.add_variadic(    ['++f', '++files', '++ponies'],          arg = 'PONY')
     opts.add_variadic(    ['--F'] + __F,                           arg = 'PONY')
@@ -151,4 +166,7 @@ run `man ponysay`. Ponysay has so much more to offer than described here.''')
     ## Start
     ponysay = Ponysay()
     ponysay.unrecognised = unrecognised
-    ponysay.run(opts)
+    try:
+        ponysay.run(opts)
+    finally:
+        printinfo('spawned processes: %i' % Popen.spawned)
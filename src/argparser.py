@@ -126,6 +126,8 @@ class ArgParser():
         '''
         self.argcount = len(argv) - 1
         self.files = []
+        for opt in self.opts:
+            self.opts[opt] = None
         
         argqueue = []
         optqueue = []
@@ -32,9 +32,15 @@ the colon.
 from common import *
 from balloon import *
 from colourstack import *
+from sgrminimiser import *
 from ucs import *
+from width import *
+from wrapper import *
+from ponytemplate import *
 
-import unicodedata
+import re
+import itertools
+from collections import deque
 
 
 
@@ -43,20 +49,28 @@ class Backend():
     Super-ultra-extreme-awesomazing replacement for cowsay
     '''
     
-    def __init__(self, message, ponyfile, wrapcolumn, width, balloon, hyphen, linkcolour, ballooncolour, mode, infolevel):
+    def __init__(self, message, ponyfile, wrapcolumn, width, balloon, hyphen, linkcolour, ballooncolour, mode, infolevel,
+                 wraplimit = None, wrapexceed = None, quiet = False, minimise = False, height = None, bottom = False):
         '''
         Constructor
         
-        @param  message:str        The message spoken by the pony
-        @param  ponyfile:str       The pony file
-        @param  wrapcolumn:int     The column at where to wrap the message, `None` for no wrapping
-        @param  width:int          The width of the screen, `None` if truncation should not be applied
-        @param  balloon:Balloon    The balloon style object, `None` if only the pony should be printed
-        @param  hyphen:str         How hyphens added by the wordwrapper should be printed
-        @param  linkcolour:str     How to colour the link character, empty string if none
-        @param  ballooncolour:str  How to colour the balloon, empty string if none
-        @param  mode:str           Mode string for the pony
-        @parma  infolevel:int      2 if ++info is used, 1 if --info is used and 0 otherwise
+        @param  message:str|itr<str>  The message spoken by the pony, or its lines, which are only read as far as needed
+        @param  ponyfile:str          The pony file
+        @param  wrapcolumn:int        The column at where to wrap the message, `None` for no wrapping
+        @param  width:int             The width of the screen, `None` if truncation should not be applied
+        @param  balloon:Balloon       The balloon style object, `None` if only the pony should be printed
+        @param  hyphen:str            How hyphens added by the wordwrapper should be printed
+        @param  linkcolour:str        How to colour the link character, empty string if none
+        @param  ballooncolour:str     How to colour the balloon, empty string if none
+        @param  mode:str              Mode string for the pony
+        @parma  infolevel:int         2 if ++info is used, 1 if --info is used and 0 otherwise
+        @param  wraplimit:int?        The width under which words are not broken, `None` for `$PONYSAY_WRAP_LIMIT` or 8
+        @param  wrapexceed:int?       How far words may exceed the wrapping column, `None` for `$PONYSAY_WRAP_EXCEED` or 5
+        @param  quiet:bool            Whether not to print the pony's metadata, and the bytes saved by `minimise`, to /proc/self/fd/3
+        @param  minimise:bool         Whether to rewrite the colour escape sequences in the output to as few bytes as possible
+        @param  height:int?           The number of lines of the output that are shown, `None` if all are, no more of the
+                                      message is read, wrapped and rendered than can be shown
+        @param  bottom:bool           Whether the last, rather than the first, `height` lines of the output are shown
         '''
         self.message = message
         self.ponyfile = ponyfile
@@ -69,6 +83,13 @@ class Backend():
         self.balloontop = 0
         self.balloonbottom = 0
         self.infolevel = infolevel
+        self.wraplimit = wraplimit
+        self.wrapexceed = wrapexceed
+        self.quiet = quiet
+        self.minimise = minimise
+        self.height = height
+        self.bottom = bottom
+        self.padding = None
         
         if self.balloon is not None:
             self.link = {'\\' : linkcolour + self.balloon.link,
@@ -83,24 +104,25 @@ class Backend():
     
     def parse(self):
         '''
-        Process all data
+        Process all data, and store the output in `self.output`
         '''
-        self.__loadFile()
+        self.output = '\n'.join(self.generate())
+    
+    
+    def generate(self):
+        '''
+        Process all data, and generate the output line by line, each line as soon as it is complete
         
-        if self.pony.startswith('$$$\n'):
-            self.pony = self.pony[4:]
-            if self.pony.startswith('$$$\n'):
-                infoend = 4
-                info = ''
-            else:
-                infoend = self.pony.index('\n$$$\n')
-                info = self.pony[:infoend]
-                infoend += 5
+        @return  :itr<str>  The lines of the output, without line breaks
+        '''
+        template = PonyTemplate.load(self.ponyfile)
+        (info, body) = (template.info, template.body)
+        
+        if info is not None:
             if self.infolevel == 2:
                 self.message = Backend.formatInfo(info)
-                self.pony = self.pony[infoend:]
             elif self.infolevel == 1:
-                self.pony = Backend.formatInfo(info).replace('$', '$$')
+                body = Backend.formatInfo(info).replace('$', '$$')
             else:
                 info = info.split('\n')
                 for line in info:
@@ -115,18 +137,34 @@ class Backend():
                             value = line[sep + 1:].strip()
                             if len(value) > 0:
                                 self.balloonbottom = int(value)
-                printinfo(info)
-                self.pony = self.pony[infoend:]
+                if not self.quiet:
+                    printinfo(info)
         elif self.infolevel == 2:
             self.message = '\033[01;31mI am the mysterious mare...\033[21;39m'
         elif self.infolevel == 1:
-            self.pony = 'There is not metadata for this pony file'
-        self.pony = self.mode + self.pony
+            body = 'There is not metadata for this pony file'
         
+        if isinstance(body, str):
+            self.pony = PonyTemplate.compile(self.mode + body)[0]
+        else:
+            (mode, closed) = PonyTemplate.compile(self.mode)
+            if closed:
+                self.pony = mode + body
+            else:
+                ## The mode string continues into the image, so they cannot be compiled separately
+                source = template.source if template.source is not None else PonyTemplate.read(self.ponyfile)[1]
+                self.pony = PonyTemplate.compile(self.mode + source)[0]
+        
+        self.__readMessage()
         self.__expandMessage()
         self.__unpadMessage()
-        self.__processPony()
-        self.__truncate()
+        lines = self.__processPony()
+        if (self.balloon is None) and ((self.balloontop > 0) or (self.balloonbottom > 0)):
+            lines = self.__cutBalloon(lines)
+        lines = self.__truncate(lines)
+        if self.minimise:
+            lines = self.__minimise(lines)
+        yield from lines
     
     
     @staticmethod
@@ -159,18 +197,61 @@ class Backend():
         return tags + comment
     
     
+    def __readMessage(self):
+        '''
+        Read the message, if it is given as lines, but not more of it than can be shown
+        '''
+        if self.height is None:
+            if not isinstance(self.message, str):
+                self.message = '\n'.join(self.message)
+            return
+        lines = self.message.split('\n') if isinstance(self.message, str) else self.message
+        if not self.bottom:
+            ## Only the first lines are kept, but the lines after them are looked at for how much the
+            ## message is padded with whitespace, until a line that is not padded at all is found
+            lines = iter(lines)
+            (buf, padding) = (list(itertools.islice(lines, self.height)), None)
+            for line in lines:
+                line = len(Backend.__padding.match(line).group().expandtabs(8))
+                padding = line if padding is None else min(padding, line)
+                if padding == 0:
+                    break
+            (lines, self.padding) = (buf, padding)
+        else:
+            ## Only the last lines are kept, but the lines before them are
+            ## looked at for how much the message is padded with whitespace
+            (buf, padding) = (deque(maxlen = self.height), None)
+            for line in lines:
+                if len(buf) == self.height:
+                    dropped = buf[0] if self.height > 0 else line
+                    dropped = len(Backend.__padding.match(dropped).group().expandtabs(8))
+                    padding = dropped if padding is None else min(padding, dropped)
+                buf.append(line)
+            (lines, self.padding) = (list(buf), padding)
+        self.message = '\n'.join(lines)
+    
+    
+    __padding = re.compile('[ \t]*')
+    '''
+    The whitespace a line of the message is padded with
+    '''
+    
+    
     def __unpadMessage(self):
         '''
         Remove padding spaces fortune cookies are padded with whitespace (damn featherbrains)
         '''
         lines = self.message.split('\n')
         for spaces in (128, 64, 32, 16, 8, 4, 2, 1):
-            padded = True
+            padded = (self.padding is None) or (spaces <= self.padding)
             for line in lines:
+                if not padded:
+                    break
                 if not line.startswith(' ' * spaces):
                     padded = False
-                    break
             if padded:
+                if self.padding is not None:
+                    self.padding -= spaces
                 for i in range(0, len(lines)):
                     line = lines[i]
                     line = line[spaces:]
@@ -183,69 +264,124 @@ class Backend():
         '''
         Converts all tabs in the message to spaces by expanding
         '''
+        if '\t' not in self.message:
+            return
         lines = self.message.split('\n')
-        buf = ''
+        buf = []
         for line in lines:
             (i, n, x) = (0, len(line), 0)
             while i < n:
                 c = line[i]
                 i += 1
                 if c == '\033':
-                    colour = Backend.getColour(line, i - 1)
+                    colour = Width.getEscape(line, i - 1)
                     i += len(colour) - 1
-                    buf += colour
+                    buf.append(colour)
                 elif c == '\t':
                     nx = 8 - (x & 7)
-                    buf += ' ' * nx
+                    buf.append(' ' * nx)
                     x += nx
                 else:
-                    buf += c
-                    if not UCS.isCombining(c):
-                        x += 1
-            buf += '\n'
-        self.message = buf[:-1]
+                    buf.append(c)
+                    x += Width.char(c)
+            buf.append('\n')
+        self.message = ''.join(buf)[:-1]
     
     
-    def __loadFile(self):
+    def __cutBalloon(self, lines):
         '''
-        Loads the pony file
+        Remove the lines the pony file says are used by the balloon, from the top and the bottom of the output
+        
+        @param   lines:itr<str>  The lines of the output
+        @return  :itr<str>       The lines of the output without the balloon
         '''
-        with open(self.ponyfile, 'rb') as ponystream:
-            self.pony = ponystream.read().decode('utf8', 'replace')
+        ## The last line is removed too, it is empty as the output ends with a line break
+        buf = deque()
+        for line in itertools.islice(lines, self.balloontop, None):
+            buf.append(line)
+            if len(buf) > self.balloonbottom + 1:
+                yield buf.popleft()
     
     
-    def __truncate(self):
+    def __truncate(self, lines):
         '''
-        Truncate output to the width of the screen
+        Truncate output to the width of the screen, and to the number of lines that are shown
+        
+        @param   lines:itr<str>  The lines of the output
+        @return  :itr<str>       The lines of the output, truncated
         '''
+        if self.height is not None:
+            if self.height <= 0:
+                lines = []
+            elif not self.bottom:
+                lines = itertools.islice(lines, self.height)
+            else:
+                lines = self.__truncateBottom(lines)
         if self.width is None:
-            return
-        lines = self.output.split('\n')
-        self.output = ''
+            return lines
+        return (Width.truncate(line, self.width) for line in lines)
+    
+    
+    def __truncateBottom(self, lines):
+        '''
+        Keep only the last lines of the output, as many as are shown
+        
+        @param   lines:itr<str>  The lines of the output
+        @return  :itr<str>       The last lines of the output
+        '''
+        ## The output ends with a line break, so the last line is empty and is not counted
+        buf = deque()
+        (minimiser, carried) = (SGRMinimiser(), [])
         for line in lines:
-            (i, n, x) = (0, len(line), 0)
-            while i < n:
-                c = line[i]
-                i += 1
-                if c == '\033':
-                    colour = Backend.getColour(line, i - 1)
-                    i += len(colour) - 1
-                    self.output += colour
-                else:
-                    if x < self.width:
-                        self.output += c
-                        if not UCS.isCombining(c):
-                            x += 1
-            self.output += '\n'
-        self.output = self.output[:-1]
+            buf.append(line)
+            if len(buf) > self.height + 1:
+                ## The colours and palette set on the lines that are not shown are carried over
+                carried.append(minimiser.process(''.join(Width.escapes(buf.popleft()))))
+        end = [buf.pop()] if (len(buf) > 0) and (buf[-1] == '') else []
+        while len(buf) > self.height:
+            carried.append(minimiser.process(''.join(Width.escapes(buf.popleft()))))
+        if len(carried) > 0:
+            buf[0] = ''.join(carried) + minimiser.end() + buf[0]
+        yield from buf
+        yield from end
     
     
-    def __processPony(self):
+    def __minimise(self, lines):
         '''
-        Process the pony file and generate output to self.output
+        Rewrite the colour escape sequences in the output to as few bytes as possible
+        
+        @param   lines:itr<str>  The lines of the output
+        @return  :itr<str>       The lines of the output, minimised
         '''
-        self.output = ''
+        (before, after) = (0, 0)
+        minimiser = SGRMinimiser()
         
+        ## Line breaks can change the rendition, so which line is the last is known by reading one line ahead
+        lines = iter(lines)
+        line = next(lines, None)
+        while line is not None:
+            following = next(lines, None)
+            if following is None:
+                before += len(line.encode('utf-8'))
+                line = minimiser.process(line) + minimiser.end()
+                after += len(line.encode('utf-8'))
+            else:
+                before += len(line.encode('utf-8')) + 1
+                line = minimiser.process(line + '\n')
+                after += len(line.encode('utf-8'))
+                line = line[:-1]
+            yield line
+            line = following
+        if not self.quiet:
+            printinfo('minimised escape sequences: %i of %i bytes saved' % (before - after, before))
+    
+    
+    def __processPony(self):
+        '''
+        Process the pony file and generate the output, line by line
+        
+        @return  :itr<str>  The lines of the output, without line breaks
+        '''
         AUTO_PUSH = '\033[01010~'
         AUTO_POP  = '\033[10101~'
         
@@ -254,136 +390,148 @@ class Backend():
             variables[key] = AUTO_PUSH + self.link[key] + AUTO_POP
         
         indent = 0
-        dollar = None
         balloonLines = None
         colourstack = ColourStack(AUTO_PUSH, AUTO_POP)
+        output = []
+        compiled = {}
+        
+        ## Text that passes through the colour stack is collected, and processed in
+        ## runs, up to the next text that does not pass through the colour stack
+        pending = []
+        def emit(text):
+            if len(pending) > 0:
+                output.append(colourstack.process(''.join(pending)))
+                del pending[:]
+            output.append(text)
+        
+        ## The lines that are complete, are taken from the output as soon as a token has been read
+        def complete():
+            lines = ''.join(output).replace(AUTO_PUSH, '').replace(AUTO_POP, '').split('\n')
+            output[:] = [lines.pop()]
+            return lines
         
-        (i, n, lineindex, skip, nonskip) = (0, len(self.pony), 0, 0, 0)
-        while i < n:
-            c = self.pony[i]
-            if c == '\t':
-                n += 7 - (indent & 7)
-                ed = ' ' * (8 - (indent & 7))
-                c = ' '
-                self.pony = self.pony[:i] + ed + self.pony[i + 1:]
-            i += 1
-            if c == '$':
-                if dollar is not None:
-                    if '=' in dollar:
-                        name = dollar[:dollar.find('=')]
-                        value = dollar[dollar.find('=') + 1:]
-                        variables[name] = value
-                    elif not dollar.startswith('balloon'):
-                        data = variables[dollar].replace('$', '$$')
+        ## Text that is inserted (expanded variables and balloon lines) is read in full
+        ## before the rest of the tokens it was inserted into, so the read position of
+        ## the token list it was inserted into is saved on a stack
+        cursors = []
+        
+        def compile(data):
+            if data not in compiled:
+                compiled[data] = PonyTemplate.compile(data)[0]
+            return compiled[data]
+        
+        (tokens, t) = (self.pony, 0)
+        (lineindex, skip, nonskip) = (0, 0, 0)
+        while True:
+            if (len(output) > 0) and ('\n' in output[-1]):
+                yield from complete()
+            if t == len(tokens):
+                if len(cursors) == 0:
+                    break
+                (tokens, t) = cursors.pop()
+                continue
+            token = tokens[t]
+            t += 1
+            if not isinstance(token, str):
+                kind = token[0]
+                if kind == 't':
+                    token = ' ' * (8 - (indent & 7))
+                elif kind == 'c':
+                    pending.append(token[1])
+                    continue
+                else:
+                    if kind == '$':
+                        token = PonyTemplate.dollarToken((' ' * (8 - (indent & 7))).join(token[1]))
+                        kind = token[0]
+                    if kind == 'd':
+                        variables[token[1]] = token[2]
+                    elif kind == 'v':
+                        data = variables[token[1]].replace('$', '$$')
                         if data == '$$': # if not handled specially we will get an infinity loop
                             if (skip == 0) or (nonskip > 0):
                                 if nonskip > 0:
                                     nonskip -= 1
-                                self.output += '$'
+                                emit('$')
                                 indent += 1
                             else:
                                 skip -= 1
                         else:
-                            n += len(data)
-                            self.pony = self.pony[:i] + data + self.pony[i:]
+                            cursors.append((tokens, t))
+                            (tokens, t) = (compile(data), 0)
                     elif self.balloon is not None:
-                        (w, h, x, justify) = ('0', 0, 0, None)
-                        props = dollar[7:]
-                        if len(props) > 0:
-                            if ',' in props:
-                                if props[0] != ',':
-                                    w = props[:props.index(',')]
-                                h = int(props[props.index(',') + 1:])
-                            else:
-                                w = props
-                        if 'l' in w:
-                            (x, w) = (int(w[:w.find('l')]), int(w[w.find('l') + 1:]))
-                            justify = 'l'
-                            w -= x;
-                        elif 'c' in w:
-                            (x, w) = (int(w[:w.find('c')]), int(w[w.find('c') + 1:]))
-                            justify = 'c'
-                            w -= x;
-                        elif 'r' in w:
-                            (x, w) = (int(w[:w.find('r')]), int(w[w.find('r') + 1:]))
-                            justify = 'r'
-                            w -= x;
+                        if token[1] is None:
+                            (w, h, x, justify) = PonyTemplate.parseBalloon(token[2])
                         else:
-                            w = int(w)
+                            (w, h, x, justify) = token[1:]
                         balloon = self.__getBalloon(w, h, x, justify, indent)
                         balloon = balloon.split('\n')
                         balloon = [AUTO_PUSH + self.ballooncolour + item + AUTO_POP for item in balloon]
-                        for b in balloon[0]:
-                            self.output += b + colourstack.feed(b)
+                        pending.append(balloon[0])
                         if lineindex == 0:
                             balloonpre = '\n' + (' ' * indent)
                             for line in balloon[1:]:
-                                self.output += balloonpre;
-                                for b in line:
-                                    self.output += b + colourstack.feed(b);
+                                emit(balloonpre)
+                                pending.append(line)
                             indent = 0
                         elif len(balloon) > 1:
                             balloonLines = balloon
                             balloonLine = 0
                             balloonIndent = indent
-                            indent += Backend.len(balloonLines[0])
+                            indent += Width.len(balloonLines[0])
                             balloonLines[0] = None
-                    dollar = None
-                else:
-                    dollar = ''
-            elif dollar is not None:
-                if c == '\033':
-                    c = self.pony[i]
-                    i += 1
-                dollar += c
-            elif c == '\033':
-                colour = Backend.getColour(self.pony, i - 1)
-                for b in colour:
-                    self.output += b + colourstack.feed(b);
-                i += len(colour) - 1
-            elif c == '\n':
-                self.output += c
-                indent = 0
-                (skip, nonskip) = (0, 0)
-                lineindex += 1
-                if balloonLines is not None:
-                    balloonLine += 1
-                    if balloonLine == len(balloonLines):
-                        balloonLines = None
-            else:
-                if (balloonLines is not None) and (balloonLines[balloonLine] is not None) and (balloonIndent == indent):
+                    continue
+            
+            if (balloonLines is None) and (skip == 0) and (nonskip == 0):
+                ## Nothing is inserted into the text or skipped, so it can be passed on in whole lines
+                lines = token.split('\n')
+                pending.append(lines[0])
+                indent += Width.len(lines[0])
+                for line in lines[1:]:
+                    emit('\n')
+                    (indent, lineindex) = (0, lineindex + 1)
+                    pending.append(line)
+                    indent += Width.len(line)
+                continue
+            
+            for (i, c) in enumerate(token):
+                if c == '\n':
+                    emit(c)
+                    indent = 0
+                    (skip, nonskip) = (0, 0)
+                    lineindex += 1
+                    if balloonLines is not None:
+                        balloonLine += 1
+                        if balloonLine == len(balloonLines):
+                            balloonLines = None
+                elif (balloonLines is not None) and (balloonLines[balloonLine] is not None) and (balloonIndent == indent):
                     data = balloonLines[balloonLine]
-                    datalen = Backend.len(data)
+                    datalen = Width.len(data)
                     skip += datalen
                     nonskip += datalen
                     data = data.replace('$', '$$')
-                    n += len(data)
-                    self.pony = self.pony[:i] + data + self.pony[i:]
+                    cursors.append((tokens, t))
+                    if i + 1 < len(token):
+                        cursors.append(([token[i + 1:]], 0))
+                    (tokens, t) = (compile(data), 0)
                     balloonLines[balloonLine] = None
+                    break
+                elif (skip == 0) or (nonskip > 0):
+                    if nonskip > 0:
+                        nonskip -= 1
+                    pending.append(c)
+                    indent += Width.char(c)
                 else:
-                    if (skip == 0) or (nonskip > 0):
-                        if nonskip > 0:
-                            nonskip -= 1
-                        self.output += c + colourstack.feed(c);
-                        if not UCS.isCombining(c):
-                            indent += 1
-                    else:
-                        skip -= 1
+                    skip -= 1
         
         if balloonLines is not None:
             for line in balloonLines[balloonLine:]:
                 data = ' ' * (balloonIndent - indent) + line + '\n'
-                for b in data:
-                    self.output += b + colourstack.feed(b);
+                pending.append(data)
                 indent = 0
+        emit('')
         
-        self.output = self.output.replace(AUTO_PUSH, '').replace(AUTO_POP, '')
-        
-        if self.balloon is None:
-            if (self.balloontop > 0) or (self.balloonbottom > 0):
-                self.output = self.output.split('\n')
-                self.output = self.output[self.balloontop : ~(self.balloonbottom)]
-                self.output = '\n'.join(self.output)
+        yield from complete()
+        yield output[0]
     
     
     @staticmethod
@@ -395,51 +543,7 @@ class Backend():
         @param   offset:int  The offset at where to start reading, a escape must begin here
         @return  :str        The escape sequence
         '''
-        (i, n) = (offset, len(input))
-        rc = input[i]
-        i += 1
-        if i == n: return rc
-        c = input[i]
-        i += 1
-        rc += c
-        
-        if c == ']':
-            if i == n: return rc
-            c = input[i]
-            i += 1
-            rc += c
-            if c == 'P':
-                di = 0
-                while (di < 7) and (i < n):
-                    c = input[i]
-                    i += 1
-                    di += 1
-                    rc += c
-            while c == '0':
-                c = input[i]
-                i += 1
-                rc += c
-            if c == '4':
-                c = input[i]
-                i += 1
-                rc += c
-                if c == ';':
-                    c = input[i]
-                    i += 1
-                    rc += c
-                    while c != '\\':
-                        c = input[i]
-                        i += 1
-                        rc += c
-        elif c == '[':
-            while i < n:
-                c = input[i]
-                i += 1
-                rc += c
-                if (c == '~') or (('a' <= c) and (c <= 'z')) or (('A' <= c) and (c <= 'Z')):
-                    break
-        
-        return rc
+        return Width.getEscape(input, offset)
     
     
     @staticmethod
@@ -450,18 +554,7 @@ class Backend():
         @param   input:str  The input buffer
         @return  :int       The number of visible characters
         '''
-        (rc, i, n) = (0, 0, len(input))
-        while i < n:
-            c = input[i]
-            if c == '\033':
-                i += len(Backend.getColour(input, i))
-            else:
-                i += 1
-                if not UCS.isCombining(c):
-                    rc += 1
-                    if unicodedata.east_asian_width(c) in ('F', 'W'):
-                        rc += 1
-        return rc
+        return Width.len(input)
     
     
     def __getBalloon(self, width, height, innerleft, justify, left):
@@ -491,7 +584,7 @@ class Backend():
         
         extraleft = 0
         if justify is not None:
-            msgwidth = self.len(max(msg, key = self.len)) + self.balloon.minwidth
+            msgwidth = max(Width.len(line) for line in msg) + self.balloon.minwidth
             extraleft = innerleft
             if msgwidth > width:
                 if (justify == 'l') and (wrap is not None):
@@ -507,7 +600,7 @@ class Backend():
                         if extraleft + msgwidth > wrap:
                             extraleft -= msgwidth - wrap
         
-        rc = self.balloon.get(width, height, msg, Backend.len);
+        rc = self.balloon.get(width, height, msg, Width.len);
         if extraleft > 0:
             rc = ' ' * extraleft + rc.replace('\n', '\n' + ' ' * extraleft)
         return rc
@@ -521,129 +614,31 @@ class Backend():
         @param   wrap:int     The width at where to force wrapping
         @return  :str         The message wrapped
         '''
-        wraplimit = os.environ['PONYSAY_WRAP_LIMIT'] if 'PONYSAY_WRAP_LIMIT' in os.environ else ''
-        wraplimit = 8 if len(wraplimit) == 0 else int(wraplimit)
+        wraplimit = self.wraplimit
+        if wraplimit is None:
+            wraplimit = os.environ['PONYSAY_WRAP_LIMIT'] if 'PONYSAY_WRAP_LIMIT' in os.environ else ''
+            wraplimit = 8 if len(wraplimit) == 0 else int(wraplimit)
         
-        wrapexceed = os.environ['PONYSAY_WRAP_EXCEED'] if 'PONYSAY_WRAP_EXCEED' in os.environ else ''
-        wrapexceed = 5 if len(wrapexceed) == 0 else int(wrapexceed)
+        wrapexceed = self.wrapexceed
+        if wrapexceed is None:
+            wrapexceed = os.environ['PONYSAY_WRAP_EXCEED'] if 'PONYSAY_WRAP_EXCEED' in os.environ else ''
+            wrapexceed = 5 if len(wrapexceed) == 0 else int(wrapexceed)
         
-        buf = ''
+        AUTO_PUSH = '\033[01010~'
+        AUTO_POP  = '\033[10101~'
+        wrapper = Wrapper(wrap, wraplimit, wrapexceed, '%s%s%s' % (AUTO_PUSH, self.hyphen, AUTO_POP))
+        ## No more lines are wrapped than can be shown
+        buf = deque(maxlen = self.height if self.bottom else None)
         try:
-            AUTO_PUSH = '\033[01010~'
-            AUTO_POP  = '\033[10101~'
-            msg = message.replace('\n', AUTO_PUSH + '\n' + AUTO_POP)
-            cstack = ColourStack(AUTO_PUSH, AUTO_POP)
-            for c in msg:
-                buf += c + cstack.feed(c)
-            lines = buf.replace(AUTO_PUSH, '').replace(AUTO_POP, '').split('\n')
-            buf = ''
-            
-            for line in lines:
-                b = [None] * len(line)
-                map = {0 : 0}
-                (bi, cols, w) = (0, 0, wrap)
-                (indent, indentc) = (-1, 0)
-                
-                (i, n) = (0, len(line))
-                while i <= n:
-                    d = None
-                    if i < n:
-                        d = line[i]
-                    i += 1
-                    if d == '\033':
-                        ## Invisible stuff
-                        i -= 1
-                        colourseq = Backend.getColour(line, i)
-                        b[bi : bi + len(colourseq)] = colourseq
-                        i += len(colourseq)
-                        bi += len(colourseq)
-                    elif (d is not None) and (d != ' '):
-                        ## Fetch word
-                        if indent == -1:
-                            indent = i - 1
-                            for j in range(0, indent):
-                                if line[j] == ' ':
-                                    indentc += 1
-                        b[bi] = d
-                        bi += 1
-                        if (not UCS.isCombining(d)) and (d != '­'):
-                            cols += 1
-                        map[cols] = bi
-                    else:
-                        ## Wrap?
-                        mm = 0
-                        bisub = 0
-                        iwrap = wrap - (0 if indent == 1 else indentc)
-                        
-                        while ((w > wraplimit) and (cols > w + wrapexceed)) or (cols > iwrap):
-                            ## wrap
-                            x = w;
-                            if mm + x not in map: # Too much whitespace?
-                                cols = 0
-                                break
-                            nbsp = b[map[mm + x]] == ' ' # nbsp
-                            m = map[mm + x]
-                            
-                            if ('­' in b[bisub : m]) and not nbsp: # soft hyphen
-                                hyphen = m - 1
-                                while b[hyphen] != '­': # soft hyphen
-                                    hyphen -= 1
-                                while map[mm + x] > hyphen: ## Only looking backward, if forward is required the word is probabily not hyphenated correctly
-                                    x -= 1
-                                x += 1
-                                m = map[mm + x]
-                            
-                            mm += x - (0 if nbsp else 1) ## − 1 so we have space for a hythen
-                            
-                            for bb in b[bisub : m]:
-                                buf += bb
-                            buf += '\n' if nbsp else '\0\n'
-                            cols -= x - (0 if nbsp else 1)
-                            bisub = m
-                            
-                            w = iwrap
-                            if indent != -1:
-                                buf += ' ' * indentc
-                        
-                        for j in range(bisub, bi):
-                            b[j - bisub] = b[j]
-                        bi -= bisub
-                        
-                        if cols > w:
-                            buf += '\n'
-                            w = wrap
-                            if indent != -1:
-                                buf += ' ' * indentc
-                                w -= indentc
-                        for bb in b[:bi]:
-                            if bb is not None:
-                                buf += bb
-                        w -= cols
-                        cols = 0
-                        bi = 0
-                        if d is None:
-                            i += 1
-                        else:
-                            if w > 0:
-                                buf += ' '
-                                w -= 1
-                            else:
-                                buf += '\n'
-                                w = wrap
-                                if indent != -1:
-                                    buf += ' ' * indentc
-                                    w -= indentc
-                buf += '\n'
-            
-            rc = '\n'.join(line.rstrip(' ') for line in buf[:-1].split('\n'));
-            rc = rc.replace('­', ''); # remove soft hyphens
-            rc = rc.replace('\0', '%s%s%s' % (AUTO_PUSH, self.hyphen, AUTO_POP))
-            return rc
+            for line in wrapper.wrap(message.split('\n')):
+                if (not self.bottom) and (self.height is not None) and (len(buf) >= self.height):
+                    break
+                buf.append(line)
+            return '\n'.join(buf)
         except Exception as err:
             import traceback
             errormessage = ''.join(traceback.format_exception(type(err), err, None))
-            rc = '\n'.join(line.rstrip(' ') for line in buf.split('\n'));
-            rc = rc.replace('\0', '%s%s%s' % (AUTO_PUSH, self.hyphen, AUTO_POP))
+            rc = '\n'.join(buf)
             errormessage += '\n---- WRAPPING BUFFER ----\n\n' + rc
             try:
                 if os.readlink('/proc/self/fd/2') != os.readlink('/proc/self/fd/1'):
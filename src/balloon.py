@@ -30,7 +30,7 @@ lines and the ‘FREE’ is and upper case and directly followed by
 the colon.
 '''
 from common import *
-from ucs import *
+from width import *
 
 
 
@@ -39,6 +39,12 @@ class Balloon():
     Balloon format class
     '''
     
+    __loaded = {}
+    '''
+    Already loaded balloon styles, mapped from the balloon style files to their modification times and balloon style objects
+    '''
+    
+    
     def __init__(self, link, linkmirror, linkcross, ww, ee, nw, nnw, n, nne, ne, nee, e, see, se, sse, s, ssw, sw, sww, w, nww):
         '''
         Constructor
@@ -73,13 +79,13 @@ class Balloon():
         (self.sse, self.s, self.ssw) = (sse, s, ssw)
         (self.sww, self.w, self.nww) = (sww, w, nww)
         
-        _ne = max(ne, key = UCS.dispLen)
-        _nw = max(nw, key = UCS.dispLen)
-        _se = max(se, key = UCS.dispLen)
-        _sw = max(sw, key = UCS.dispLen)
+        _ne = max(ne, key = Width.len)
+        _nw = max(nw, key = Width.len)
+        _se = max(se, key = Width.len)
+        _sw = max(sw, key = Width.len)
         
-        minE = UCS.dispLen(max([_ne, nee, e, see, _se, ee], key = UCS.dispLen))
-        minW = UCS.dispLen(max([_nw, nww, e, sww, _sw, ww], key = UCS.dispLen))
+        minE = Width.len(max([_ne, nee, e, see, _se, ee], key = Width.len))
+        minW = Width.len(max([_nw, nww, e, sww, _sw, ww], key = Width.len))
         minN = len(max([ne, nne, n, nnw, nw], key = len))
         minS = len(max([se, sse, s, ssw, sw], key = len))
         
@@ -98,8 +104,9 @@ class Balloon():
         @return  :str              The balloon as a formated string
         '''
         ## Get dimension
+        widths = [lencalc(line) for line in lines]
         h = self.minheight + len(lines)
-        w = self.minwidth + lencalc(max(lines, key = lencalc))
+        w = self.minwidth + max(widths)
         if w < minw:  w = minw
         if h < minh:  h = minh
         
@@ -116,21 +123,22 @@ class Balloon():
         
         ## Create the upper part of the balloon
         for j in range(0, len(self.n)):
-            outer = UCS.dispLen(self.nw[j]) + UCS.dispLen(self.ne[j])
-            inner = UCS.dispLen(self.nnw[j]) + UCS.dispLen(self.nne[j])
+            outer = Width.len(self.nw[j]) + Width.len(self.ne[j])
+            inner = Width.len(self.nnw[j]) + Width.len(self.nne[j])
             if outer + inner <= w:
                 rc.append(self.nw[j] + self.nnw[j] + self.n[j] * (w - outer - inner) + self.nne[j] + self.ne[j])
             else:
                 rc.append(self.nw[j] + self.n[j] * (w - outer) + self.ne[j])
         
         ## Encapsulate the message instead left and right edges of balloon
+        edges = Width.len(self.w) + Width.len(self.e)
         for j in range(0, len(lines)):
-            rc.append(ws[j] + lines[j] + ' ' * (w - lencalc(lines[j]) - UCS.dispLen(self.w) - UCS.dispLen(self.e)) + es[j])
+            rc.append(ws[j] + lines[j] + ' ' * (w - widths[j] - edges) + es[j])
         
         ## Create the lower part of the balloon
         for j in range(0, len(self.s)):
-            outer = UCS.dispLen(self.sw[j]) + UCS.dispLen(self.se[j])
-            inner = UCS.dispLen(self.ssw[j]) + UCS.dispLen(self.sse[j])
+            outer = Width.len(self.sw[j]) + Width.len(self.se[j])
+            inner = Width.len(self.ssw[j]) + Width.len(self.sse[j])
             if outer + inner <= w:
                 rc.append(self.sw[j] + self.ssw[j] + self.s[j] * (w - outer - inner) + self.sse[j] + self.se[j])
             else:
@@ -154,6 +162,16 @@ class Balloon():
                 return Balloon('o', 'o', 'o', '( ', ' )', [' _'], ['_'], ['_'], ['_'], ['_ '], ' )',  ' )', ' )', ['- '], ['-'], ['-'], ['-'], [' -'],  '( ', '( ', '( ')
             return    Balloon('\\', '/', 'X', '< ', ' >', [' _'], ['_'], ['_'], ['_'], ['_ '], ' \\', ' |', ' /', ['- '], ['-'], ['-'], ['-'], [' -'], '\\ ', '| ', '/ ')
         
+        ## Reuse the balloon style if it has already been loaded and has not been modified since
+        try:
+            mtime = os.stat(balloonfile).st_mtime_ns
+        except:
+            mtime = None
+        if (mtime is not None) and (balloonfile in Balloon.__loaded):
+            (loadedmtime, balloon) = Balloon.__loaded[balloonfile]
+            if loadedmtime == mtime:
+                return balloon
+        
         ## Initialise map for balloon parts
         map = {}
         for elem in ('\\', '/', 'X', 'ww', 'ee', 'nw', 'nnw', 'n', 'nne', 'ne', 'nee', 'e', 'see', 'se', 'sse', 's', 'ssw', 'sw', 'sww', 'w', 'nww'):
@@ -176,7 +194,10 @@ class Balloon():
                     map[last].append(value)
         
         ## Return the balloon
-        return Balloon(map['\\'][0], map['/'][0], map['X'][0], map['ww'][0], map['ee'][0], map['nw'], map['nnw'], map['n'],
-                       map['nne'], map['ne'], map['nee'][0], map['e'][0], map['see'][0], map['se'], map['sse'],
-                       map['s'], map['ssw'], map['sw'], map['sww'][0], map['w'][0], map['nww'][0])
+        balloon = Balloon(map['\\'][0], map['/'][0], map['X'][0], map['ww'][0], map['ee'][0], map['nw'], map['nnw'], map['n'],
+                          map['nne'], map['ne'], map['nee'][0], map['e'][0], map['see'][0], map['se'], map['sse'],
+                          map['s'], map['ssw'], map['sw'], map['sww'][0], map['w'][0], map['nww'][0])
+        if mtime is not None:
+            Balloon.__loaded[balloonfile] = (mtime, balloon)
+        return balloon
 
@@ -31,6 +31,8 @@ the colon.
 '''
 from common import *
 
+import re
+
 
 
 class ColourStack():
@@ -38,8 +40,30 @@ class ColourStack():
     ANSI colour stack
     
     This is used to make layers with independent coloursations
+    
+    Text is consumed in tokens: runs of text without escape sequences are passed through
+    as a whole, and only escape sequences and the autopush and autopop strings are looked
+    at. Each layer is stored as its foreground colour, its background colour, and its
+    attributes (SGR parameters 1 to 9) packed into an integer, bit i being set if the
+    attribute i + 1 is used
+    '''
+    
+    __escape = re.compile('\033[^~A-Za-z]*[~A-Za-z]?')
+    '''
+    Escape sequences, including their end, if they are ended
+    '''
+    
+    __end = re.compile('[~A-Za-z]')
+    '''
+    The end of an escape sequence
     '''
     
+    __effects = {}
+    '''
+    Map from escape sequences to their parsed effect on a layer
+    '''
+    
+    
     def __init__(self, autopush, autopop):
         '''
         Constructor
@@ -52,6 +76,7 @@ class ColourStack():
         self.lenpush  = len(autopush)
         self.lenpop   = len(autopop)
         self.bufproto = ' ' * (self.lenpush if self.lenpush > self.lenpop else self.lenpop)
+        self.buf      = self.bufproto[1:]
         self.stack    = []
         self.push()
         self.seq      = None
@@ -63,7 +88,7 @@ class ColourStack():
         
         @return  :str  String that should be inserted into your buffer
         '''
-        self.stack.insert(0, [self.bufproto, None, None, [False] * 9])
+        self.stack.insert(0, [None, None, 0])
         if len(self.stack) == 1:
             return None
         return '\033[0m'
@@ -78,12 +103,12 @@ class ColourStack():
         old = self.stack.pop(0)
         rc = '\033[0;'
         if len(self.stack) == 0: # last resort in case something made it pop too mush
-            push()
-        new = self.stack[0]
-        if new[1] is not None:  rc += new[1] + ';'
-        if new[2] is not None:  rc += new[2] + ';'
+            self.push()
+        (foreground, background, attributes) = self.stack[0]
+        if foreground is not None:  rc += foreground + ';'
+        if background is not None:  rc += background + ';'
         for i in range(0, 9):
-            if new[3][i]:
+            if (attributes >> i) & 1 == 1:
                 rc += str(i + 1) + ';'
         return rc[:-1] + 'm'
     
@@ -96,39 +121,125 @@ class ColourStack():
         @param   :chr  One character in your buffer
         @return  :str  The text to insert after the input character
         '''
+        return self.process(char)[1:]
+    
+    
+    def process(self, text):
+        '''
+        Use this, in sequence, for the text in your buffer that contains your autopush and autopop
+        strings, to automatically get the push and pop strings inserted after the texts' characters
+        
+        @param   text:str  Any number of characters from your buffer
+        @return  :str      The text, with the push and pop strings inserted
+        '''
+        if len(text) == 0:
+            return text
+        
+        ## Find where escape sequences end, and where the autopush and autopop strings end,
+        ## the latter are also found if they begin in previously processed text
+        events = []
+        start = 0
         if self.seq is not None:
-            self.seq += char
-            if (char == '~') or (('a' <= char) and (char <= 'z')) or (('A' <= char) and (char <= 'Z')):
-                if (self.seq[0] == '[') and (self.seq[-1] == 'm'):
-                    self.seq = self.seq[1:-1].split(';')
-                    (i, n) = (0, len(self.seq))
-                    while i < n:
-                        part = self.seq[i]
-                        p = 0 if part == '' else int(part)
-                        i += 1
-                        if p == 0:             self.stack[0][1:] = [None, None, [False] * 9]
-                        elif 1 <= p <= 9:      self.stack[0][3][p - 1] = True
-                        elif 21 <= p <= 29:    self.stack[0][3][p - 21] = False
-                        elif p == 39:          self.stack[0][1] = None
-                        elif p == 49:          self.stack[0][2] = None
-                        elif 30 <= p <= 37:    self.stack[0][1] = part
-                        elif 90 <= p <= 97:    self.stack[0][1] = part
-                        elif 40 <= p <= 47:    self.stack[0][2] = part
-                        elif 100 <= p <= 107:  self.stack[0][2] = part
-                        elif p == 38:
-                            self.stack[0][1] = '%s;%s;%s' % (part, self.seq[i], self.seq[i + 1])
-                            i += 2
-                        elif p == 48:
-                            self.stack[0][2] = '%s;%s;%s' % (part, self.seq[i], self.seq[i + 1])
-                            i += 2
+            end = ColourStack.__end.search(text)
+            start = len(text) if end is None else end.end()
+            self.seq += text[:start]
+            if end is not None:
+                events.append((start, 0, self.seq))
                 self.seq = None
-        elif char == '\033':
-            self.seq = ''
-        buf = self.stack[0][0]
-        buf = buf[1:] + char
-        rc = ''
-        if   buf[-self.lenpush:] == self.autopush:  rc = self.push()
-        elif buf[-self.lenpop:]  == self.autopop:   rc = self.pop()
-        self.stack[0][0] = buf
-        return rc
-
+        for match in ColourStack.__escape.finditer(text, start):
+            sequence = match.group()[1:]
+            if (len(sequence) > 0) and (ColourStack.__end.match(sequence, len(sequence) - 1) is not None):
+                events.append((match.end(), 0, sequence))
+            else:
+                self.seq = sequence
+        buf = self.buf + text
+        for (kind, string) in ((1, self.autopush), (2, self.autopop)):
+            index = buf.find(string)
+            while index >= 0:
+                end = index + len(string) - len(self.buf)
+                if end > 0:
+                    events.append((end, kind, None))
+                index = buf.find(string, index + 1)
+        self.buf = buf[len(buf) - len(self.bufproto) + 1:]
+        if len(events) == 0:
+            return text
+        
+        ## Update the layers, and insert the push and pop strings, in order
+        events.sort(key = lambda event : event[:2])
+        (rc, last, ended) = ([], 0, None)
+        for (end, kind, sequence) in events:
+            if kind == 0:
+                self.__apply(sequence)
+            elif ended != end:
+                ended = end
+                inserted = self.push() if kind == 1 else self.pop()
+                rc.append(text[last : end])
+                rc.append('' if inserted is None else inserted)
+                last = end
+        rc.append(text[last:])
+        return ''.join(rc)
+    
+    
+    def __apply(self, sequence):
+        '''
+        Update the current layer with an escape sequence
+        
+        @param  sequence:str  The escape sequence, without the initial escape character
+        '''
+        if sequence not in ColourStack.__effects:
+            ColourStack.__effects[sequence] = ColourStack.__parse(sequence)
+        effect = ColourStack.__effects[sequence]
+        if effect is None:
+            return
+        (reset, foreground, background, setattributes, clearattributes) = effect
+        layer = self.stack[0]
+        if reset:
+            layer[:] = [None, None, 0]
+        if foreground is not False:
+            layer[0] = foreground
+        if background is not False:
+            layer[1] = background
+        layer[2] = (layer[2] & ~clearattributes) | setattributes
+    
+    
+    @staticmethod
+    def __parse(sequence):
+        '''
+        Parses an escape sequence into its effect on a layer
+        
+        @param   sequence:str                                   The escape sequence, without the initial escape character
+        @return  (reset, foreground, background, set, clear):(bool, str?|False, str?|False, int, int)?
+                                                                Whether the layer is reset, the new foreground and background
+                                                                colours (`False` if unchanged), and the attributes that are set
+                                                                and cleared (in that order), `None` if the sequence is not SGR
+        '''
+        if (sequence[0] != '[') or (sequence[-1] != 'm'):
+            return None
+        sequence = sequence[1:-1].split(';')
+        (reset, foreground, background, setattributes, clearattributes) = (False, False, False, 0, 0)
+        (i, n) = (0, len(sequence))
+        while i < n:
+            part = sequence[i]
+            p = 0 if part == '' else int(part)
+            i += 1
+            if p == 0:
+                (reset, foreground, background, setattributes, clearattributes) = (True, None, None, 0, 0)
+            elif 1 <= p <= 9:
+                setattributes |= 1 << (p - 1)
+                clearattributes &= ~(1 << (p - 1))
+            elif 21 <= p <= 29:
+                setattributes &= ~(1 << (p - 21))
+                clearattributes |= 1 << (p - 21)
+            elif p == 39:          foreground = None
+            elif p == 49:          background = None
+            elif 30 <= p <= 37:    foreground = part
+            elif 90 <= p <= 97:    foreground = part
+            elif 40 <= p <= 47:    background = part
+            elif 100 <= p <= 107:  background = part
+            elif p == 38:
+                foreground = '%s;%s;%s' % (part, sequence[i], sequence[i + 1])
+                i += 2
+            elif p == 48:
+                background = '%s;%s;%s' % (part, sequence[i], sequence[i + 1])
+                i += 2
+        return (reset, foreground, background, setattributes, clearattributes)
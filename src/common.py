@@ -34,7 +34,8 @@ import os
 import shutil
 import sys
 import random
-from subprocess import Popen, PIPE
+import subprocess
+from subprocess import PIPE
 
 
 
@@ -91,18 +92,71 @@ def endswith(text, ending):
     return text.endswith(ending) and not (text == ending)
 
 
+class Popen(subprocess.Popen):
+    '''
+    `subprocess.Popen` that counts how many processes that have been spawned
+    '''
+    
+    spawned = 0
+    '''
+    The number of processes that have been spawned
+    '''
+    
+    def __init__(self, *args, **kwargs):
+        '''
+        Constructor, see `subprocess.Popen`
+        '''
+        Popen.spawned += 1
+        subprocess.Popen.__init__(self, *args, **kwargs)
+
+
+termsize = None
 def gettermsize():
     '''
     Gets the size of the terminal in (rows, columns)
     
+    The size is only looked up once, but `$LINES` and `$COLUMNS` override it
+    
     @return  (rows, columns):(int, int)  The number or lines and the number of columns in the terminal's display area
     '''
-    ## Call `stty` to determine the size of the terminal, this way is better than using python's ncurses
+    global termsize
+    overrides = []
+    for var in ('LINES', 'COLUMNS'):
+        value = os.environ[var] if var in os.environ else ''
+        overrides.append(int(value) if value.isdigit() and (int(value) > 0) else None)
+    if None not in overrides:
+        return tuple(overrides)
+    if termsize is None:
+        termsize = _lookuptermsize()
+    return tuple(termsize[i] if overrides[i] is None else overrides[i] for i in (0, 1))
+
+def _lookuptermsize():
+    '''
+    Looks up the size of the terminal in (rows, columns)
+    
+    @return  (rows, columns):(int, int)  The number or lines and the number of columns in the terminal's display area
+    '''
+    ## Ask the terminal directly, with TIOCGWINSZ
+    for fd in (2, 1, 0):
+        try:
+            (columns, rows) = os.get_terminal_size(fd)
+            if (rows > 0) and (columns > 0):
+                return (rows, columns)
+        except (OSError, ValueError):
+            pass
+    
+    ## Call `stty` to determine the size of the terminal, this way is better than using python's ncurses,
+    ## it can only succeed for channels that are terminals
     for channel in (sys.stderr, sys.stdout, sys.stdin):
+        try:
+            if (channel is None) or not channel.isatty():
+                continue
+        except ValueError:
+            continue
         termsize = Popen(['stty', 'size'], stdout=PIPE, stdin=channel, stderr=PIPE).communicate()[0]
         if len(termsize) > 0:
             termsize = termsize.decode('utf8', 'replace')[:-1].split(' ') # [:-1] removes a \n
             termsize = [int(item) for item in termsize]
-            return termsize
+            return tuple(termsize)
     return (24, 80) # fall back to minimal sane size
 
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+ponysay - Ponysay, cowsay reimplementation for ponies
+
+Copyright (C) 2012-2016  Erkin Batu Altunbaş et al.
+
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+If you intend to redistribute ponysay or a fork of it commercially,
+it contains aggregated images, some of which may not be commercially
+redistribute, you would be required to remove those. To determine
+whether or not you may commercially redistribute an image make use
+that line ‘FREE: yes’, is included inside the image between two ‘$$$’
+lines and the ‘FREE’ is and upper case and directly followed by
+the colon.
+'''
+import os
+import sys
+import socket
+import struct
+import json
+import signal
+
+
+
+class Daemon():
+    '''
+    Server that keeps ponysay loaded between invocations, and its client
+    
+    The client passes its standard input, output and error (and /proc/self/fd/3
+    if open) together with its command line, environment and working directory
+    over a Unix socket. The daemon forks for each request, so the child starts
+    with everything the daemon has already loaded, runs ponysay in the client's
+    stead with the client's file descriptors, and sends back the exit value
+    '''
+    
+    __header = struct.Struct('=i')
+    '''
+    Format of integers sent over the socket
+    '''
+    
+    
+    def __init__(self, program, path = None):
+        '''
+        Constructor
+        
+        @param  program:str  The file that starts ponysay, used to run it in the forked children
+        @param  path:str?    The socket, `None` for the default
+        '''
+        self.program = program
+        self.path = Daemon.getSocket() if path is None else path
+        self.server = None
+    
+    
+    @staticmethod
+    def getSocket():
+        '''
+        Gets the pathname of the socket
+        
+        @return  :str  The socket, `$PONYSAY_DAEMON_SOCKET` if set, otherwise `ponysay.socket` in
+                       `$XDG_RUNTIME_DIR`, or `/tmp/ponysay-$UID/socket` if that variable is not set
+        '''
+        path = os.environ['PONYSAY_DAEMON_SOCKET'] if 'PONYSAY_DAEMON_SOCKET' in os.environ else ''
+        if len(path) > 0:
+            return path
+        rundir = os.environ['XDG_RUNTIME_DIR'] if 'XDG_RUNTIME_DIR' in os.environ else ''
+        if len(rundir) > 0:
+            return rundir + '/ponysay.socket'
+        return '/tmp/ponysay-%i/socket' % os.getuid()
+    
+    
+    @staticmethod
+    def __isTrusted(sock):
+        '''
+        Checks that the other end of a socket is run by the same user
+        
+        @param   sock:socket  The connected socket
+        @return  :bool        Whether the peer is run by the same user
+        '''
+        creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+        (pid, uid, gid) = struct.unpack('3i', creds)
+        return uid == os.getuid()
+    
+    
+    @staticmethod
+    def __recvAll(sock, n):
+        '''
+        Reads an exact number of bytes from a socket
+        
+        @param   sock:socket  The socket
+        @param   n:int        The number of bytes to read
+        @return  :bytes?      The read bytes, `None` if the other end closed the connection too early
+        '''
+        buf = b''
+        while len(buf) < n:
+            chunk = sock.recv(n - len(buf))
+            if len(chunk) == 0:
+                return None
+            buf += chunk
+        return buf
+    
+    
+    @staticmethod
+    def request(argv):
+        '''
+        Lets a running daemon run ponysay in this process's stead
+        
+        @param   argv:list<str>  The command line
+        @return  :int?           The exit value, `None` if there is no usable daemon
+        '''
+        try:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(Daemon.getSocket())
+            if not Daemon.__isTrusted(sock):
+                sock.close()
+                return None
+        except OSError:
+            return None
+        
+        fds = [0, 1, 2]
+        if os.path.exists('/proc/self/fd/3') and not os.path.isdir(os.path.realpath('/proc/self/fd/3')):
+            fds.append(3)
+        message = json.dumps({'argv' : argv, 'env' : dict(os.environ), 'cwd' : os.getcwd(), 'fds' : len(fds)})
+        message = message.encode('utf-8', 'surrogateescape')
+        try:
+            socket.send_fds(sock, [Daemon.__header.pack(len(message))], fds)
+            sock.sendall(message)
+            pid = Daemon.__recvAll(sock, Daemon.__header.size)
+        except OSError:
+            pid = None
+        if pid is None:
+            ## Nothing has been done yet, so ponysay can still be run in this process
+            return None
+        
+        ## Signals that terminate the client terminates the child that does its work
+        pid = Daemon.__header.unpack(pid)[0]
+        def forward(signo, frame):
+            try:
+                os.kill(pid, signo)
+            except OSError:
+                pass
+        for signo in (signal.SIGINT, signal.SIGTERM, signal.SIGHUP, signal.SIGQUIT):
+            signal.signal(signo, forward)
+        
+        rc = Daemon.__recvAll(sock, Daemon.__header.size)
+        sock.close()
+        if rc is None:
+            sys.stderr.write('ponysay: lost connection to the ponysay daemon\n')
+            return 1
+        return Daemon.__header.unpack(rc)[0]
+    
+    
+    def warm(self):
+        '''
+        Loads the ponies and balloon styles, so forked children does not have to
+        '''
+        from ponysay import Ponysay, PonyTemplate, Balloon, ShareIndex
+        ponysay = Ponysay()
+        index = ShareIndex.get()
+        for ponydirs in (ponysay.xponydirs, ponysay.vtponydirs, ponysay.extraxponydirs, ponysay.extravtponydirs):
+            for ponydir in ponydirs:
+                for pony in index.ponies(ponydir):
+                    try:
+                        PonyTemplate.load(ponydir + pony + '.pony')
+                    except:
+                        pass
+        for quotedir in ponysay.quotedirs:
+            index.quotes(quotedir)
+        for balloondir in ponysay.balloondirs:
+            for isthink in (False, True):
+                for (balloon, balloonfile) in index.balloons(balloondir, isthink):
+                    try:
+                        Balloon.fromFile(balloondir + balloonfile, isthink)
+                    except:
+                        pass
+    
+    
+    def serve(self):
+        '''
+        Listens on the socket and serves requests until killed
+        
+        @return  :bool  Whether the socket could be created, `False` if another daemon is running
+        '''
+        sockdir = os.path.dirname(self.path)
+        if (len(sockdir) > 0) and not os.path.isdir(sockdir):
+            os.makedirs(sockdir, 0o700)
+        if os.path.exists(self.path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+                probe.close()
+                return False
+            except OSError:
+                os.unlink(self.path) # left behind by a daemon that is no longer running
+        
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0o177)
+        try:
+            self.server.bind(self.path)
+        finally:
+            os.umask(umask)
+        os.chmod(self.path, 0o600)
+        self.server.listen(16)
+        
+        def terminate(signo, frame):
+            sys.exit(0)
+        signal.signal(signal.SIGTERM, terminate) # remove the socket when killed
+        signal.signal(signal.SIGCHLD, signal.SIG_IGN) # children are reaped automatically
+        try:
+            while True:
+                (conn, addr) = self.server.accept()
+                fds = []
+                try:
+                    if Daemon.__isTrusted(conn):
+                        conn.settimeout(10)
+                        (header, fds, flags, addr) = socket.recv_fds(conn, Daemon.__header.size, 4)
+                        if len(header) == Daemon.__header.size:
+                            message = Daemon.__recvAll(conn, Daemon.__header.unpack(header)[0])
+                            if message is not None:
+                                message = json.loads(message.decode('utf-8', 'surrogateescape'))
+                                if len(fds) == message['fds']:
+                                    conn.settimeout(None)
+                                    if os.fork() == 0:
+                                        self.__child(conn, fds, message)
+                except OSError:
+                    pass
+                except ValueError:
+                    pass
+                for fd in fds:
+                    os.close(fd)
+                conn.close()
+        finally:
+            self.server.close()
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+        return True
+    
+    
+    def __child(self, conn, fds, message):
+        '''
+        Runs ponysay for a client, this method does not return
+        
+        @param  conn:socket      The connection to the client
+        @param  fds:list<int>    The client's standard input, output and error, and /proc/self/fd/3 if open
+        @param  message:dict     The client's command line, environment and working directory
+        '''
+        import runpy
+        import traceback
+        import common
+        from shareindex import ShareIndex
+        
+        rc = 1
+        try:
+            self.server.close()
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            for (target, fd) in enumerate(fds):
+                os.dup2(fd, target)
+            if len(fds) < 4:
+                try:
+                    os.close(3)
+                except OSError:
+                    pass
+            for fd in fds:
+                if fd >= len(fds):
+                    os.close(fd)
+            common.fd3 = None
+            common.termsize = None # the client's terminal
+            common.Popen.spawned = 0
+            ShareIndex.get().revalidate() # the share directories may have been modified since they were indexed
+            if sys.stdin is None:
+                sys.stdin = open(0, 'r', closefd = False)
+            
+            conn.sendall(Daemon.__header.pack(os.getpid()))
+            
+            ## The client's environment, but without the variable that made it the client,
+            ## lest the child be a client itself
+            os.environ.clear()
+            os.environ.update(message['env'])
+            os.environ.pop('PONYSAY_DAEMON', None)
+            os.chdir(message['cwd'])
+            sys.argv[:] = message['argv'] # the same list, it is the default value of ArgParser.parse's parameter
+            
+            try:
+                runpy.run_path(self.program, run_name = '__main__')
+                rc = 0
+            except SystemExit as err:
+                if (err.code is None) or isinstance(err.code, int):
+                    rc = 0 if err.code is None else err.code
+                else:
+                    common.printerr(err.code)
+                    rc = 1
+            except:
+                traceback.print_exc()
+        finally:
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                if common.fd3 is not None:
+                    common.fd3.flush()
+                conn.sendall(Daemon.__header.pack(rc))
+            except:
+                pass
+            os._exit(0)
@@ -31,13 +31,30 @@ the colon.
 '''
 from common import *
 
+import re
+import json
+import time
+import shlex
+import fcntl
+import hashlib
 
 
-KMS_VERSION = '2'
+
+KMS_VERSION = '3'
 '''
 KMS support version constant
 '''
 
+KMS_CACHE_SIZE = 32
+'''
+The default maximum size of the kmspony cache, in mebibytes
+'''
+
+KMS_PALETTE_TTL = 60
+'''
+The default number of seconds the output of the KMS palette command is reused in a terminal session
+'''
+
 
 
 class KMS():
@@ -45,6 +62,22 @@ class KMS():
     KMS support utilisation
     '''
     
+    __sgr = re.compile('\033\\[([0-9;]*)m')
+    '''
+    SGR escape sequences, with their parameters in the first group
+    '''
+    
+    __tables = {}
+    '''
+    Map from palettes to the colours of the 256 xterm colour indices under the palettes
+    '''
+    
+    __commands = {}
+    '''
+    Map from KMS palette commands to their output, in this process
+    '''
+    
+    
     @staticmethod
     def usingKMS(linuxvt):
         '''
@@ -61,20 +94,117 @@ class KMS():
         return KMS.__getKMSPalette() != ''
     
     
+    @staticmethod
+    def __getPaletteCacheFile(env_kms_cmd):
+        '''
+        Gets the file in which the output of the KMS palette command is cached for the terminal session,
+        the file is named after the terminal's device and inode, the session and the command
+        
+        @param   env_kms_cmd:str          The KMS palette command
+        @return  (file, ttl):(str, int)?  The cache file and the number of seconds it is valid,
+                                          `None` if the output shall not be cached
+        '''
+        env_ttl = os.environ['PONYSAY_KMS_PALETTE_TTL'] if 'PONYSAY_KMS_PALETTE_TTL' in os.environ else ''
+        ttl = int(env_ttl) if env_ttl.isdigit() else KMS_PALETTE_TTL
+        if ttl == 0:
+            return None
+        
+        ## The command reads the terminal from stdin, which is the same as stderr
+        tty = None
+        for fd in (2, 0, 1):
+            try:
+                if os.isatty(fd):
+                    tty = os.fstat(fd)
+                    break
+            except:
+                pass
+        if tty is None:
+            return None
+        
+        ## The cache directory is only used if no other user can write to it
+        rundir = os.environ['XDG_RUNTIME_DIR'] if 'XDG_RUNTIME_DIR' in os.environ else ''
+        cachedir = (rundir + '/ponysay' if len(rundir) > 0 else '/tmp/ponysay-%i' % os.getuid()) + '/kmspalettes'
+        try:
+            os.makedirs(cachedir, 0o700, exist_ok = True)
+            for directory in (cachedir, os.path.dirname(cachedir)):
+                attr = os.stat(directory)
+                if (attr.st_uid != os.getuid()) or ((attr.st_mode & 0o022) != 0):
+                    return None
+        except:
+            return None
+        
+        key = '%i:%i:%i:%i\n%s' % (tty.st_dev, tty.st_ino, tty.st_rdev, os.getsid(0), env_kms_cmd)
+        return (cachedir + '/' + hashlib.sha1(key.encode('utf-8', 'surrogateescape')).hexdigest()[:16], ttl)
+    
+    
+    @staticmethod
+    def __readPaletteCache(cachefile, ttl):
+        '''
+        Read the cached output of the KMS palette command
+        
+        @param   cachefile:str  The cache file
+        @param   ttl:int        The number of seconds the cache file is valid
+        @return  :str?          The KMS palette, `None` if not cached or expired
+        '''
+        try:
+            with open(cachefile, 'rb') as file:
+                if time.time() - os.fstat(file.fileno()).st_mtime < ttl:
+                    return file.read().decode('utf8', 'replace')
+        except:
+            pass
+        return None
+    
+    
     @staticmethod
     def __parseKMSCommand():
         '''
-        Parse the KMS palette command stored in the environment variables
+        Parse the KMS palette command stored in the environment variables, the output of the command
+        is reused by all processes in the same terminal session for PONYSAY_KMS_PALETTE_TTL seconds
         
         @return  :str?  The KMS palette, `None` if none
         '''
         env_kms_cmd = os.environ['PONYSAY_KMS_PALETTE_CMD'] if 'PONYSAY_KMS_PALETTE_CMD' in os.environ else None
-        if (env_kms_cmd is not None) and (not env_kms_cmd == ''):
-            env_kms = Popen(shlex.split(env_kms_cmd), stdout=PIPE, stdin=sys.stderr).communicate()[0].decode('utf8', 'replace')
-            if env_kms[-1] == '\n':
-                env_kms = env_kms[:-1]
-                return env_kms
-        return None
+        if (env_kms_cmd is None) or (env_kms_cmd == ''):
+            return None
+        if env_kms_cmd in KMS.__commands:
+            return KMS.__commands[env_kms_cmd]
+        
+        ## Use the cached output, only one process runs the command when it is missing, the others wait for it
+        cache = KMS.__getPaletteCacheFile(env_kms_cmd)
+        (env_kms, lock) = (None, None)
+        if cache is not None:
+            (cachefile, ttl) = cache
+            env_kms = KMS.__readPaletteCache(cachefile, ttl)
+            if env_kms is None:
+                try:
+                    lock = open(cachefile + '.lock', 'ab')
+                    fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+                except:
+                    pass
+                env_kms = KMS.__readPaletteCache(cachefile, ttl)
+        
+        try:
+            if env_kms is None:
+                env_kms = Popen(shlex.split(env_kms_cmd), stdout=PIPE, stdin=sys.stderr).communicate()[0].decode('utf8', 'replace')
+                if env_kms.endswith('\n'):
+                    env_kms = env_kms[:-1]
+                if cache is not None:
+                    temporary = '%s.%i~' % (cachefile, os.getpid())
+                    try:
+                        with open(temporary, 'wb') as file:
+                            file.write(env_kms.encode('utf-8'))
+                        os.replace(temporary, cachefile)
+                    except:
+                        try:
+                            os.remove(temporary)
+                        except:
+                            pass
+        finally:
+            if lock is not None:
+                lock.close()
+        
+        KMS.__commands[env_kms_cmd] = env_kms
+        return env_kms
     
     
     @staticmethod
@@ -97,6 +227,20 @@ class KMS():
         return env_kms
     
     
+    @staticmethod
+    def palettes():
+        '''
+        Get the KMS palettes to pre-generate kmsponies for, every line that the command in
+        PONYSAY_KMS_PALETTE_CMD prints is a palette, if it is not set PONYSAY_KMS_PALETTE is used
+        
+        @return  :list<str>  The KMS palettes
+        '''
+        env_kms = KMS.__parseKMSCommand()
+        if env_kms is None:
+            env_kms = os.environ['PONYSAY_KMS_PALETTE'] if 'PONYSAY_KMS_PALETTE' in os.environ else ''
+        return [palette for palette in env_kms.split('\n') if palette != '']
+    
+    
     @staticmethod
     def __getCacheDirectory(home):
         '''
@@ -111,85 +255,364 @@ class KMS():
             cachedir = home + '/.cache/ponysay'
             shared = False
             if not os.path.isdir(cachedir):
-                os.makedirs(cachedir)
+                os.makedirs(cachedir, exist_ok = True)
         return (cachedir, shared)
     
     
     @staticmethod
-    def __isCacheOld(cachedir):
+    def __getCacheLimit():
         '''
-        Gets whether the cache is old
+        Gets the maximum size of the kmspony cache
         
-        @param   cachedir:str  The cache directory
-        @return                Whether the cache is old
+        @return  :int  The maximum size of the kmspony cache, in bytes
         '''
-        newversion = False
-        if not os.path.isfile(cachedir + '/.version'):
-            newversion = True
-        else:
-            with open(cachedir + '/.version', 'rb') as cachev:
-                if cachev.read().decode('utf8', 'replace').replace('\n', '') != KMS_VERSION:
-                    newversion = True
-        return newversion
+        env_size = os.environ['PONYSAY_KMS_CACHE_SIZE'] if 'PONYSAY_KMS_CACHE_SIZE' in os.environ else ''
+        return (int(env_size) if env_size.isdigit() else KMS_CACHE_SIZE) << 20
+    
+    
+    @staticmethod
+    def __makeDirectory(directory, cachedir, shared):
+        '''
+        Create a directory in the cache directory, if it does not exist, and make it writable for all users if the cache is shared
+        
+        @param  directory:str  The directory
+        @param  cachedir:str   The cache directory
+        @param  shared:bool    Whether shared cache is used
+        '''
+        if os.path.isdir(directory):
+            return
+        os.makedirs(directory, exist_ok = True)
+        while shared and (len(directory) > len(cachedir)):
+            try:
+                os.chmod(directory, 0o7777)
+            except:
+                pass
+            directory = os.path.dirname(directory)
+    
+    
+    @staticmethod
+    def __createKMSPony(pony, kmspony, palette, shared):
+        '''
+        Create KMS pony
+        
+        @param   pony:str      Choosen pony file
+        @param   kmspony:str   The KMS pony file
+        @param   palette:str   The palette
+        @parma   shared:str    Whether shared cache is used
+        @return  :int          The size of the KMS pony file
+        '''
+        with open(pony, 'rb') as file:
+            data = file.read().decode('utf8', 'replace')
+        
+        ## The metadata is kept as it is, only the image is converted
+        start = 0
+        if data.startswith('$$$\n'):
+            start = 8 if data.startswith('$$$\n$$$\n') else data.index('\n$$$\n', 4) + 5
+        data = data[:start] + KMS.__convert(data[start:], palette)
+        data = data.encode('utf-8')
+        
+        ## The kmspony is written to a temporary file first, so that no other process can read it half written
+        temporary = '%s.%i~' % (kmspony, os.getpid())
+        with open(temporary, 'wb') as file:
+            file.write(data)
+        if shared:
+            try:
+                os.chmod(temporary, 0o7777)
+            except:
+                pass
+        os.replace(temporary, kmspony)
+        return len(data)
+    
+    
+    @staticmethod
+    def __isEntry(file):
+        '''
+        Gets whether a file in the kmspony cache is a kmspony
+        
+        @param   file:str  The file name
+        @return  :bool     Whether the file is a kmspony, rather than a lock file, a half written kmspony, or the statistics
+        '''
+        return not (file.endswith('.lock') or file.endswith('~') or (file == '.stats'))
     
     
     @staticmethod
-    def __cleanCache(cachedir):
+    def __evict(kmsponies, keep, total, shared):
         '''
-        Clean the cache directory
+        Remove the least recently used kmsponies until the cache is not larger than allowed, failures are ignored
         
-        @param  cachedir:str  The cache directory
+        @param  kmsponies:str  The kmspony cache directory
+        @param  keep:str       A kmspony that must not be removed
+        @param  total:int?     The size of the kmsponies according to the statistics, `None` if not known
+        @param  shared:bool    Whether shared cache is used
         '''
-        for cached in os.listdir(cachedir):
-            cached = cachedir + '/' + cached
-            if os.path.isdir(cached) and not os.path.islink(cached):
-                shutil.rmtree(cached, False)
-            else:
-                os.remove(cached)
-        with open(cachedir + '/.version', 'w+') as cachev:
-            cachev.write(KMS_VERSION)
+        ## The cache is only looked through when it is, or may be, too large
+        limit = KMS.__getCacheLimit()
+        if (total is not None) and (total <= limit):
+            return
+        
+        (entries, total) = ([], 0)
+        for (directory, _directories, files) in os.walk(kmsponies):
+            for file in files:
+                if KMS.__isEntry(file):
+                    file = os.path.join(directory, file)
+                    try:
+                        attr = os.stat(file)
+                    except:
+                        continue
+                    entries.append((attr.st_mtime_ns, attr.st_size, file))
+                    total += attr.st_size
+        
+        ## The lock file is removed with the kmspony, if another process is waiting for
+        ## it, a second process may create the same kmspony, but both write it whole;
+        ## kmsponies are removed until an eighth of the limit is free, so that the cache
+        ## is not looked through again for every kmspony that is created
+        entries.sort()
+        for (_mtime, size, file) in entries:
+            if total <= limit - (limit >> 3):
+                break
+            if file != keep:
+                for file in (file, file + '.lock'):
+                    try:
+                        os.remove(file)
+                    except:
+                        pass
+                total -= size
+        KMS.__updateStats(kmsponies, shared, {}, {'bytes' : total})
+    
+    
+    @staticmethod
+    def __updateStats(kmsponies, shared, add, replace = None):
+        '''
+        Update the kmspony cache statistics, failures are ignored
+        
+        @param   kmsponies:str               The kmspony cache directory
+        @param   shared:bool                 Whether shared cache is used
+        @param   add:dict<str, int>          Values to add to the statistics, the size of the kmsponies ('bytes')
+                                             is only added to if it is known
+        @param   replace:dict<str, int>?     Values to replace in the statistics
+        @return  :dict<str, int>?            The updated statistics, `None` on failure
+        '''
+        try:
+            with open(kmsponies + '/.stats', 'a+b') as file:
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+                file.seek(0)
+                try:
+                    stats = json.loads(file.read().decode('utf-8'))
+                except:
+                    stats = {}
+                for key in add:
+                    if (key in stats) or (key != 'bytes'):
+                        stats[key] = (stats[key] if key in stats else 0) + add[key]
+                if replace is not None:
+                    stats.update(replace)
+                file.seek(0)
+                file.truncate()
+                file.write(json.dumps(stats).encode('utf-8'))
             if shared:
                 try:
-                    os.chmod(cachedir + '/.version', 0o7777)
+                    os.chmod(kmsponies + '/.stats', 0o7777)
                 except:
                     pass
+            return stats
+        except:
+            return None
     
     
     @staticmethod
-    def __createKMSPony(pony, kmspony, cachedir, palette, shared):
+    def stats(home):
         '''
-        Create KMS pony
+        Gets statistics for the kmspony cache
         
-        @param  pony:str      Choosen pony file
-        @param  kmspony:str   The KMS pony file
-        @param  cachedir:str  The cache directory
-        @param  palette:str   The palette
-        @parma  shared:str    Whether shared cache is used
+        @param   home:str             The home directory
+        @return  :dict<str, int|str>  The cache directory ('directory'), the number of cache hits ('hits') and misses
+                                      ('misses'), the number of kmsponies ('entries') and palettes ('palettes') in the
+                                      cache, the size of the kmsponies ('bytes') and the maximum size ('limit')
         '''
-        ## kmspony directory
-        kmsponydir = kmspony[:kmspony.rindex('/')]
+        kmsponies = KMS.__getCacheDirectory(home)[0] + '/kmsponies'
+        rc = {'directory' : kmsponies, 'hits' : 0, 'misses' : 0, 'entries' : 0, 'palettes' : 0, 'bytes' : 0,
+              'limit' : KMS.__getCacheLimit()}
+        try:
+            with open(kmsponies + '/.stats', 'rb') as file:
+                stats = json.loads(file.read().decode('utf-8'))
+            for key in ('hits', 'misses'):
+                rc[key] = stats[key] if key in stats else 0
+        except:
+            pass
+        if os.path.isdir(kmsponies):
+            rc['palettes'] = len([d for d in os.listdir(kmsponies) if os.path.isdir(kmsponies + '/' + d)])
+        for (directory, _directories, files) in os.walk(kmsponies):
+            for file in files:
+                if KMS.__isEntry(file):
+                    try:
+                        rc['bytes'] += os.path.getsize(os.path.join(directory, file))
+                        rc['entries'] += 1
+                    except:
+                        pass
+        return rc
+    
+    
+    @staticmethod
+    def __getColourTable(palette):
+        '''
+        Get the colours of the 256 xterm colour indices, the first 16 colours are those of the palette
+        
+        @param   palette:str  The palette
+        @return  :list<str>   The colours, in upper case hexadecimal RRGGBB form, of the colour indices
+        '''
+        if palette not in KMS.__tables:
+            table = ['000000', 'CD0000', '00CD00', 'CDCD00', '0000EE', 'CD00CD', '00CDCD', 'E5E5E5',
+                     '7F7F7F', 'FF0000', '00FF00', 'FFFF00', '5C5CFF', 'FF00FF', '00FFFF', 'FFFFFF']
+            levels = (0, 95, 135, 175, 215, 255)
+            table += ['%02X%02X%02X' % (levels[i // 36], levels[i // 6 % 6], levels[i % 6]) for i in range(0, 216)]
+            table += ['%02X%02X%02X' % ((8 + 10 * i,) * 3) for i in range(0, 24)]
+            for (index, colour) in re.findall('\033\\]P([0-9A-Fa-f])([0-9A-Fa-f]{6})', palette):
+                table[int(index, 16)] = colour.upper()
+            KMS.__tables[palette] = table
+        return KMS.__tables[palette]
+    
+    
+    @staticmethod
+    def __convert(image, palette):
+        '''
+        Convert the colours in the image of a pony file to Linux VT colours
         
-        ## Change file names to be shell friendly
-        _kmspony  = '\'' +  kmspony.replace('\'', '\'\\\'\'') + '\''
-        _pony     = '\'' +     pony.replace('\'', '\'\\\'\'') + '\''
-        _cachedir = '\'' + cachedir.replace('\'', '\'\\\'\'') + '\''
+        Under KMS, changing the palette does not change what is already printed, so every colour is
+        printed exactly by setting it to palette entry 0, for the background, or 8, for the foreground
+        (bold black), just before it is used. The palette is restored when the colours are reset and
+        at the end of the image
         
-        ## Create kmspony
-        if not os.path.isdir(kmsponydir):
-            os.makedirs(kmsponydir)
-            if shared:
-                Popen('chmod -R 7777 -- %s/kmsponies' % _cachedir, shell=True).wait()
-        opts = '--balloon n --left - --right - --top - --bottom -'
-        ponytoolcmd = 'ponytool --import ponysay --file %%s %s --export ponysay --file %%s --platform linux %s' % (opts, opts)
-        ponytoolcmd += ' --colourful y --fullcolour y --palette %s'
-        if not os.system(ponytoolcmd % (_pony, _kmspony, palette)) == 0:
-            printerr('Unable to run ponytool successfully, you need util-say>=3 for KMS support')
-            exit(1)
+        @param   image:str    The image, with xterm-256 colours
+        @param   palette:str  The palette
+        @return  :str         The image, with Linux VT colours
+        '''
+        table = KMS.__getColourTable(palette)
+        state = {'fg' : None, 'bg' : None}
+        
+        def convert(match):
+            (fg, bg, other, restore) = (state['fg'], state['bg'], [], '')
+            parameters = match.group(1).split(';')
+            i = 0
+            while i < len(parameters):
+                p = parameters[i]
+                p = 0 if p == '' else int(p)
+                i += 1
+                if p == 0:
+                    ## Only the palette entries that have been changed are restored
+                    restore  = '' if state['bg'] is None else '\033]P0%s' % table[0]
+                    restore += '' if state['fg'] is None else '\033]P8%s' % table[8]
+                    (fg, bg, state['fg'], state['bg']) = (None, None, None, None)
+                    other = ['0']
+                elif (p in (38, 48)) and (i + 1 < len(parameters)) and (parameters[i] == '5'):
+                    colour = table[int(parameters[i + 1]) & 255]
+                    i += 2
+                    if p == 38:  fg = colour
+                    else:        bg = colour
+                elif (p in (38, 48)) and (i + 3 < len(parameters)) and (parameters[i] == '2'):
+                    colour = '%02X%02X%02X' % tuple(int('0' + c) & 255 for c in parameters[i + 1 : i + 4])
+                    i += 4
+                    if p == 38:  fg = colour
+                    else:        bg = colour
+                elif (30 <= p <= 37) or (90 <= p <= 97):
+                    fg = table[p % 10 + (8 if p >= 90 else 0)]
+                elif (40 <= p <= 47) or (100 <= p <= 107):
+                    bg = table[p % 10 + (8 if p >= 100 else 0)]
+                elif p == 39:
+                    fg = None
+                elif p == 49:
+                    bg = None
+                else:
+                    other.append(str(p))
+            rc = restore
+            if len(other) > 0:
+                rc += '\033[%sm' % ';'.join(other)
+            ## Palette entries 0 and 8 only have to be selected when the colours were not already set
+            if bg != state['bg']:
+                if bg is None:  rc += '\033]P0%s\033[49m' % table[0]
+                else:           rc += '\033]P0%s%s' % (bg, '\033[40m' if state['bg'] is None else '')
+            if fg != state['fg']:
+                if fg is None:  rc += '\033]P8%s\033[22;39m' % table[8]
+                else:           rc += '\033]P8%s%s' % (fg, '\033[01;30m' if state['fg'] is None else '')
+            (state['fg'], state['bg']) = (fg, bg)
+            return rc
+        
+        image = KMS.__sgr.sub(convert, image)
+        
+        ## The palette is restored before the last line break, so that it does not add a line
+        if image.endswith('\n'):
+            return image[:-1] + palette + '\n'
+        return image + palette
+    
+    
+    @staticmethod
+    def __getKMSPonyFile(pony, palette, cachedir):
+        '''
+        Gets the file name of the kmspony for a pony, the palette directory is named after the palette and the
+        KMS support version, so kmsponies from other versions are never used, they are evicted
+        
+        @param   pony:str      Choosen pony file
+        @param   palette:str   The palette
+        @param   cachedir:str  The cache directory
+        @return  :str          The KMS pony file
+        '''
+        palettefile = '%s\n%s' % (KMS_VERSION, palette.replace('\033]P', ''))
+        palettefile = hashlib.sha1(palettefile.encode('utf-8', 'surrogateescape')).hexdigest()[:16]
+        return cachedir + '/kmsponies/' + palettefile + os.path.realpath(pony)
+    
+    
+    @staticmethod
+    def __makeKMSPony(pony, kmspony, palette, cachedir, shared):
+        '''
+        Create a kmspony unless it exists, only one process creates it, the others wait for it
+        
+        @param   pony:str      Choosen pony file
+        @param   kmspony:str   The KMS pony file
+        @param   palette:str   The palette
+        @param   cachedir:str  The cache directory
+        @param   shared:bool   Whether shared cache is used
+        @return  :int?         The size of the KMS pony file, `None` if it was created by another process
+        '''
+        KMS.__makeDirectory(os.path.dirname(kmspony), cachedir, shared)
+        (lock, size) = (None, None)
+        try:
+            lock = open(kmspony + '.lock', 'ab')
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+        except:
+            pass ## Without the lock, the kmspony may be created by two processes, but both write it whole
         if shared:
             try:
-                os.chmod(kmspony, 0o7777)
+                os.chmod(kmspony + '.lock', 0o7777)
             except:
                 pass
+        try:
+            if not os.path.isfile(kmspony):
+                size = KMS.__createKMSPony(pony, kmspony, palette, shared)
+        finally:
+            if lock is not None:
+                lock.close()
+        return size
+    
+    
+    @staticmethod
+    def warm(pony, palette, home):
+        '''
+        Create the kmspony for a pony and a palette, unless it is already in the cache, the
+        cache statistics are not counted as a hit or a miss
+        
+        @param   pony:str     Choosen pony file
+        @param   palette:str  The palette
+        @param   home:str     The home directory
+        @return  :int?        The size of the created KMS pony file, `None` if it was already in the cache
+        '''
+        (cachedir, shared) = KMS.__getCacheDirectory(home)
+        kmsponies = cachedir + '/kmsponies'
+        kmspony = KMS.__getKMSPonyFile(pony, palette, cachedir)
+        if os.path.isfile(kmspony):
+            return None
+        size = KMS.__makeKMSPony(pony, kmspony, palette, cachedir, shared)
+        if size is not None:
+            stats = KMS.__updateStats(kmsponies, shared, {'bytes' : size})
+            KMS.__evict(kmsponies, kmspony, None if (stats is None) or ('bytes' not in stats) else stats['bytes'], shared)
+        return size
     
     
     @staticmethod
@@ -213,24 +636,31 @@ class KMS():
         if env_kms == '':
             return pony
         
-        ## Store palette string and a clone with just the essentials
+        ## Store palette string
         palette = env_kms
-        palettefile = env_kms.replace('\033]P', '')
         
         ## Get and if necessary make cache directory
         (cachedir, shared) = KMS.__getCacheDirectory(home)
         
-        ## KMS support version control, clean everything if not matching
-        if KMS.__isCacheOld(cachedir):
-            KMS.__cleanCache(cachedir)
-        
         ## Get kmspony directory and kmspony file
-        kmsponies = cachedir + '/kmsponies/' + palettefile
-        kmspony = kmsponies + '/' + pony
+        kmsponies = cachedir + '/kmsponies'
+        kmspony = KMS.__getKMSPonyFile(pony, palette, cachedir)
+        
+        ## If the kmspony exists, mark it as recently used
+        if os.path.isfile(kmspony):
+            try:
+                os.utime(kmspony)
+            except:
+                pass
+            KMS.__updateStats(kmsponies, shared, {'hits' : 1})
+            return kmspony
         
         ## If the kmspony is missing, create it
-        if not os.path.isfile(kmspony):
-            KMS.__createKMSPony(pony, kmspony, cachedir, palette, shared)
+        size = KMS.__makeKMSPony(pony, kmspony, palette, cachedir, shared)
+        if size is None:
+            KMS.__updateStats(kmsponies, shared, {'hits' : 1})
+        else:
+            stats = KMS.__updateStats(kmsponies, shared, {'misses' : 1, 'bytes' : size})
+            KMS.__evict(kmsponies, kmspony, None if (stats is None) or ('bytes' not in stats) else stats['bytes'], shared)
         
         return kmspony
-
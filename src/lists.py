@@ -34,7 +34,8 @@ File listing functions.
 '''
 
 
-from ucs import *
+from width import *
+from shareindex import *
 import itertools
 
 
@@ -73,7 +74,7 @@ def _print_columnised(items):
     columns = _columnise_list(
         sorted(items, key = lambda x: x[0]),
         term_width,
-        lambda x: UCS.dispLen(x[0]))
+        lambda x: Width.len(x[0]))
     
     for row in itertools.zip_longest(*columns):
         def iter_parts():
@@ -101,7 +102,7 @@ def _get_file_list(dir_path : str, extension : str):
     :param extension: The allowed file name extension.
     """
     
-    return [i[:-len(extension)] for i in os.listdir(dir_path) if endswith(i, extension)]
+    return [i[:-len(extension)] for i in ShareIndex.get().files(dir_path) if endswith(i, extension)]
 
 
 def simplelist(ponydirs, quoters = [], ucsiser = None):
@@ -158,7 +159,7 @@ def linklist(ponydirs = None, quoters = [], ucsiser = None):
             if pony in pseudolinkmap:
                 pairs.append((pony, pseudolinkmap[pony] + '.pony'));
             else:
-                pairs.append((pony, os.path.realpath(ponydir + pony + '.pony') if os.path.islink(ponydir + pony + '.pony') else None))
+                pairs.append((pony, ShareIndex.get().link(ponydir, pony + '.pony')))
         
         ## Create map from source pony to alias ponies for each pony
         ponymap = {}
@@ -178,7 +179,7 @@ def linklist(ponydirs = None, quoters = [], ucsiser = None):
         ## Create list of source ponies concatenated with alias ponies in brackets
         ponies = {}
         for pony in ponymap:
-            w = UCS.dispLen(pony)
+            w = Width.len(pony)
             item = '\033[1m' + pony + '\033[21m' if (pony in quoters) else pony
             syms = ponymap[pony]
             syms.sort()
@@ -187,7 +188,7 @@ def linklist(ponydirs = None, quoters = [], ucsiser = None):
                 item += ' ('
                 first = True
                 for sym in syms:
-                    w += UCS.dispLen(sym)
+                    w += Width.len(sym)
                     if first:  first = False
                     else:      item += ' '
                     item += '\033[1m' + sym + '\033[21m' if (sym in quoters) else sym
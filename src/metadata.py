@@ -30,6 +30,35 @@ lines and the ‘FREE’ is and upper case and directly followed by
 the colon.
 '''
 from common import *
+from shareindex import *
+
+import re
+import mmap
+import array
+import struct
+import bisect
+
+
+
+DIMENSIONS_MAGIC = b'PONYDIMS'
+'''
+The first bytes of binary pony dimension files
+'''
+
+DIMENSIONS_VERSION = 1
+'''
+Binary pony dimension file format version constant
+'''
+
+METADATA_MAGIC = b'PONYMETA'
+'''
+The first bytes of pony metadata collection files
+'''
+
+METADATA_VERSION = 2
+'''
+Pony metadata collection file format version constant
+'''
 
 
 
@@ -38,59 +67,163 @@ class Metadata():
     Metadata functions
     '''
     
+    __dimensionIndices = {}
+    '''
+    Map from binary pony dimension files to their modification time, size and
+    parsed content, so they are only read once per process
+    '''
+    
+    __metadataStores = {}
+    '''
+    Map from pony metadata collection files to their modification time, size
+    and `MetadataStore`, so they are only read once per process
+    '''
+    
+    
     @staticmethod
     def makeRestrictionLogic(restriction):
         '''
         Make restriction test logic function
         
+        The restriction is compiled to a normalised disjunction of conjunctions: repeated tests
+        and clauses are removed, as are clauses that can never be satisfied and clauses that are
+        implied by a shorter clause. When evaluated against a `MetadataStore`, the tests in each
+        clause are evaluated in order of selectivity, and the result is memoised in the store
+        by the normalised restriction.
+        
+        Beside `KEY=VALUE` a test can compare the numerical values of a key, `KEY<N`, `KEY<=N`,
+        `KEY>N`, `KEY>=N` and `KEY=LOW..HIGH` (inclusive, either bound may be omitted); these
+        are answered with binary searches in the store's sorted numerical indices.
+        
         @param   restriction:list<string>  Metadata based restrictions
-        @return  :dict<str, str>→bool      Test function
+        @return  :dict<str, str>→bool      Test function, with the methods `select(MetadataStore)→int`, that
+                                           returns the set of ponies that pass, and `explain(MetadataStore)→list<str>`
         '''
         def get_test(cell):
             strict = cell[0][-1] != '?'
             key = cell[0]
             if not strict:
                 key = key[:-1]
-            invert = cell[1][0] == '!'
-            value = cell[1][1 if invert else 0:]
+            (operator, value) = cell[1:]
             
+            class RTest():
+                def __init__(self, cellkey, low, high, strict):
+                    (self.cellkey, self.low, self.high, self.strict) = (cellkey, low, high, strict)
+                    self.signature = (self.cellkey, self.bounds(), 'r' if strict else 'ri')
+                def bounds(self):
+                    if (self.low is not None) and (self.high is not None):
+                        return '=%s..%s' % (self.low[2], self.high[2])
+                    if self.low is None:
+                        return ('<=' if self.high[1] else '<') + self.high[2]
+                    return ('>=' if self.low[1] else '>') + self.low[2]
+                def __call__(self, has):
+                    if self.cellkey not in has:
+                        return not self.strict
+                    numbers = [number for number in map(Metadata.parseNumber, has[self.cellkey]) if number is not None]
+                    for (bound, sign) in ((self.low, 1), (self.high, -1)):
+                        if bound is None:
+                            continue
+                        if bound[0] is None:
+                            return False
+                        if not any(((number - bound[0]) * sign > 0) or (bound[1] and (number == bound[0])) for number in numbers):
+                            return False
+                    return len(numbers) > 0
+                def select(self, store):
+                    bits = store.has(self.cellkey)
+                    for (bound, find) in ((self.low, store.above), (self.high, store.below)):
+                        if bound is not None:
+                            bits &= 0 if bound[0] is None else find(self.cellkey, bound[0], bound[1])
+                    return bits if self.strict else (bits | (store.all & ~store.has(self.cellkey)))
+                def __str__(self):
+                    return '%s%s%s' % (self.cellkey, '' if self.strict else '?', self.bounds())
             class SITest():
                 def __init__(self, cellkey, cellvalue):
                     (self.cellkey, self.cellvalue) = (cellkey, cellvalue)
+                    self.signature = (self.cellkey, self.cellvalue, 'si')
                 def __call__(self, has):
                     return False if self.cellkey not in has else (self.cellvalue not in has[self.cellkey])
+                def select(self, store):
+                    return store.has(self.cellkey) & ~store.bits(self.cellkey, self.cellvalue)
                 def __str__(self):
-                    return 'si(%s : %s)' % (self.cellkey, self.callvalue)
+                    return '%s=!%s' % (self.cellkey, self.cellvalue)
             class STest():
                 def __init__(self, cellkey, cellvalue):
                     (self.cellkey, self.cellvalue) = (cellkey, cellvalue)
+                    self.signature = (self.cellkey, self.cellvalue, 's')
                 def __call__(self, has):
                     return False if self.cellkey not in has else (self.cellvalue in has[self.cellkey])
+                def select(self, store):
+                    return store.bits(self.cellkey, self.cellvalue)
                 def __str__(self):
-                    return 's(%s : %s)' % (self.cellkey, self.callvalue)
+                    return '%s=%s' % (self.cellkey, self.cellvalue)
             class ITest():
                 def __init__(self, cellkey, cellvalue):
                     (self.cellkey, self.cellvalue) = (cellkey, cellvalue)
+                    self.signature = (self.cellkey, self.cellvalue, 'i')
                 def __call__(self, has):
                     return True if self.cellkey not in has else (self.cellvalue not in has[self.cellkey])
+                def select(self, store):
+                    return store.all & ~store.bits(self.cellkey, self.cellvalue)
                 def __str__(self):
-                    return 'i(%s : %s)' % (self.cellkey, self.callvalue)
+                    return '%s?=!%s' % (self.cellkey, self.cellvalue)
             class NTest():
                 def __init__(self, cellkey, cellvalue):
                     (self.cellkey, self.cellvalue) = (cellkey, cellvalue)
+                    self.signature = (self.cellkey, self.cellvalue, 'n')
                 def __call__(self, has):
                     return True if self.cellkey not in has else (self.cellvalue in has[self.cellkey])
+                def select(self, store):
+                    return (store.all & ~store.has(self.cellkey)) | store.bits(self.cellkey, self.cellvalue)
                 def __str__(self):
-                    return 'n(%s : %s)' % (self.cellkey, self.callvalue)
+                    return '%s?=%s' % (self.cellkey, self.cellvalue)
+            
+            def bound(text, inclusive):
+                return None if len(text) == 0 else (Metadata.parseNumber(text), inclusive, text)
+            if operator != '=':
+                limit = (Metadata.parseNumber(value), operator[-1] == '=', value)
+                if operator[0] == '>':  return RTest(key, limit, None, strict)
+                else:                   return RTest(key, None, limit, strict)
+            if value.count('..') == 1:
+                (low, high) = value.split('..')
+                (low, high) = (bound(low, True), bound(high, True))
+                if (low is not None or high is not None) and all(limit[0] is not None for limit in (low, high) if limit is not None):
+                    return RTest(key, low, high, strict)
             
+            invert = value[:1] == '!'
+            value = value[1 if invert else 0:]
             if strict and invert:  return SITest(key, value)
             if strict:             return STest(key, value)
             if invert:             return ITest(key, value)
             return NTest(key, value)
         
+        ## Pairs of tests, of the same key and value, that cannot both pass
+        contradictions = (('s', 'si'), ('s', 'i'), ('n', 'si'))
+        
+        def normalise(table):
+            clauses = {}
+            for alternative in table:
+                cells = {}
+                for cell in alternative:
+                    cells[cell.signature] = cell
+                if any(((key, value, a) in cells) and ((key, value, b) in cells)
+                       for (key, value, kind) in cells for (a, b) in contradictions):
+                    continue
+                clauses[tuple(sorted(cells))] = [cells[signature] for signature in sorted(cells)]
+            ## (A ∧ B) ∨ A = A
+            signatures = sorted(clauses, key = len)
+            kept = []
+            for signature in signatures:
+                if not any(set(other).issubset(signature) for other in kept):
+                    kept.append(signature)
+            return [clauses[signature] for signature in sorted(kept)]
+        
+        def count(bitset):
+            return bin(bitset).count('1')
+        
         class Logic():
             def __init__(self, table):
-                self.table = table
+                self.table = normalise(table)
+                self.normalised = ' | '.join('+'.join(str(cell) for cell in alternative) for alternative in self.table)
             def __call__(self, cells):
                 for alternative in self.table:
                     ok = True
@@ -101,8 +234,47 @@ class Metadata():
                     if ok:
                         return True
                 return False
+            def __plan(self, store):
+                selected = {}
+                for alternative in self.table:
+                    for cell in alternative:
+                        if cell.signature not in selected:
+                            selected[cell.signature] = cell.select(store)
+                plan = [sorted(alternative, key = lambda cell : count(selected[cell.signature])) for alternative in self.table]
+                return (plan, selected)
+            def select(self, store):
+                if self.normalised in store.memo:
+                    return store.memo[self.normalised]
+                (plan, selected) = self.__plan(store)
+                passed = 0
+                for alternative in plan:
+                    bits = store.all
+                    for cell in alternative:
+                        bits &= selected[cell.signature]
+                        if bits == 0:
+                            break
+                    passed |= bits
+                    if passed == store.all:
+                        break
+                store.memo[self.normalised] = passed
+                return passed
+            def explain(self, store):
+                (plan, selected) = self.__plan(store)
+                rc = ['restriction: %s' % self.normalised]
+                for (index, alternative) in enumerate(plan):
+                    rc.append('clause %i:' % (index + 1))
+                    bits = store.all
+                    for cell in alternative:
+                        bits &= selected[cell.signature]
+                        rc.append('    %-30s %5i ponies, %5i candidates left' % (cell, count(selected[cell.signature]), count(bits)))
+                rc.append('result: %i of %i ponies' % (count(self.select(store)), store.count))
+                return rc
+        
+        def split_cell(cell):
+            (key, operator, value) = re.match('^([^<>=]*)(<=|>=|<|>|=)(.*)$', cell).groups()
+            return (key.upper(), operator, value)
         
-        table = [[get_test((cell[:cell.index('=')].upper(), cell[cell.index('=') + 1:]))
+        table = [[get_test(split_cell(cell))
                   for cell in clause.replace('_', '').replace(' ', '').split('+')]
                   for clause in restriction
                 ]
@@ -110,6 +282,21 @@ class Metadata():
         return Logic(table)
     
     
+    @staticmethod
+    def parseNumber(value):
+        '''
+        Parses the numerical value of a metadata value
+        
+        @param   value:str        The value
+        @return  :int|float?      The value as a number, `None` if it is not a decimal number
+        '''
+        if re.match('^[+-]?[0-9]+$', value) is not None:
+            return int(value)
+        if re.match('^[+-]?([0-9]+\\.[0-9]*|\\.[0-9]+)$', value) is not None:
+            return float(value)
+        return None
+    
+    
     @staticmethod
     def restrictedPonies(ponydir, logic):
         '''
@@ -119,17 +306,11 @@ class Metadata():
         @param   logic:(str)→bool  Restriction test functor
         @return  :list<str>        Passed ponies
         '''
-        import pickle
-        passed = []
-        if os.path.exists(ponydir + 'metadata'):
-            data = None
-            with open(ponydir + 'metadata', 'rb') as file:
-                data = pickle.load(file)
-            for ponydata in data:
-                (pony, meta) = ponydata
-                if logic(meta):
-                    passed.append(pony)
-        return passed
+        if 'metadata' in ShareIndex.get().files(ponydir):
+            store = Metadata.loadMetadataStore(ponydir + 'metadata')
+            if store is not None:
+                return store.names(logic.select(store))
+        return []
     
     
     @staticmethod
@@ -180,4 +361,472 @@ class Metadata():
         passed = data[jump : stop].decode('utf8', 'replace').split('/')
         for pony in passed:
             fitting.add(pony)
+    
+    
+    @staticmethod
+    def explainRestriction(ponydir, logic):
+        '''
+        Describe how a restriction is evaluated for a pony directory
+        
+        @param   ponydir:str                              Pony directory, must end with `os.sep`
+        @param   logic:(dict<str, str>)→bool&explain(…)   Restriction test functor from `makeRestrictionLogic`
+        @return  :list<str>                               Lines describing the query plan, with the number of
+                                                          ponies that pass each test, and how many that remain
+        '''
+        store = None
+        if 'metadata' in ShareIndex.get().files(ponydir):
+            store = Metadata.loadMetadataStore(ponydir + 'metadata')
+        if store is None:
+            return ['no usable metadata collection, no pony passes']
+        return logic.explain(store)
+    
+    
+    @staticmethod
+    def __mapWords(file, magic, version):
+        '''
+        Maps a binary file consisting of little endian 32-bit words into the memory
+        
+        @param   file:str                      The file
+        @param   magic:bytes                   The expected first eight bytes of the file
+        @param   version:int                   The expected format version, the third word
+        @return  (data, words):(buffer, seq<int>?)  The mapped file, and its words, `None` if the file
+                                                    does not have the expected magic bytes and version
+        '''
+        with open(file, 'rb') as stream:
+            data = mmap.mmap(stream.fileno(), 0, access = mmap.ACCESS_READ)
+        if (len(data) < 12) or (len(data) % 4 != 0) or (data[:8] != magic):
+            return (data, None)
+        if struct.unpack_from('<I', data, 8)[0] != version:
+            return (data, None)
+        if sys.byteorder == 'little':
+            words = memoryview(data).cast('I')
+        else:
+            words = array.array('I', data)
+            words.byteswap()
+        return (data, words)
+    
+    
+    @staticmethod
+    def makeMetadataStore(everything):
+        '''
+        Creates the content of a pony metadata collection file
+        
+        The file, that is designed to be memory mapped, consists of little endian 32-bit words:
+        the magic bytes (two words), the format version, the number of ponies, the number of
+        keys, the number of values, the number of strings, the size of the string table, the
+        number of keys with numerical values and the number of distinct numerical values,
+        followed by the offsets of the strings in the string table (one more than the number of
+        strings), the string table with all strings encoded in UTF-8 (padded to a multiple of
+        four bytes), each pony's name as an index in the string table, for each key (sorted by
+        its UTF-8 encoding) its name, the index of its first value and the number of values,
+        for each value (grouped by key and sorted by their UTF-8 encoding) its name, and for
+        each key with numerical values (sorted by its UTF-8 encoding) its name, the index of
+        its first numerical value and the number of distinct numerical values. That is followed,
+        aligned to eight bytes, by the distinct numerical values (grouped by key and sorted in
+        ascending order) as little endian IEEE 754 doubles, and last a bitset of the ponies
+        that have each key, one for each value, one for each numerical value with the ponies
+        that have that value or a lower value for the key, and one for each numerical value
+        with the ponies that have that value or a higher value for the key. A bitset has one
+        bit per pony, bit i (counting from the least significant bit of the first word) being
+        set if the i:th pony is in the set.
+        
+        @param   everything:itr<(str, dict<str, itr<str>>)>  The name of each pony, and its metadata as
+                                                             a map from keys to the key's values
+        @return  :bytes                                      The content of the file
+        '''
+        everything = list(everything)
+        (strings, ids) = ([], {})
+        def intern(string):
+            if string not in ids:
+                ids[string] = len(strings)
+                strings.append(string)
+            return ids[string]
+        ponies = [intern(pony) for (pony, meta) in everything]
+        (haskey, hasvalue) = ({}, {})
+        for (index, (pony, meta)) in enumerate(everything):
+            for key in meta:
+                haskey[key] = haskey.get(key, 0) | (1 << index)
+                for value in meta[key]:
+                    hasvalue[(key, value)] = hasvalue.get((key, value), 0) | (1 << index)
+        encode = lambda string : string.encode('utf-8')
+        keys = sorted(haskey, key = encode)
+        values = dict((key, []) for key in keys)
+        hasnumber = {}
+        for (key, value) in hasvalue:
+            values[key].append(value)
+            number = Metadata.parseNumber(value)
+            if number is not None:
+                hasnumber[(key, number)] = hasnumber.get((key, number), 0) | hasvalue[(key, value)]
+        numbers = dict((key, []) for key in keys)
+        for (key, number) in hasnumber:
+            numbers[key].append(number)
+        (keytable, valuetable, bitsets) = ([], [], [haskey[key] for key in keys])
+        (numkeytable, numbertable, below, above) = ([], [], [], [])
+        for key in keys:
+            values[key].sort(key = encode)
+            keytable += [intern(key), len(valuetable), len(values[key])]
+            valuetable += [intern(value) for value in values[key]]
+            bitsets += [hasvalue[(key, value)] for value in values[key]]
+            if len(numbers[key]) > 0:
+                numbers[key].sort()
+                numkeytable += [intern(key), len(numbertable), len(numbers[key])]
+                numbertable += numbers[key]
+                cumulative = [hasnumber[(key, number)] for number in numbers[key]]
+                for i in range(1, len(cumulative)):
+                    cumulative[i] |= cumulative[i - 1]
+                below += cumulative
+                cumulative = [hasnumber[(key, number)] for number in numbers[key]]
+                for i in reversed(range(0, len(cumulative) - 1)):
+                    cumulative[i] |= cumulative[i + 1]
+                above += cumulative
+        bitsets += below + above
+        (blob, offsets) = (b'', [0])
+        for string in strings:
+            blob += encode(string)
+            offsets.append(len(blob))
+        blob += bytes(-len(blob) & 3)
+        wordcount = (len(everything) + 31) // 32
+        words = array.array('I', offsets)
+        tables = array.array('I', ponies + keytable + valuetable + numkeytable)
+        doubles = array.array('d', numbertable)
+        if sys.byteorder != 'little':
+            words.byteswap()
+            tables.byteswap()
+            doubles.byteswap()
+        header = struct.pack('<8sIIIIIIII', METADATA_MAGIC, METADATA_VERSION, len(everything), len(keys),
+                             len(valuetable), len(strings), len(blob), len(numkeytable) // 3, len(numbertable))
+        padding = bytes(-(len(header) + 4 * len(words) + len(blob) + 4 * len(tables)) & 7)
+        bitsets = b''.join(bitset.to_bytes(4 * wordcount, 'little') for bitset in bitsets)
+        return header + words.tobytes() + blob + tables.tobytes() + padding + doubles.tobytes() + bitsets
+    
+    
+    @staticmethod
+    def loadMetadataStore(file):
+        '''
+        Loads a pony metadata collection file
+        
+        @param   file:str         The file
+        @return  :MetadataStore?  The metadata, `None` if the file is invalid, which it is if it uses an older format
+        '''
+        try:
+            attr = os.stat(file)
+            key = (attr.st_mtime_ns, attr.st_size)
+        except:
+            return None
+        if file in Metadata.__metadataStores:
+            (loadedkey, store) = Metadata.__metadataStores[file]
+            if loadedkey == key:
+                return store
+        try:
+            (data, words) = Metadata.__mapWords(file, METADATA_MAGIC, METADATA_VERSION)
+            store = None if words is None else MetadataStore(data, words)
+        except:
+            store = None
+        Metadata.__metadataStores[file] = (key, store)
+        return store
+    
+    
+    @staticmethod
+    def makeDimensionIndex(dimensions):
+        '''
+        Creates the content of a binary pony dimension file
+        
+        The file, that is designed to be memory mapped, consists of little endian 32-bit words:
+        the magic bytes (two words), the format version, the number of ponies, the size of the
+        name table, the offsets of the names in the name table (one more than the number of
+        ponies), and the name table with the ponies' names sorted and encoded in UTF-8 (padded
+        to a multiple of four bytes). That is followed by a section for the widths, one for the
+        heights and one for the heights without a balloon, each with the number of distinct
+        values, the values in ascending order, for each value the number of ponies that are
+        not larger, and the indices of the ponies in the name table, sorted by the value.
+        
+        @param   dimensions:itr<(int, int, int, str)>  The width, height, height without a balloon and name of each pony
+        @return  :bytes                                The content of the file
+        '''
+        dimensions = list(dimensions)
+        names = sorted(set(item[3] for item in dimensions))
+        ids = dict((name, i) for (i, name) in enumerate(names))
+        (blob, offsets) = (b'', [0])
+        for name in names:
+            blob += name.encode('utf-8')
+            offsets.append(len(blob))
+        blob += bytes(-len(blob) & 3)
+        words = array.array('I', offsets)
+        for column in range(0, 3):
+            items = sorted((item[column], item[3]) for item in dimensions)
+            (values, ends) = ([], [])
+            for (index, (value, name)) in enumerate(items):
+                if (len(values) == 0) or (values[-1] != value):
+                    values.append(value)
+                    ends.append(index)
+                ends[-1] += 1
+            section = array.array('I', [len(values)] + values + ends + [ids[item[1]] for item in items])
+            words.extend(section)
+        (tables, sections) = (words[:len(offsets)], words[len(offsets):])
+        if sys.byteorder != 'little':
+            tables.byteswap()
+            sections.byteswap()
+        header = struct.pack('<8sIII', DIMENSIONS_MAGIC, DIMENSIONS_VERSION, len(names), len(blob))
+        return header + tables.tobytes() + blob + sections.tobytes()
+    
+    
+    @staticmethod
+    def __loadDimensionIndex(file):
+        '''
+        Loads a binary pony dimension file
+        
+        @param   file:str                                                      The file
+        @return  (names, offsets, sections):(buffer, seq<int>, list<(seq<int>, seq<int>, seq<int>)>)?
+                                                                               The name table, the offsets in it, and the values,
+                                                                               the number of ponies not larger than them and the
+                                                                               ponies' indices for widths, heights and heights
+                                                                               without a balloon; `None` if the file is invalid
+        '''
+        try:
+            attr = os.stat(file)
+            key = (attr.st_mtime_ns, attr.st_size)
+        except:
+            return None
+        if file in Metadata.__dimensionIndices:
+            (loadedkey, index) = Metadata.__dimensionIndices[file]
+            if loadedkey == key:
+                return index
+        index = None
+        try:
+            (data, words) = Metadata.__mapWords(file, DIMENSIONS_MAGIC, DIMENSIONS_VERSION)
+            if words is not None:
+                (count, bloblen) = (words[3], words[4])
+                ptr = 5
+                offsets = words[ptr : ptr + count + 1]
+                ptr += count + 1
+                names = memoryview(data)[4 * ptr : 4 * ptr + bloblen]
+                ptr += (bloblen + 3) // 4
+                sections = []
+                for column in range(0, 3):
+                    n = words[ptr]
+                    ptr += 1
+                    sections.append((words[ptr : ptr + n], words[ptr + n : ptr + 2 * n], words[ptr + 2 * n : ptr + 2 * n + count]))
+                    ptr += 2 * n + count
+                if ptr == len(words):
+                    index = (names, offsets, sections)
+        except:
+            index = None
+        Metadata.__dimensionIndices[file] = (key, index)
+        return index
+    
+    
+    @staticmethod
+    def getFittingPonies(file, width, height, ponyonly):
+        '''
+        Get ponies that fit the terminal, using a binary pony dimension file
+        
+        @param   file:str        The binary pony dimension file
+        @param   width:int       The maximum allowed width
+        @param   height:int      The maximum allowed height
+        @param   ponyonly:bool   Whether the heights without a balloon shall be used
+        @return  :set<str>?      The ponies that fit, `None` if the file is invalid
+        '''
+        index = Metadata.__loadDimensionIndex(file)
+        if index is None:
+            return None
+        (names, offsets, sections) = index
+        fitting = None
+        for (column, requirement) in ((0, width), (2 if ponyonly else 1, height)):
+            (values, ends, ids) = sections[column]
+            passed = bisect.bisect_right(values, requirement)
+            passed = ids[: ends[passed - 1] if passed > 0 else 0]
+            fitting = set(passed) if fitting is None else fitting.intersection(passed)
+        return set(bytes(names[offsets[i] : offsets[i + 1]]).decode('utf-8', 'replace') for i in fitting)
+
 
+
+class MetadataStore():
+    '''
+    Memory mapped pony metadata collection, with an inverted index from keys and values
+    to the set of ponies that have them; sets of ponies are represented as integers with
+    one bit per pony
+    '''
+    
+    def __init__(self, data, words):
+        '''
+        Constructor, use `Metadata.loadMetadataStore` to load a file
+        
+        @param  data:buffer      The content of the file
+        @param  words:seq<int>   The content of the file as 32-bit words
+        '''
+        (self.count, keycount, valuecount, stringcount, bloblen) = (words[3], words[4], words[5], words[6], words[7])
+        (numkeycount, numbercount) = (words[8], words[9])
+        ptr = 10
+        self.__offsets = words[ptr : ptr + stringcount + 1]
+        ptr += stringcount + 1
+        self.__blob = memoryview(data)[4 * ptr : 4 * ptr + bloblen]
+        ptr += (bloblen + 3) // 4
+        self.__ponies = words[ptr : ptr + self.count]
+        ptr += self.count
+        self.__keys = words[ptr : ptr + 3 * keycount]
+        ptr += 3 * keycount
+        self.__values = words[ptr : ptr + valuecount]
+        ptr += valuecount
+        self.__numkeys = words[ptr : ptr + 3 * numkeycount]
+        ptr += 3 * numkeycount
+        ptr += ptr & 1
+        if sys.byteorder == 'little':
+            self.__numbers = memoryview(data)[4 * ptr : 4 * ptr + 8 * numbercount].cast('d')
+        else:
+            self.__numbers = array.array('d', data[4 * ptr : 4 * ptr + 8 * numbercount])
+            self.__numbers.byteswap()
+        ptr += 2 * numbercount
+        self.__bitsetsize = 4 * ((self.count + 31) // 32)
+        self.__bitsets = memoryview(data)[4 * ptr:]
+        (self.__below, self.__above) = (keycount + valuecount, keycount + valuecount + numbercount)
+        if len(self.__bitsets) != (keycount + valuecount + 2 * numbercount) * self.__bitsetsize:
+            raise Exception('Corrupt metadata collection file')
+        self.all = (1 << self.count) - 1
+        '''
+        The set of all ponies
+        '''
+        self.memo = {}
+        '''
+        Map from normalised restrictions to the set of ponies that pass them
+        '''
+    
+    
+    def __string(self, index):
+        '''
+        Gets a string from the string table
+        
+        @param   index:int  The index of the string
+        @return  :bytes     The string, encoded in UTF-8
+        '''
+        return bytes(self.__blob[self.__offsets[index] : self.__offsets[index + 1]])
+    
+    
+    def __bitset(self, index):
+        '''
+        Gets a set of ponies
+        
+        @param   index:int  The index of the bitset
+        @return  :int       The set of ponies
+        '''
+        start = index * self.__bitsetsize
+        return int.from_bytes(self.__bitsets[start : start + self.__bitsetsize], 'little')
+    
+    
+    def __find(self, string, start, count, stride, table):
+        '''
+        Binary search for a string in a sorted table
+        
+        @param   string:bytes    The string, encoded in UTF-8
+        @param   start:int       The index of the first entry to search
+        @param   count:int       The number of entries to search
+        @param   stride:int      The number of words per entry, the first word is the index of the string
+        @param   table:seq<int>  The table
+        @return  :int?           The index of the entry, `None` if not found
+        '''
+        (low, high) = (start, start + count)
+        while low < high:
+            mid = (low + high) // 2
+            found = self.__string(table[mid * stride])
+            if found < string:
+                low = mid + 1
+            elif found > string:
+                high = mid
+            else:
+                return mid
+        return None
+    
+    
+    def __key(self, key):
+        '''
+        Finds a key
+        
+        @param   key:str  The key
+        @return  :int?    The index of the key, `None` if no pony has the key
+        '''
+        return self.__find(key.encode('utf-8'), 0, len(self.__keys) // 3, 3, self.__keys)
+    
+    
+    def has(self, key):
+        '''
+        Gets the ponies that have a key
+        
+        @param   key:str  The key
+        @return  :int     The set of ponies
+        '''
+        index = self.__key(key)
+        return 0 if index is None else self.__bitset(index)
+    
+    
+    def bits(self, key, value):
+        '''
+        Gets the ponies that have a value for a key
+        
+        @param   key:str    The key
+        @param   value:str  The value
+        @return  :int       The set of ponies
+        '''
+        index = self.__key(key)
+        if index is None:
+            return 0
+        (start, count) = (self.__keys[3 * index + 1], self.__keys[3 * index + 2])
+        index = self.__find(value.encode('utf-8'), start, count, 1, self.__values)
+        return 0 if index is None else self.__bitset(len(self.__keys) // 3 + index)
+    
+    
+    def __numerical(self, key):
+        '''
+        Finds the numerical values of a key
+        
+        @param   key:str            The key
+        @return  (start, count):(int, int)  The index of the key's first numerical value and
+                                            the number of numerical values, both zero if none
+        '''
+        index = self.__find(key.encode('utf-8'), 0, len(self.__numkeys) // 3, 3, self.__numkeys)
+        return (0, 0) if index is None else (self.__numkeys[3 * index + 1], self.__numkeys[3 * index + 2])
+    
+    
+    def below(self, key, bound, inclusive):
+        '''
+        Gets the ponies that have a numerical value for a key that is lower than a bound
+        
+        @param   key:str              The key
+        @param   bound:int|float      The bound
+        @param   inclusive:bool       Whether ponies with a value equal to the bound are included
+        @return  :int                 The set of ponies
+        '''
+        (start, count) = self.__numerical(key)
+        search = bisect.bisect_right if inclusive else bisect.bisect_left
+        index = search(self.__numbers, bound, start, start + count)
+        return 0 if index == start else self.__bitset(self.__below + index - 1)
+    
+    
+    def above(self, key, bound, inclusive):
+        '''
+        Gets the ponies that have a numerical value for a key that is higher than a bound
+        
+        @param   key:str              The key
+        @param   bound:int|float      The bound
+        @param   inclusive:bool       Whether ponies with a value equal to the bound are included
+        @return  :int                 The set of ponies
+        '''
+        (start, count) = self.__numerical(key)
+        search = bisect.bisect_left if inclusive else bisect.bisect_right
+        index = search(self.__numbers, bound, start, start + count)
+        return 0 if index == start + count else self.__bitset(self.__above + index)
+    
+    
+    def names(self, bitset):
+        '''
+        Gets the names of a set of ponies
+        
+        @param   bitset:int  The set of ponies
+        @return  :list<str>  The names of the ponies, in the order they were stored
+        '''
+        rc = []
+        index = 0
+        while bitset != 0:
+            if (bitset & 1) == 1:
+                rc.append(self.__string(self.__ponies[index]).decode('utf-8', 'replace'))
+            bitset >>= 1
+            index += 1
+        return rc
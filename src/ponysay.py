@@ -36,7 +36,10 @@ from spellocorrecter import *
 from ucs import *
 from kms import *
 import lists
+import json
+import threading
 from metadata import *
+from shareindex import *
 
 
 
@@ -162,9 +165,21 @@ class Ponysay():
         @param   directory:str  The directory base name
         @return  :list<str>     Absolute directory names
         '''
+        return cls.getShareDirectories(directory)
+    
+    
+    @classmethod
+    def getShareDirectories(cls, directory, sharedirs = None):
+        '''
+        Gets existing unique /share directories
+        
+        @param   directory:str         The directory base name
+        @param   sharedirs:list<str>?  The /share directories, ending with a slash, `None` for those ponysay uses
+        @return  :list<str>            Absolute directory names
+        '''
         appendset = set()
         rc = []
-        _ponydirs = cls.__share(directory)
+        _ponydirs = cls.__share(directory) if sharedirs is None else [sharedir + directory for sharedir in sharedirs]
         for ponydir in _ponydirs:
             if (ponydir is not None) and os.path.isdir(ponydir) and (ponydir not in appendset):
                 rc.append(ponydir)
@@ -217,6 +232,19 @@ class Ponysay():
             args.help()
             exit(254)
             return
+        
+        if args.opts['--batch'] is not None:
+            self.batch(args)
+        else:
+            self.__dispatch(args)
+    
+    
+    def __dispatch(self, args):
+        '''
+        Runs the part of the program the arguments indicate
+        
+        @param  args:ArgParser  Parsed command line arguments
+        '''
         self.args = args;
         
         ## Emulate termial capabilities
@@ -254,10 +282,135 @@ class Ponysay():
         elif self.__test_nfdnf('+L'):                                     self.__extraponies(); self.linklist()
         elif self.__test_nfdnf('+l'):                                     self.__extraponies(); self.list()
         elif self.__test_nfdnf('-B'):                                     self.balloonlist()
+        elif self.__test_nfdnf('--explain'):                              self.explain()
         else:
             self.__run()
     
     
+    def batch(self, args):
+        '''
+        Prints one pony for each record on stdin
+        
+        A record is either a message, that is printed with the options from the
+        command line, or a JSON object with the optional members `message`,
+        `args` (a list of additional command line arguments), `pony`, `balloon`
+        and `wrap` (short for `-f`, `-b` and `-W`). Records that start with a
+        brace but are not JSON objects are messages. Options in a record replace
+        the same options from the command line. Each printed pony is followed
+        by the record delimiter.
+        
+        @param  args:ArgParser  Parsed command line arguments
+        '''
+        delimiter = self.__getBatchDelimiter(args)
+        program = sys.argv[0]
+        cmdline = dict(args.opts)
+        for opt in ('--batch', '--batch-delimiter'):
+            cmdline[opt] = None
+        
+        ## Things that are modified by running, and must be restored for the next record
+        (linuxvt, usekms) = (self.linuxvt, self.usekms)
+        dirs = (self.xponydirs, self.vtponydirs, self.extraxponydirs, self.extravtponydirs, self.quotedirs)
+        saveddirs = [list(d) for d in dirs]
+        
+        rc = 0
+        index = 0
+        for record in self.__readRecords(delimiter):
+            index += 1
+            try:
+                (argv, message) = ([], None)
+                obj = None
+                if record.lstrip().startswith('{'):
+                    ## Records that are not JSON objects are messages, even if they start with a brace
+                    try:
+                        obj = json.loads(record)
+                    except ValueError:
+                        pass
+                if isinstance(obj, dict):
+                    for (key, opt) in (('pony', '-f'), ('balloon', '-b'), ('wrap', '-W')):
+                        if key in obj:
+                            argv += [opt, str(obj[key])]
+                    if 'args' in obj:
+                        argv += [str(arg) for arg in obj['args']]
+                    if 'message' in obj:
+                        message = str(obj['message'])
+                else:
+                    message = record.rstrip()
+                
+                self.unrecognised = not args.parse([program] + argv)
+                for opt in cmdline:
+                    if (args.opts[opt] is None) and (cmdline[opt] is not None):
+                        args.opts[opt] = list(cmdline[opt])
+                if message is not None:
+                    args.message = message
+                elif args.message is None:
+                    args.message = '' # stdin is used for the records
+                
+                (self.linuxvt, self.usekms, self.mode) = (linuxvt, usekms, '')
+                for (d, saved) in zip(dirs, saveddirs):
+                    d[:] = saved
+                self.__dispatch(args)
+            except SystemExit as err:
+                if (err.code is not None) and (err.code != 0):
+                    rc = err.code if isinstance(err.code, int) else 1
+            except Exception as err:
+                printerr('%s: record %i: %s' % (program, index, str(err)))
+                rc = 1
+            sys.stdout.buffer.write(delimiter.encode('utf-8'))
+            sys.stdout.buffer.flush()
+        if rc != 0:
+            exit(rc)
+    
+    
+    def __getBatchDelimiter(self, args):
+        '''
+        Gets the delimiter between records in batch mode
+        
+        @param   args:ArgParser  Parsed command line arguments
+        @return  :str            The delimiter, `\\0`, `\\n`, `\\t` and `\\\\` in the argument are unescaped
+        '''
+        if args.opts['--batch-delimiter'] is None:
+            return '\n'
+        delimiter = args.opts['--batch-delimiter'][-1]
+        (buf, esc) = ('', False)
+        for c in delimiter:
+            if esc:
+                buf += {'0' : '\0', 'n' : '\n', 't' : '\t'}[c] if c in '0nt' else c
+                esc = False
+            elif c == '\\':
+                esc = True
+            else:
+                buf += c
+        if len(buf) == 0:
+            buf = '\0'
+        return buf
+    
+    
+    def __readRecords(self, delimiter):
+        '''
+        Reads records from stdin, empty records are skipped
+        
+        @param   delimiter:str  The delimiter between records
+        @return  :itr<str>      The records
+        '''
+        delimiter = delimiter.encode('utf-8')
+        buf = b''
+        ## `exit` closes stdin, so a record that fails must not end the batch
+        with os.fdopen(os.dup(sys.stdin.fileno()), 'rb', buffering = 0) as stdin:
+            while True:
+                chunk = stdin.read(1 << 16)
+                if len(chunk) == 0:
+                    break
+                buf += chunk
+                if (delimiter in chunk) or (len(delimiter) > 1):
+                    records = buf.split(delimiter)
+                    buf = records[-1]
+                    for record in records[:-1]:
+                        if len(record) > 0:
+                            yield record.decode('utf-8', 'replace')
+        if len(buf) > 0:
+            yield buf.decode('utf-8', 'replace')
+    
+    
     def __test_nfdnf(self, *keys):
         '''
         Test arguments written in negation-free disjunctive normal form
@@ -346,7 +499,7 @@ class Ponysay():
         keys = ['-f', '+f', '-F', '-q'] ## TODO +q -Q
         if test(keys, False):
             for ponydir in self.ponydirs:
-                if os.path.isfile(ponydir + 'best.pony') or os.path.islink(ponydir + 'best.pony'):
+                if 'best.pony' in ShareIndex.get().files(ponydir):
                     pony = os.path.realpath(ponydir + 'best.pony') # Canonical path
                     if test(keys, True):
                         args.opts['-f'] = [pony]
@@ -476,10 +629,10 @@ class Ponysay():
             possibilities = [f.split(os.sep)[-1][:-5] for f in pony[1]]
             if pony[0] not in possibilities:
                 if not alt:
-                    autocorrect = SpelloCorrecter(possibilities)
-                    (alternatives, dist) = autocorrect.correct(pony[0])
                     limit = os.environ['PONYSAY_TYPO_LIMIT'] if 'PONYSAY_TYPO_LIMIT' in os.environ else ''
                     limit = 5 if len(limit) == 0 else int(limit)
+                    autocorrect = SpelloCorrecter(possibilities)
+                    (alternatives, dist) = autocorrect.correct(pony[0], limit)
                     if (len(alternatives) > 0) and (dist <= limit):
                         (_, files, quote) = pony
                         return self.__getPony([(a, files, quote) for a in alternatives], True)
@@ -552,11 +705,9 @@ class Ponysay():
         @param  quoters:set<str>?          Ponies to limit to, or `None` to include all ponies
         '''
         for ponydir in directories:
-            for ponyfile in os.listdir(ponydir):
-                if endswith(ponyfile, '.pony'):
-                    pony = ponyfile[:-5]
-                    if (pony not in collection) and ((quoters is None) or (pony in quoters)):
-                        collection[pony] = ponydir + ponyfile
+            for pony in ShareIndex.get().ponies(ponydir):
+                if (pony not in collection) and ((quoters is None) or (pony in quoters)):
+                    collection[pony] = ponydir + pony + '.pony'
     
     
     def __applyRestriction(self, oldponies, ponydirs):
@@ -609,14 +760,19 @@ class Ponysay():
         (termh, termw) = gettermsize()
         for ponydir in ponydirs:
             (fitw, fith) = (None, None)
-            if os.path.exists(ponydir + 'widths'):
-                fitw = set()
-                with open(ponydir + 'widths', 'rb') as file:
-                    Metadata.getFitting(fitw, termw, file)
-            if os.path.exists(ponydir + ('onlyheights' if self.ponyonly else 'heights')):
-                fith = set()
-                with open(ponydir + ('onlyheights' if self.ponyonly else 'heights'), 'rb') as file:
-                    Metadata.getFitting(fith, termh, file)
+            files = ShareIndex.get().files(ponydir)
+            ## Prefer the binary dimension file, that covers both the width and the height
+            if 'dimensions.bin' in files:
+                fitw = Metadata.getFittingPonies(ponydir + 'dimensions.bin', termw, termh, self.ponyonly)
+            if fitw is None:
+                if 'widths' in files:
+                    fitw = set()
+                    with open(ponydir + 'widths', 'rb') as file:
+                        Metadata.getFitting(fitw, termw, file)
+                if ('onlyheights' if self.ponyonly else 'heights') in files:
+                    fith = set()
+                    with open(ponydir + ('onlyheights' if self.ponyonly else 'heights'), 'rb') as file:
+                        Metadata.getFitting(fith, termh, file)
             for ponyfile in oldponies.values():
                 if ponyfile.startswith(ponydir):
                     pony = ponyfile[len(ponydir) : -5]
@@ -636,8 +792,9 @@ class Ponysay():
         quote = []
         if (os.path.dirname(file) + os.sep).replace(os.sep + os.sep, os.sep) in self.ponydirs:
             realpony = pony
-            if os.path.islink(file):
-                realpony = os.path.basename(os.path.realpath(file))
+            target = ShareIndex.get().link(os.path.dirname(file) + os.sep, os.path.basename(file))
+            if target is not None:
+                realpony = os.path.basename(target)
                 if os.extsep in realpony:
                     realpony = realpony[:realpony.rfind(os.extsep)]
             quote = self.__quotes(ponies = [realpony])
@@ -662,28 +819,14 @@ class Ponysay():
         if ponydirs  is None:  ponydirs  = self.ponydirs
         if quotedirs is None:  quotedirs = self.quotedirs
         
-        ## List all unique quote files
-        quotes = []
-        quoteshash = set()
-        _quotes = []
-        for quotedir in quotedirs:
-            _quotes += [item[:item.index('.')] for item in os.listdir(quotedir)]
-        for quote in _quotes:
-            if not quote == '':
-                if not quote in quoteshash:
-                    quoteshash.add(quote)
-                    quotes.append(quote)
-        
         ## Create a set of all ponies that have quotes
         ponies = set()
         for ponydir in ponydirs:
-            for pony in os.listdir(ponydir):
+            for pony in ShareIndex.get().files(ponydir):
                 if not pony[0] == '.':
                     p = pony[:-5] # remove .pony
-                    for quote in quotes:
-                        if ('+' + p + '+') in ('+' + quote + '+'):
-                            if not p in ponies:
-                                ponies.add(p)
+                    if (p not in ponies) and (len(self.__quoteFiles(p, quotedirs)) > 0):
+                        ponies.add(p)
         
         return ponies
     
@@ -700,31 +843,36 @@ class Ponysay():
         if ponydirs  is None:  ponydirs  = self.ponydirs
         if quotedirs is None:  quotedirs = self.quotedirs
         
-        ## Get all ponyquote files
-        quotes = []
-        for quotedir in quotedirs:
-            quotes += [quotedir + item for item in os.listdir(quotedir)]
-        
         ## Create list of all pony–quote file-pairs
-        rc = []
         if ponies is None:
-            for ponydir in ponydirs:
-                for pony in os.listdir(ponydir):
-                    if endswith(pony, '.pony'):
-                        p = pony[:-5] # remove .pony
-                        for quote in quotes:
-                            q = quote[quote.rindex('/') + 1:]
-                            q = q[:q.rindex('.')]
-                            if ('+' + p + '+') in ('+' + q + '+'):
-                                rc.append((p, quote))
-        else:
-            for p in ponies:
-                for quote in quotes:
-                    q = quote[quote.rindex('/') + 1:]
-                    q = q[:q.rindex('.')]
-                    if ('+' + p + '+') in ('+' + q + '+'):
-                        rc.append((p, quote))
+            ponies = [p for ponydir in ponydirs for p in ShareIndex.get().ponies(ponydir)]
+        rc = []
+        for p in ponies:
+            rc += [(p, quote) for quote in self.__quoteFiles(p, quotedirs)]
+        
+        return rc
+    
+    
+    def __quoteFiles(self, pony, quotedirs):
+        '''
+        Returns all quote files for a pony
         
+        @param   pony:str             The pony
+        @param   quotedirs:itr<str>   The quote directories to use
+        @return  :list<str>           The pony's quote files
+        '''
+        rc = []
+        for quotedir in quotedirs:
+            if '+' not in pony:
+                quoted = ShareIndex.get().quoted(quotedir)
+                if pony in quoted:
+                    rc += quoted[pony]
+            else:
+                ## The pony's name is not one part of the quote files' names, so compare the names
+                quotes = ShareIndex.get().quotes(quotedir)
+                for q in quotes:
+                    if ('+' + pony + '+') in ('+' + q + '+'):
+                        rc += quotes[q]
         return rc
     
     
@@ -805,6 +953,24 @@ class Ponysay():
         lists.balloonlist(self.balloondirs, self.isthink)
     
     
+    def explain(self):
+        '''
+        Prints how the metadata restrictions are evaluated for each pony directory
+        '''
+        standard = self.usingstandard or not self.usingextra
+        ponydirs = (self.ponydirs if standard else []) + (self.extraponydirs if self.usingextra else [])
+        restriction = self.args.opts['-r']
+        logic = Metadata.makeRestrictionLogic(restriction) if restriction is not None else None
+        for ponydir in ponydirs:
+            print(ponydir)
+            if logic is None:
+                ## Without a restriction, every pony is used, with or without metadata
+                print('    no restriction, all %i ponies pass' % len(ShareIndex.get().ponies(ponydir)))
+                continue
+            for line in Metadata.explainRestriction(ponydir, logic):
+                print('    ' + line)
+    
+    
     def __getBalloonPath(self, names, alt = False):
         '''
         Returns one file with full path, names is filter for style names, also accepts filepaths
@@ -820,16 +986,8 @@ class Ponysay():
         ## Get all balloons
         balloons = {}
         for balloondir in self.balloondirs:
-            for balloon in os.listdir(balloondir):
-                balloonfile = balloon
-                ## Use .think if running ponythink, otherwise .say
-                if self.isthink and endswith(balloon, '.think'):
-                    balloon = balloon[:-6]
-                elif (not self.isthink) and endswith(balloon, '.say'):
-                    balloon = balloon[:-4]
-                else:
-                    continue
-                
+            ## Use .think if running ponythink, otherwise .say
+            for (balloon, balloonfile) in ShareIndex.get().balloons(balloondir, self.isthink):
                 ## Add the balloon if there is none with the same name
                 if balloon not in balloons:
                     balloons[balloon] = balloondir + balloonfile
@@ -843,10 +1001,10 @@ class Ponysay():
         balloon = names[random.randrange(0, len(names))]
         if balloon not in balloons:
             if not alt:
-                autocorrect = SpelloCorrecter(self.balloondirs, '.think' if self.isthink else '.say')
-                (alternatives, dist) = autocorrect.correct(balloon)
                 limit = os.environ['PONYSAY_TYPO_LIMIT'] if 'PONYSAY_TYPO_LIMIT' in os.environ else ''
                 limit = 5 if len(limit) == 0 else int(limit)
+                autocorrect = SpelloCorrecter(self.balloondirs, '.think' if self.isthink else '.say')
+                (alternatives, dist) = autocorrect.correct(balloon, limit)
                 if (len(alternatives) > 0) and (dist <= limit):
                     return self.__getBalloonPath(alternatives, True)
             printerr('That balloon style %s does not exist' % balloon)
@@ -884,13 +1042,47 @@ class Ponysay():
         
         @param  args:ArgParser  Parsed command line arguments
         '''
+        lines = self.__renderLines(args)
+        
+        ## If in Linux VT clean the terminal (See info/pdf-manual [Printing in TTY with KMS])
+        if self.linuxvt:
+            print('\033[H\033[2J', end='')
+        
+        ## Print the output as it is rendered
+        self.__printOutput(lines)
+    
+    
+    def renderPony(self, args):
+        '''
+        Render the pony with a speech or though bubble. message, pony and wrap from args are used.
+        
+        @param   args:ArgParser  Parsed command line arguments
+        @return  :str            The output truncated on the width and on the height
+        '''
+        output = '\n'.join(self.__renderLines(args))
+        if output.endswith('\n'):
+            output = output[:-1]
+        return output
+    
+    
+    def __renderLines(self, args):
+        '''
+        Prepare the rendering of the pony with a speech or though bubble, the pony is rendered as its lines are read
+        
+        @param   args:ArgParser  Parsed command line arguments
+        @return  :itr<str>       The lines of the output truncated on the width and on the height, the last line is
+                                 empty if the output ends with a line break
+        '''
         ## Get the pony
         selection = []
         self.__getSelectedPonies(args, selection)
         (pony, quote) = self.__getPony(selection, args)
         
+        ## Get height truncation, so that no more of the message is read than can be shown
+        (height, bottom) = self.__getHeightTruncation()
+        
         ## Get message and manipulate it
-        msg = self.__getMessage(args, quote)
+        msg = self.__getMessage(args, quote, height is not None)
         msg = self.__colouriseMessage(args, msg)
         msg = self.__compressMessage(args, msg)
         
@@ -903,10 +1095,6 @@ class Ponysay():
         ## If KMS is utilies, select a KMS pony file and create it if necessary
         pony = KMS.kms(pony, self.HOME, self.linuxvt)
         
-        ## If in Linux VT clean the terminal (See info/pdf-manual [Printing in TTY with KMS])
-        if self.linuxvt:
-            print('\033[H\033[2J', end='')
-        
         ## Get width truncation and wrapping
         widthtruncation = self.__getWidthTruncation()
         messagewrap = self.__getMessageWrap(args)
@@ -927,17 +1115,16 @@ class Ponysay():
         minusinfo = args.opts['-i'] is not None
         plusinfo  = args.opts['+i'] is not None
         
+        ## Determine whether to minimise the escape sequences
+        env_minimise = os.environ['PONYSAY_MINIMISE_SGR'] if 'PONYSAY_MINIMISE_SGR' in os.environ else None
+        minimise = env_minimise in ('yes', 'y', '1')
+        
         ## Run cowsay replacement
         backend = Backend(message = msg, ponyfile = pony, wrapcolumn = messagewrap, width = widthtruncation, balloon = balloon,
                           hyphen = hyphen, linkcolour = linkcolour, ballooncolour = ballooncolour, mode = self.mode,
-                          infolevel = 2 if plusinfo else (1 if minusinfo else 0))
-        backend.parse()
-        output = backend.output
-        if output.endswith('\n'):
-            output = output[:-1]
-        
-        ## Print the output, truncated on the height
-        self.__printOutput(output)
+                          infolevel = 2 if plusinfo else (1 if minusinfo else 0), minimise = minimise,
+                          height = height, bottom = bottom)
+        return backend.generate()
     
     
     def __getSelectedPonies(self, args, selection):
@@ -949,13 +1136,9 @@ class Ponysay():
         '''
         (standard, extra) = ([], [])
         for ponydir in self.ponydirs:
-            for pony in os.listdir(ponydir):
-                if endswith(pony, '.pony'):
-                    standard.append(ponydir + pony)
+            standard += [ponydir + pony + '.pony' for pony in ShareIndex.get().ponies(ponydir)]
         for ponydir in self.extraponydirs:
-            for pony in os.listdir(ponydir):
-                if endswith(pony, '.pony'):
-                    extra.append(ponydir + pony)
+            extra += [ponydir + pony + '.pony' for pony in ShareIndex.get().ponies(ponydir)]
         both = standard + extra
         for (opt, ponies, quotes) in [('-f', standard, False), ('+f', extra, False), ('-F', both, False), ('-q', standard, True)]: ## TODO +q -Q
             if args.opts[opt] is not None:
@@ -963,31 +1146,56 @@ class Ponysay():
                     selection.append((pony, ponies, quotes))
     
     
-    def __getMessage(self, args, quote):
+    def __getMessage(self, args, quote, lazy = False):
         '''
         Get message and remove tailing whitespace from stdin (but not for each line)
         
         @param   args:ArgParser  Command line options
         @param   quote:str?      The quote, or `None` if none
-        @return  :str            The message
+        @param   lazy:bool       Whether stdin should be read line by line, as the lines are needed
+        @return  :str|itr<str>   The message, or its lines if read lazily from stdin
         '''
         if quote is not None:
             return quote
         if args.message is None:
+            if lazy:
+                return self.__readMessage()
             return ''.join(sys.stdin.readlines()).rstrip()
         return args.message
     
     
+    def __readMessage(self):
+        '''
+        Read the message from stdin line by line, the tailing whitespace is removed, but not for each line
+        
+        @return  :itr<str>  The lines of the message, without line breaks
+        '''
+        ## Whitespace lines are held back until it is known that they are not tailing
+        (held, content) = ([], False)
+        for line in sys.stdin:
+            if line.endswith('\n'):
+                line = line[:-1]
+            if not ((len(line) == 0) or line.isspace()):
+                yield from held
+                (held, content) = ([], True)
+            held.append(line)
+        yield held[0].rstrip() if content else ''
+    
+    
     def __colouriseMessage(self, args, msg):
         '''
         Colourise message if option is set
         
-        @param   args:ArgParser  Command line options
-        @param   msg:str         The message
-        @return  :str            The message colourised
+        @param   args:ArgParser    Command line options
+        @param   msg:str|itr<str>  The message, or its lines
+        @return  :str|itr<str>     The message colourised
         '''
         if args.opts['--colour-msg'] is not None:
-            msg = '\033[' + ';'.join(args.opts['--colour-msg']) + 'm' + msg
+            colour = '\033[' + ';'.join(args.opts['--colour-msg']) + 'm'
+            if isinstance(msg, str):
+                msg = colour + msg
+            else:
+                msg = ((colour + line if i == 0 else line) for (i, line) in enumerate(msg))
         return msg
     
     
@@ -995,12 +1203,14 @@ class Ponysay():
         '''
         This algorithm should give some result as cowsay's, if option is set
         
-        @param   args:ArgParser  Command line options
-        @param   msg:str         The message
-        @return  :str            The message compressed
+        @param   args:ArgParser    Command line options
+        @param   msg:str|itr<str>  The message, or its lines
+        @return  :str|itr<str>     The message compressed, the lines are joined if compressed
         '''
         if args.opts['-c'] is None:
             return msg
+        if not isinstance(msg, str):
+            msg = '\n'.join(msg)
         buf = ''
         last = ' '
         CHARS = '\t \n'
@@ -1049,6 +1259,28 @@ class Ponysay():
         return gettermsize()[1] if env_width not in ('yes', 'y', '1') else None
     
     
+    def __getHeightTruncation(self):
+        '''
+        Gets the height trunction setting
+        
+        @return  (lines, bottom):(int?, bool)  The number of lines to print, or `None` to print all lines,
+                                               and whether the last lines rather than the first are printed
+        '''
+        env_bottom = os.environ['PONYSAY_BOTTOM'] if 'PONYSAY_BOTTOM' in os.environ else None
+        if env_bottom is None:  env_bottom = ''
+        
+        env_height = os.environ['PONYSAY_TRUNCATE_HEIGHT'] if 'PONYSAY_TRUNCATE_HEIGHT' in os.environ else None
+        if env_height is None:  env_height = ''
+        
+        env_lines = os.environ['PONYSAY_SHELL_LINES'] if 'PONYSAY_SHELL_LINES' in os.environ else None
+        if (env_lines is None) or (env_lines == ''):  env_lines = '2'
+        
+        if not (self.linuxvt or (env_height in ('yes', 'y', '1'))):
+            return (None, False)
+        lines = max(gettermsize()[0] - int(env_lines), 0)
+        return (lines, env_bottom in ('yes', 'y', '1'))
+    
+    
     def __getMessageWrap(self, args):
         '''
         Gets the message balloon wrapping column
@@ -1110,31 +1342,100 @@ class Ponysay():
         return ballooncolour
     
     
-    def __printOutput(self, output):
+    def __printOutput(self, lines):
         '''
-        Print the output, but truncate it on the height
+        Print the output, each line as soon as it has been rendered
         
-        @param  output:str  The output truncated on the width but not on the height
+        @param  lines:itr<str>  The lines of the output, the last line is empty if the output ends with a line break
         '''
-        ## Load height trunction settings
-        env_bottom = os.environ['PONYSAY_BOTTOM'] if 'PONYSAY_BOTTOM' in os.environ else None
-        if env_bottom is None:  env_bottom = ''
-        
-        env_height = os.environ['PONYSAY_TRUNCATE_HEIGHT'] if 'PONYSAY_TRUNCATE_HEIGHT' in os.environ else None
-        if env_height is None:  env_height = ''
-        
-        env_lines = os.environ['PONYSAY_SHELL_LINES'] if 'PONYSAY_SHELL_LINES' in os.environ else None
-        if (env_lines is None) or (env_lines == ''):  env_lines = '2'
-        
-        ## Print the output, truncated on height if so set
-        lines = gettermsize()[0] - int(env_lines)
-        if self.linuxvt or (env_height in ('yes', 'y', '1')):
-            if env_bottom in ('yes', 'y', '1'):
-                for line in output.split('\n')[: -lines]:
-                    print(line)
-            else:
-                for line in output.split('\n')[: lines]:
-                    print(line)
-        else:
-            print(output)
+        ## A line break is only printed after the last line if it is not empty
+        last = None
+        try:
+            for line in lines:
+                print(line if last is None else '\n' + line, end='')
+                sys.stdout.buffer.flush()
+                last = line
+            if (last is not None) and (len(last) > 0):
+                print()
+        except BrokenPipeError:
+            ## The reader has stopped reading, e.g. `head`, stdout is redirected to /dev/null
+            ## so that Python does not fail again when it flushes stdout at exit
+            devnull = os.open(os.devnull, os.O_WRONLY)
+            os.dup2(devnull, sys.stdout.fileno())
+            os.close(devnull)
+            exit(0)
+    
+    
 
+
+
+_renderlock = threading.Lock()
+'''
+Lock for the share directory index when rendering in multiple threads
+'''
+
+def render(message = '', pony = None, balloon = None, wrap = 65, width = None, think = False, ponyonly = False, info = 0,
+           tty = False, hyphen = '\033[31m-', linkcolour = '', ballooncolour = '', wraplimit = 8, wrapexceed = 5, sharedirs = None,
+           minimise = False):
+    '''
+    Renders a pony with a speech or thought balloon
+    
+    Unlike `Ponysay.run`, this does not use the command line, the environment or the terminal,
+    and it may be called repeatedly and from multiple threads
+    
+    @param   message:str           The message spoken by the pony
+    @param   pony:str?             The name or file of the pony, a random pony if `None`
+    @param   balloon:str?          The name or file of the balloon style, the default style if `None`
+    @param   wrap:int?             The column at where to wrap the message, `None` for no wrapping
+    @param   width:int?            The column at where to truncate the output, `None` for no truncation
+    @param   think:bool            Whether to render as ponythink rather than ponysay
+    @param   ponyonly:bool         Whether to render the pony without the balloon and the message
+    @param   info:int              2 to use the pony's metadata as the message, 1 to render it instead of the pony, 0 otherwise
+    @param   tty:bool              Whether to use the ponies for Linux VT
+    @param   hyphen:str            How hyphens added by the wordwrapper should be printed
+    @param   linkcolour:str        How to colour the link character, empty string if none
+    @param   ballooncolour:str     How to colour the balloon, empty string if none
+    @param   wraplimit:int         The width under which words are not broken
+    @param   wrapexceed:int        How far words may exceed the wrapping column
+    @param   sharedirs:list<str>?  The directories with the ponies/, extraponies/ and balloons/
+                                   directories, ending with a slash, `None` for those ponysay uses
+    @param   minimise:bool         Whether to rewrite the colour escape sequences to as few bytes as possible
+    @return  :str                  The rendered pony, without a trailing line break
+    '''
+    with _renderlock:
+        index = ShareIndex.get()
+        
+        ## Get the pony file, a name is looked up in the standard ponies before the extra ponies
+        if (pony is None) or not os.path.isfile(pony):
+            (standard, extra) = ('ttyponies/', 'extrattyponies/') if tty else ('ponies/', 'extraponies/')
+            standard = Ponysay.getShareDirectories(standard, sharedirs)
+            extra = Ponysay.getShareDirectories(extra, sharedirs)
+            if pony is None:
+                ponies = [ponydir + name for ponydir in standard for name in index.ponies(ponydir)]
+                if len(ponies) == 0:
+                    raise LookupError('there are no ponies')
+                pony = random.choice(ponies) + '.pony'
+            else:
+                ponydirs = [ponydir for ponydir in standard + extra if pony in index.ponies(ponydir)]
+                if len(ponydirs) == 0:
+                    raise LookupError('there is no pony named %s' % pony)
+                pony = ponydirs[0] + pony + '.pony'
+        
+        ## Get the balloon style file
+        if (balloon is not None) and not os.path.isfile(balloon):
+            balloonfiles = [balloondir + balloonfile for balloondir in Ponysay.getShareDirectories('balloons/', sharedirs)
+                                                     for (style, balloonfile) in index.balloons(balloondir, think) if style == balloon]
+            if len(balloonfiles) == 0:
+                raise LookupError('there is no balloon style named %s' % balloon)
+            balloon = balloonfiles[0]
+    
+    ## Without a balloon, the balloon links are removed
+    (mode, balloon) = ('\033[0m$/= $$\\= $', None) if ponyonly else ('\033[0m', Balloon.fromFile(balloon, think))
+    backend = Backend(message = '' if ponyonly else message, ponyfile = pony, wrapcolumn = wrap, width = width, balloon = balloon,
+                      hyphen = hyphen, linkcolour = linkcolour, ballooncolour = ballooncolour, mode = mode,
+                      infolevel = info, wraplimit = wraplimit, wrapexceed = wrapexceed, quiet = True, minimise = minimise)
+    backend.parse()
+    output = backend.output
+    if output.endswith('\n'):
+        output = output[:-1]
+    return output
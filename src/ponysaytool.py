@@ -32,7 +32,10 @@ the colon.
 
 import os
 import sys
-from subprocess import Popen, PIPE
+import time
+import json
+import hashlib
+import multiprocessing
 
 from argparser import *
 from ponysay import *
@@ -44,6 +47,11 @@ VERSION = 'dev'  # this line should not be edited, it is fixed by the build syst
 The version of ponysay
 '''
 
+INDEX_CACHE_VERSION = '1'
+'''
+Version of the format of the cached results of --dimensions and --metadata
+'''
+
 
 
 def print(text = '', end = '\n'):
@@ -94,7 +102,13 @@ class PonysayTool():
             print('%s %s' % ('ponysay-tool', VERSION))
         
         elif opts['--kms'] is not None:
-            self.generateKMS()
+            self.generateKMS(opts['--kms-palette'])
+        
+        elif opts['--kms-stats'] is not None:
+            self.printKMSStats()
+        
+        elif opts['--daemon'] is not None:
+            self.daemon()
         
         elif (opts['--dimensions'] is not None) and (len(opts['--dimensions']) == 1):
             self.generateDimensions(opts['--dimensions'][0], args.files)
@@ -102,6 +116,9 @@ class PonysayTool():
         elif (opts['--metadata'] is not None) and (len(opts['--metadata']) == 1):
             self.generateMetadata(opts['--metadata'][0], args.files)
         
+        elif (opts['--correct'] is not None) and (len(opts['--correct']) == 1):
+            self.correctNames(opts['--correct'][0])
+        
         elif (opts['-b'] is not None) and (len(opts['-b']) == 1):
             try:
                 if opts['--no-term-init'] is None:
@@ -195,51 +212,6 @@ class PonysayTool():
             exit(253)
     
     
-    def execPonysay(self, args, message = ''):
-        '''
-        Execute ponysay!
-        
-        @param  args     Arguments
-        @param  message  Message
-        '''
-        class PhonyArgParser():
-            def __init__(self, args, message):
-                self.argcount = len(args) + (0 if message is None else 1)
-                for key in args:
-                    self.argcount += len(args[key]) if (args[key] is not None) and isinstance(args[key], list) else 1
-                self.message = message
-                self.opts = self
-            def __getitem__(self, key):
-                if key in args:
-                    return args[key] if (args[key] is not None) and isinstance(args[key], list) else [args[key]]
-                return None
-            def __contains__(self, key):
-                return key in args;
-        
-        stdout = sys.stdout
-        class StringInputStream():
-            def __init__(self):
-                self.buf = ''
-                class Buffer():
-                    def __init__(self, parent):
-                        self.parent = parent
-                    def write(self, data):
-                        self.parent.buf += data.decode('utf8', 'replace')
-                    def flush(self):
-                        pass
-                self.buffer = Buffer(self)
-            def flush(self):
-                pass
-            def isatty(self):
-                return True
-        sys.stdout = StringInputStream()
-        ponysay = Ponysay()
-        ponysay.run(PhonyArgParser(args, message))
-        out = sys.stdout.buf[:-1]
-        sys.stdout = stdout
-        return out
-    
-    
     def browse(self, ponydir, restriction):
         '''
         Browse ponies
@@ -298,11 +270,7 @@ class PonysayTool():
                 oldpony = ponyindex
                 
                 ponyfile = (ponydir + '/' + ponies[ponyindex] + '.pony').replace('//', '/')
-                pony = self.execPonysay({'-f' : ponyfile, '-W' : 'none', '-o' : None}).split('\n')
-                
-                preprint = '\033[H\033[2J'
-                if pony[0].startswith(preprint):
-                    pony[0] = pony[0][len(preprint):]
+                pony = render(pony = ponyfile, wrap = None, ponyonly = True).split('\n')
                 ponyheight = len(pony)
                 ponywidth = Backend.len(max(pony, key = Backend.len))
                 
@@ -310,9 +278,7 @@ class PonysayTool():
                 AUTO_POP  = '\033[10101~'
                 pony = '\n'.join(pony).replace('\n', AUTO_PUSH + '\n' + AUTO_POP)
                 colourstack = ColourStack(AUTO_PUSH, AUTO_POP)
-                buf = ''
-                for c in pony:
-                    buf += c + colourstack.feed(c)
+                buf = colourstack.process(pony)
                 pony = buf.replace(AUTO_PUSH, '').replace(AUTO_POP, '').split('\n')
             
             if (oldx != x) or (oldy != y):
@@ -348,7 +314,7 @@ class PonysayTool():
                     print(getprint(ponyquotes, quoteswidth, quotesheight, termw, termh, x, y), end='')
                 elif info:
                     ponyfile = (ponydir + '/' + ponies[ponyindex] + '.pony').replace('//', '/')
-                    ponyinfo = self.execPonysay({'-f' : ponyfile, '-W' : 'none', '-i' : None}).split('\n')
+                    ponyinfo = render(pony = ponyfile, wrap = None, info = 1).split('\n')
                     infoheight = len(ponyinfo)
                     infowidth = Backend.len(max(ponyinfo, key = Backend.len))
                     print(getprint(ponyinfo, infowidth, infoheight, termw, termh, x, y), end='')
@@ -432,68 +398,100 @@ class PonysayTool():
                 (x, y) = (0, 0)
     
     
-    def generateKMS(self):
+    def generateKMS(self, palettes = None):
         '''
-        Generate all kmsponies for the current TTY palette
+        Generate all kmsponies for a set of TTY palettes, using a process per CPU,
+        kmsponies that are already in the cache are not re-generated
+        
+        @param  palettes:list<str>?  The palettes, `None` for the palettes from PONYSAY_KMS_PALETTE_CMD or PONYSAY_KMS_PALETTE
         '''
-        class PhonyArgParser():
-            def __init__(self, key, value):
-                self.argcount = 3
-                self.message = ''
-                self.opts = self
-                self.key = key
-                self.value = value
-            def __getitem__(self, key):
-                return [self.value] if key == self.key else None
-            def __contains__(self, key):
-                return key == self.key;
-        
-        class StringInputStream():
-            def __init__(self):
-                self.buf = ''
-                class Buffer():
-                    def __init__(self, parent):
-                        self.parent = parent
-                    def write(self, data):
-                        self.parent.buf += data.decode('utf8', 'replace')
-                    def flush(self):
-                        pass
-                self.buffer = Buffer(self)
-            def flush(self):
-                pass
-            def isatty(self):
-                return True
+        ponysay = Ponysay()
+        if palettes is None:
+            palettes = KMS.palettes()
+        if len(palettes) == 0:
+            printerr('ponysay-tool: no KMS palette, use --kms-palette or set PONYSAY_KMS_PALETTE or PONYSAY_KMS_PALETTE_CMD')
+            exit(249)
         
-        stdout = sys.stdout
-        term = os.environ['TERM']
-        os.environ['TERM'] = 'linux'
+        ponyfiles = []
+        for (kind, ponydirs) in (('standard', ponysay.xponydirs), ('extra', ponysay.extraxponydirs)):
+            ponies = set()
+            for ponydir in ponydirs:
+                for pony in ShareIndex.get().ponies(ponydir):
+                    if pony not in ponies:
+                        ponies.add(pony)
+                        ponyfiles.append((kind, pony, ponydir + pony + '.pony'))
+        jobs = [(ponyfile, palette, ponysay.HOME) for palette in palettes for ponyfile in ponyfiles]
         
-        sys.stdout = StringInputStream()
-        ponysay = Ponysay()
-        ponysay.run(PhonyArgParser('--onelist', None))
-        stdponies = sys.stdout.buf[:-1].split('\n')
+        ## Generate the kmsponies in parallel, and report them as they are done
+        start = time.monotonic()
+        (created, current, size) = (0, 0, 0)
+        def report(results):
+            nonlocal created, current, size
+            for ((kind, pony, _ponyfile), result) in results:
+                if result is None:
+                    current += 1
+                else:
+                    (created, size) = (created + 1, size + result)
+                printerr('[%i/%i] %s %s kmspony: %s' % (created + current, len(jobs), 'Kept' if result is None else 'Generated', kind, pony))
+                sys.stderr.buffer.flush()
+        processes = min(os.cpu_count() or 1, len(jobs))
+        context = None
+        if processes > 1:
+            try:
+                context = multiprocessing.get_context('fork')
+            except ValueError:
+                pass
+        if context is None:
+            processes = 1
+            report(map(PonysayTool.warmKMSPony, jobs))
+        else:
+            with context.Pool(processes) as pool:
+                report(pool.imap_unordered(PonysayTool.warmKMSPony, jobs, 8))
+        elapsed = time.monotonic() - start
         
-        sys.stdout = StringInputStream()
-        ponysay = Ponysay()
-        ponysay.run(PhonyArgParser('++onelist', None))
-        extraponies = sys.stdout.buf[:-1].split('\n')
-        
-        for pony in stdponies:
-            printerr('Genering standard kmspony: %s' % pony)
-            sys.stderr.buffer.flush();
-            sys.stdout = StringInputStream()
-            ponysay = Ponysay()
-            ponysay.run(PhonyArgParser('--pony', pony))
-        
-        for pony in extraponies:
-            printerr('Genering extra kmspony: %s' % pony)
-            sys.stderr.buffer.flush();
-            sys.stdout = StringInputStream()
-            ponysay = Ponysay()
-            ponysay.run(PhonyArgParser('++pony', pony))
-        
-        os.environ['TERM'] = term
-        sys.stdout = stdout
+        limit = KMS.stats(ponysay.HOME)['limit']
+        printerr('%i kmsponies generated (%i bytes) and %i already current, for %i palettes, in %.2f s with %i processes: %.1f kmsponies/s' %
+                 (created, size, current, len(palettes), elapsed, processes, len(jobs) / max(elapsed, 0.001)))
+        if size > limit:
+            printerr('ponysay-tool: the kmsponies do not fit in the cache, some were evicted, raise PONYSAY_KMS_CACHE_SIZE above %i' % ((size >> 20) + 1))
+    
+    
+    @staticmethod
+    def warmKMSPony(job):
+        '''
+        Generate a kmspony, unless it is already in the cache
+        
+        @param   job:((str, str, str), str, str)  The pony kind, name and file, the palette, and the home directory
+        @return  ((str, str, str), int?)          The pony kind, name and file, and the size of the kmspony, `None` if it was already in the cache
+        '''
+        (ponyfile, palette, home) = job
+        return (ponyfile, KMS.warm(ponyfile[2], palette, home))
+    
+    
+    def printKMSStats(self):
+        '''
+        Print statistics for the kmspony cache
+        '''
+        stats = KMS.stats(Ponysay().HOME)
+        lookups = stats['hits'] + stats['misses']
+        print('directory: %s' % stats['directory'])
+        print('hits:      %i (%.1f %%)' % (stats['hits'], 0 if lookups == 0 else 100 * stats['hits'] / lookups))
+        print('misses:    %i' % stats['misses'])
+        print('palettes:  %i' % stats['palettes'])
+        print('entries:   %i' % stats['entries'])
+        print('bytes:     %i of %i' % (stats['bytes'], stats['limit']))
+    
+    
+    def daemon(self):
+        '''
+        Keeps ponysay loaded and lets ponysay and ponythink use it
+        '''
+        from daemon import Daemon
+        daemon = Daemon(os.path.realpath(sys.argv[0]))
+        daemon.warm()
+        if not daemon.serve():
+            printerr('ponysay-tool: a ponysay daemon is already running at %s' % daemon.path)
+            exit(250)
     
     
     def generateDimensions(self, ponydir, ponies = None):
@@ -503,62 +501,18 @@ class PonysayTool():
         @param  ponydir:str        The directory
         @param  ponies:itr<str>?   Ponies to which to limit
         '''
+        if not ponydir.endswith('/'):
+            ponydir += '/'
         dimensions = []
-        ponyset = None if (ponies is None) or (len(ponies) == 0) else set(ponies)
-        for ponyfile in os.listdir(ponydir):
-            if (ponyset is not None) and (ponyfile not in ponyset):
-                continue
-            if ponyfile.endswith('.pony') and (ponyfile != '.pony'):
-                class PhonyArgParser():
-                    def __init__(self, balloon):
-                        self.argcount = 5
-                        self.message = ''
-                        self.pony = (ponydir + '/' + ponyfile).replace('//', '/')
-                        self.balloon = balloon
-                        self.opts = self
-                    def __getitem__(self, key):
-                        if key == '-f':
-                            return [self.pony]
-                        if key == ('-W' if self.balloon else '-b'):
-                            return [('none' if self.balloon else None)]
-                        return None
-                    def __contains__(self, key):
-                        return key in ('-f', '-W', '-b');
-                stdout = sys.stdout
-                class StringInputStream():
-                    def __init__(self):
-                        self.buf = ''
-                        class Buffer():
-                            def __init__(self, parent):
-                                self.parent = parent
-                            def write(self, data):
-                                self.parent.buf += data.decode('utf8', 'replace')
-                            def flush(self):
-                                pass
-                        self.buffer = Buffer(self)
-                    def flush(self):
-                        pass
-                    def isatty(self):
-                        return True
-                sys.stdout = StringInputStream()
-                ponysay = Ponysay()
-                ponysay.run(PhonyArgParser(True))
-                printpony = sys.stdout.buf[:-1].split('\n')
-                ponyheight = len(printpony) - 2 # using fallback balloon
-                ponywidth = Backend.len(max(printpony, key = Backend.len))
-                ponysay = Ponysay()
-                ponysay.run(PhonyArgParser(False))
-                printpony = sys.stdout.buf[:-1].split('\n')
-                ponyonlyheight = len(printpony)
-                sys.stdout = stdout
-                dimensions.append((ponywidth, ponyheight, ponyonlyheight, ponyfile[:-5]))
+        for (ponyfile, (ponywidth, ponyheight, ponyonlyheight)) in self.__indexPonies(ponydir, ponies, 'dimensions', PonysayTool.measurePony):
+            dimensions.append((ponywidth, ponyheight, ponyonlyheight, ponyfile[:-5]))
         (widths, heights, onlyheights) = ([], [], [])
         for item in dimensions:
             widths     .append((item[0], item[3]))
             heights    .append((item[1], item[3]))
             onlyheights.append((item[2], item[3]))
         for items in (widths, heights, onlyheights):
-            sorted(items, key = lambda item : item[0])
+            items.sort(key = lambda item : item[0])
         for pair in ((widths, 'widths'), (heights, 'heights'), (onlyheights, 'onlyheights')):
             (items, dimfile) = pair
             dimfile = (ponydir + '/' + dimfile).replace('//', '/')
@@ -580,6 +534,9 @@ class PonysayTool():
             with open(dimfile, 'wb') as file:
                 file.write(data.encode('utf8'))
                 file.flush()
+        with open(ponydir + 'dimensions.bin', 'wb') as file:
+            file.write(Metadata.makeDimensionIndex(dimensions))
+            file.flush()
     
     
     def generateMetadata(self, ponydir, ponies = None):
@@ -591,6 +548,58 @@ class PonysayTool():
         '''
         if not ponydir.endswith('/'):
             ponydir += '/'
+        everything = []
+        for (ponyfile, data) in self.__indexPonies(ponydir, ponies, 'metadata', PonysayTool.readMetadata):
+            everything.append((ponyfile[:-5], dict((key, set(data[key])) for key in data)))
+        with open(ponydir + 'metadata', 'wb') as file:
+            file.write(Metadata.makeMetadataStore(everything))
+            file.flush()
+    
+    
+    def correctNames(self, ponydir):
+        '''
+        Reads pony names, one per line, from stdin and prints, for each name, the name, the
+        distance to the closest ponies in a directory and the closest ponies, separated by tabs
+        
+        @param  ponydir:str  The directory
+        '''
+        if not ponydir.endswith('/'):
+            ponydir += '/'
+        names = sys.stdin.buffer.read().decode('utf-8', 'replace').split('\n')
+        if (len(names) > 0) and (len(names[-1]) == 0):
+            names = names[:-1]
+        autocorrect = SpelloCorrecter([ponydir], '.pony')
+        output = []
+        for (name, (alternatives, dist)) in zip(names, autocorrect.correctAll(names)):
+            output.append('%s\t%i\t%s\n' % (name, dist, ' '.join(alternatives)))
+        sys.stdout.buffer.write(''.join(output).encode('utf-8'))
+    
+    
+    @staticmethod
+    def measurePony(ponyfile):
+        '''
+        Measures a pony for --dimensions
+        
+        @param   ponyfile:str                                 The pony file
+        @return  (width, height, onlyheight):(int, int, int)  The width and height with the fallback balloon,
+                                                              excluding the balloon's height, and the height without a balloon
+        '''
+        printpony = render(pony = ponyfile, wrap = None).split('\n')
+        ponyheight = len(printpony) - 2 # using fallback balloon
+        ponywidth = Backend.len(max(printpony, key = Backend.len))
+        printpony = render(pony = ponyfile, ponyonly = True).split('\n')
+        ponyonlyheight = len(printpony)
+        return (ponywidth, ponyheight, ponyonlyheight)
+    
+    
+    @staticmethod
+    def readMetadata(ponyfile):
+        '''
+        Reads a pony's metadata for --metadata
+        
+        @param   ponyfile:str             The pony file
+        @return  :dict<str, list<str>>    Map from metadata keys to their values, sorted
+        '''
         def makeset(value):
             rc = set()
             bracket = 0
@@ -625,43 +634,126 @@ class PonysayTool():
             if len(buf) > 0:
                 rc.add(buf)
             return rc
-        everything = []
+        with open(ponyfile, 'rb') as file:
+            data = file.read().decode('utf8', 'replace')
+            data = [line.replace('\n', '') for line in data.split('\n')]
+        if data[0] != '$$$':
+            meta = []
+        else:
+            sep = 1
+            while data[sep] != '$$$':
+                sep += 1
+            meta = data[1 : sep]
+        data = {}
+        for line in meta:
+            if ':' in line:
+                key = line[:line.find(':')].strip()
+                value = line[line.find(':') + 1:]
+                test = key
+                for c in 'ABCDEFGHIJKLMN OPQRSTUVWXYZ':
+                    test = test.replace(c, '')
+                if (len(test) == 0) and (len(key) > 0):
+                    vals = makeset(value.replace(' ', ''))
+                    if key not in data:
+                        data[key] = vals
+                    else:
+                        dset = data[key]
+                        for val in vals:
+                            dset.add(val)
+        return dict((key, sorted(data[key])) for key in data)
+    
+    
+    def __indexPonies(self, ponydir, ponies, kind, function):
+        '''
+        Applies a function to the pony files in a directory, using a process per CPU, the results
+        are cached and the function is only applied to files that have been modified since
+        
+        @param   ponydir:str           The directory, ending with a slash
+        @param   ponies:itr<str>?      Ponies to which to limit
+        @param   kind:str              The name of the results, in the cache
+        @param   function:(str)→¿R?    Function, that can be pickled, to apply to pony files, its return must be serialisable with JSON
+        @return  :list<(str, ¿R?)>     The pony files, without the directory, and their results, in the order `os.listdir` lists them
+        '''
         ponyset = None if (ponies is None) or (len(ponies) == 0) else set(ponies)
+        ponyfiles = []
         for ponyfile in os.listdir(ponydir):
             if (ponyset is not None) and (ponyfile not in ponyset):
                 continue
             if ponyfile.endswith('.pony') and (ponyfile != '.pony'):
-                with open(ponydir + ponyfile, 'rb') as file:
-                    data = file.read().decode('utf8', 'replace')
-                    data = [line.replace('\n', '') for line in data.split('\n')]
-                if data[0] != '$$$':
-                    meta = []
-                else:
-                    sep = 1
-                    while data[sep] != '$$$':
-                        sep += 1
-                    meta = data[1 : sep]
-                data = {}
-                for line in meta:
-                    if ':' in line:
-                        key = line[:line.find(':')].strip()
-                        value = line[line.find(':') + 1:]
-                        test = key
-                        for c in 'ABCDEFGHIJKLMN OPQRSTUVWXYZ':
-                            test = test.replace(c, '')
-                        if (len(test) == 0) and (len(key) > 0):
-                            vals = makeset(value.replace(' ', ''))
-                            if key not in data:
-                                data[key] = vals
-                            else:
-                                dset = data[key]
-                                for val in vals:
-                                    dset.add(val)
-                everything.append((ponyfile[:-5], data))
-        import pickle
-        with open((ponydir + '/metadata').replace('//', '/'), 'wb') as file:
-            pickle.dump(everything, file, -1)
-            file.flush()
+                ponyfiles.append(ponyfile)
+        
+        ## Reuse the results for files whose modification time and size have not changed
+        cachefile = self.__getIndexCacheFile(ponydir, kind)
+        cached = {}
+        try:
+            with open(cachefile, 'rb') as file:
+                data = json.loads(file.read().decode('utf-8'))
+            if (data['version'] == INDEX_CACHE_VERSION) and (data['directory'] == os.path.realpath(ponydir)):
+                cached = data['files']
+        except:
+            pass
+        keys = {}
+        for ponyfile in ponyfiles:
+            attr = os.stat(ponydir + ponyfile)
+            keys[ponyfile] = [attr.st_mtime_ns, attr.st_size]
+        outdated = [ponyfile for ponyfile in ponyfiles if (ponyfile not in cached) or (cached[ponyfile][0] != keys[ponyfile])]
+        
+        ## Process the other files in parallel
+        results = None
+        jobs = min(os.cpu_count() or 1, len(outdated))
+        if jobs > 1:
+            try:
+                context = multiprocessing.get_context('fork')
+            except ValueError:
+                context = None
+            if context is not None:
+                with context.Pool(jobs) as pool:
+                    results = pool.map(function, [ponydir + ponyfile for ponyfile in outdated])
+        if results is None:
+            results = [function(ponydir + ponyfile) for ponyfile in outdated]
+        for (ponyfile, result) in zip(outdated, results):
+            cached[ponyfile] = [keys[ponyfile], result]
+        
+        ## Store the results, failures are ignored
+        if (cachefile is not None) and (len(outdated) > 0):
+            data = {'version' : INDEX_CACHE_VERSION, 'directory' : os.path.realpath(ponydir), 'files' : cached}
+            tmpfile = '%s.%i~' % (cachefile, os.getpid())
+            try:
+                with open(tmpfile, 'wb') as file:
+                    file.write(json.dumps(data, separators = (',', ':')).encode('utf-8'))
+                os.replace(tmpfile, cachefile)
+            except:
+                try:
+                    os.remove(tmpfile)
+                except:
+                    pass
+        
+        return [(ponyfile, cached[ponyfile][1]) for ponyfile in ponyfiles]
+    
+    
+    def __getIndexCacheFile(self, ponydir, kind):
+        '''
+        Gets the file with the cached results of --dimensions or --metadata for a directory,
+        and creates the cache directory if it does not exist
+        
+        @param   ponydir:str  The pony directory
+        @param   kind:str     The name of the results
+        @return  :str?        The cache file, `None` if the cache cannot be used
+        '''
+        cachedir = os.environ['XDG_CACHE_HOME'] if 'XDG_CACHE_HOME' in os.environ else ''
+        if len(cachedir) == 0:
+            home = os.environ['HOME'] if 'HOME' in os.environ else ''
+            if len(home) == 0:
+                return None
+            cachedir = home + '/.cache'
+        cachedir += '/ponysay/indices'
+        try:
+            if not os.path.isdir(cachedir):
+                os.makedirs(cachedir)
+        except:
+            return None
+        realdir = os.path.realpath(ponydir)
+        return '%s/%s.%s' % (cachedir, hashlib.sha1(realdir.encode('utf-8', 'surrogateescape')).hexdigest(), kind)
     
     
     def editmeta(self, ponyfile):
@@ -687,19 +779,6 @@ class PonysayTool():
             image = data[sep + 1:]
         
         
-        class PhonyArgParser():
-            def __init__(self):
-                self.argcount = 5
-                self.message = ponyfile
-                self.opts = self
-            def __getitem__(self, key):
-                if key == '-f':  return [ponyfile]
-                if key == '-W':  return ['n']
-                return None
-            def __contains__(self, key):
-                return key in ('-f', '-W');
-        
-        
         data = {}
         comment = []
         for line in meta:
@@ -728,31 +807,7 @@ class PonysayTool():
         comment = comment[cut:]
         
         
-        stdout = sys.stdout
-        class StringInputStream():
-            def __init__(self):
-                self.buf = ''
-                class Buffer():
-                    def __init__(self, parent):
-                        self.parent = parent
-                    def write(self, data):
-                        self.parent.buf += data.decode('utf8', 'replace')
-                    def flush(self):
-                        pass
-                self.buffer = Buffer(self)
-            def flush(self):
-                pass
-            def isatty(self):
-                return True
-        sys.stdout = StringInputStream()
-        ponysay = Ponysay()
-        ponysay.run(PhonyArgParser())
-        printpony = sys.stdout.buf[:-1].split('\n')
-        sys.stdout = stdout
-        
-        preprint = '\033[H\033[2J'
-        if printpony[0].startswith(preprint):
-            printpony[0] = printpony[0][len(preprint):]
+        printpony = render(ponyfile, pony = ponyfile, wrap = None).split('\n')
         ponyheight = len(printpony) - len(ponyfile.split('\n')) + 1 - 2 # using fallback balloon
         ponywidth = Backend.len(max(printpony, key = Backend.len))
         
@@ -769,9 +824,7 @@ class PonysayTool():
         AUTO_POP  = '\033[10101~'
         modprintpony = '\n'.join(printpony).replace('\n', AUTO_PUSH + '\n' + AUTO_POP)
         colourstack = ColourStack(AUTO_PUSH, AUTO_POP)
-        buf = ''
-        for c in modprintpony:
-            buf += c + colourstack.feed(c)
+        buf = colourstack.process(modprintpony)
         modprintpony = buf.replace(AUTO_PUSH, '').replace(AUTO_POP, '')
         
         printpony = [('\033[21;39;49;0m%s%s\033[21;39;49;0m' % (' ' * (termsize[1] - ponywidth), line)) for line in modprintpony.split('\n')]
@@ -866,7 +919,7 @@ class TextArea(): # TODO support small screens  (This is being work on in GNU-Po
         
         @param  saver  Save method
         '''
-        innerleft = UCS.dispLen(max(self.fields, key = UCS.dispLen)) + self.left + 3
+        innerleft = Width.len(max(self.fields, key = Width.len)) + self.left + 3
         
         leftlines = []
         datalines = []
@@ -1208,12 +1261,14 @@ Whether stderr is piped
 
 usage_program = '\033[34;1mponysay-tool\033[21;39m'
 
-usage = '\n'.join(['%s %s' % (usage_program, '(--help | --version | --kms)'),
+usage = '\n'.join(['%s %s' % (usage_program, '(--help | --version | --kms-stats | --daemon)'),
+                   '%s %s' % (usage_program, '--kms [--kms-palette \033[33mPALETTE\033[39m]*'),
                    '%s %s' % (usage_program, '(--edit | --edit-rm) \033[33mPONY-FILE\033[39m'),
                    '%s %s' % (usage_program, '--edit-stash \033[33mPONY-FILE\033[39m > \033[33mSTASH-FILE\033[39m'),
                    '%s %s' % (usage_program, '--edit-apply \033[33mPONY-FILE\033[39m < \033[33mSTASH-FILE\033[39m'),
                    '%s %s' % (usage_program, '(--dimensions | --metadata) \033[33mPONY-DIR\033[39m'),
                    '%s %s' % (usage_program, '--browse \033[33mPONY-DIR\033[39m [-r \033[33mRESTRICTION\033[39m]*'),
+                   '%s %s' % (usage_program, '--correct \033[33mPONY-DIR\033[39m < \033[33mNAME-FILE\033[39m'),
                ])
 
 usage = usage.replace('\033[', '\0')
@@ -1235,10 +1290,14 @@ opts.add_argumentless(['-h', '--help'],                          help = 'Print t
 opts.add_argumentless(['+h', '++help', '--help-colour'],         help = 'Print this help message with colours even if piped.')
 opts.add_argumentless(['-v', '--version'],                       help = 'Print the version of the program.')
 opts.add_argumentless(['--kms'],                                 help = 'Generate all kmsponies for the current TTY palette')
+opts.add_argumented(  ['--kms-palette'],    arg = 'PALETTE',     help = 'Palette to generate kmsponies for with --kms, may be used multiple times')
+opts.add_argumentless(['--kms-stats'],                           help = 'Print the hits, misses and size of the kmspony cache')
+opts.add_argumentless(['--daemon'],                              help = 'Keep ponysay loaded for faster ponysay and ponythink')
 opts.add_argumented(  ['--dimensions'],     arg = 'PONY-DIR',    help = 'Generate pony dimension file for a directory')
 opts.add_argumented(  ['--metadata'],       arg = 'PONY-DIR',    help = 'Generate pony metadata collection file for a directory')
 opts.add_argumented(  ['-b', '--browse'],   arg = 'PONY-DIR',    help = 'Browse ponies in a directory')
 opts.add_argumented(  ['-r', '--restrict'], arg = 'RESTRICTION', help = 'Metadata based restriction for --browse')
+opts.add_argumented(  ['--correct'],        arg = 'PONY-DIR',    help = 'Print the closest ponies in a directory for each name read from stdin')
 opts.add_argumented(  ['--edit'],           arg = 'PONY-FILE',   help = 'Edit a pony file\'s metadata')
 opts.add_argumented(  ['--edit-rm'],        arg = 'PONY-FILE',   help = 'Remove metadata from a pony file')
 opts.add_argumented(  ['--edit-apply'],     arg = 'PONY-FILE',   help = 'Apply metadata from stdin to a pony file')
@@ -1249,5 +1308,11 @@ unrecognised = not opts.parse()
 Whether at least one unrecognised option was used
 '''
 
-PonysayTool(args = opts)
+
+'''
+Start the program, when started through ponysay-tool, `__main__` starts it once this module
+is loaded, as worker processes cannot be given its functions while it is being loaded
+'''
+if __name__ == '__main__':
+    PonysayTool(args = opts)
 
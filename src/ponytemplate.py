@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+ponysay - Ponysay, cowsay reimplementation for ponies
+
+Copyright (C) 2012-2016  Erkin Batu Altunbaş et al.
+
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+If you intend to redistribute ponysay or a fork of it commercially,
+it contains aggregated images, some of which may not be commercially
+redistribute, you would be required to remove those. To determine
+whether or not you may commercially redistribute an image make use
+that line ‘FREE: yes’, is included inside the image between two ‘$$$’
+lines and the ‘FREE’ is and upper case and directly followed by
+the colon.
+'''
+from common import *
+from width import *
+
+import re
+import json
+import hashlib
+import threading
+
+
+
+TEMPLATE_VERSION = '2'
+'''
+Pony template cache format version constant
+'''
+
+
+
+class PonyTemplate():
+    '''
+    Precompiled pony file
+    
+    The image of a pony file is compiled into a list of tokens:
+    
+        str                                        Literal text, without any $, escape or tab
+        ['t']                                      A tab
+        ['c', seq:str]                             An escape sequence, normally a colour
+        ['v', name:str]                            A variable to fill in, for example $\$
+        ['d', name:str, value:str]                 A variable definition
+        ['b', w:int, h:int, x:int, justify:str?]   A balloon anchor with its parsed properties
+        ['b', None, props:str]                     A balloon anchor whose properties are not valid
+        ['$', parts:list<str>]                     A variable with tabs in it, the tabs depend on the
+                                                   column and are inserted between the parts when printed
+    
+    Compiled pony files are cached on disk, keyed on the modification
+    time and size of the pony file, so that a warm render only needs
+    to fill in the slots
+    '''
+    
+    __special = re.compile('[$\033\t]')
+    '''
+    Characters that end literal text
+    '''
+    
+    __loaded = {}
+    '''
+    Already loaded templates, mapped from the pony file names to their stat key and template
+    '''
+    
+    
+    def __init__(self, info, body, source = None):
+        '''
+        Constructor
+        
+        @param  info:str?             The metadata of the pony file, `None` if it has no metadata
+        @param  body:list<str|list>   The compiled image
+        @param  source:str?           The image before compilation, `None` if not kept
+        '''
+        self.info = info
+        self.body = body
+        self.source = source
+    
+    
+    @staticmethod
+    def load(ponyfile):
+        '''
+        Loads and compiles a pony file, or loads it from the cache if it has already been compiled
+        
+        @param   ponyfile:str   The pony file
+        @return  :PonyTemplate  The compiled pony file
+        '''
+        try:
+            stat = os.stat(ponyfile)
+        except:
+            stat = None
+        if (stat is None) or not os.path.isfile(ponyfile):
+            ## Pipes, such as converted images, can only be read once and cannot be cached
+            (info, body) = PonyTemplate.read(ponyfile)
+            return PonyTemplate(info, PonyTemplate.compile(body)[0], body)
+        
+        key = (stat.st_mtime_ns, stat.st_size)
+        if ponyfile in PonyTemplate.__loaded:
+            (loadedkey, template) = PonyTemplate.__loaded[ponyfile]
+            if loadedkey == key:
+                return template
+        
+        realfile = os.path.realpath(ponyfile)
+        cachefile = PonyTemplate.__getCacheFile(realfile)
+        template = None
+        if cachefile is not None:
+            template = PonyTemplate.__loadCached(cachefile, realfile, key)
+        if template is None:
+            (info, body) = PonyTemplate.read(ponyfile)
+            template = PonyTemplate(info, PonyTemplate.compile(body)[0], body)
+            if cachefile is not None:
+                PonyTemplate.__storeCached(cachefile, realfile, key, template)
+        
+        PonyTemplate.__loaded[ponyfile] = (key, template)
+        return template
+    
+    
+    @staticmethod
+    def read(ponyfile):
+        '''
+        Reads a pony file and splits off its metadata
+        
+        @param   ponyfile:str           The pony file
+        @return  (info, body):(str?, str)  The metadata, `None` if there is none, and the image
+        '''
+        with open(ponyfile, 'rb') as ponystream:
+            pony = ponystream.read().decode('utf8', 'replace')
+        
+        info = None
+        if pony.startswith('$$$\n'):
+            pony = pony[4:]
+            if pony.startswith('$$$\n'):
+                infoend = 4
+                info = ''
+            else:
+                infoend = pony.index('\n$$$\n')
+                info = pony[:infoend]
+                infoend += 5
+            pony = pony[infoend:]
+        return (info, pony)
+    
+    
+    @staticmethod
+    def compile(text):
+        '''
+        Compiles the image of a pony file, or text inserted into it
+        
+        @param   text:str                           The text to compile
+        @return  (tokens, closed):(list<str|list>, bool)  The tokens, and whether the text does not end inside
+                                                          a variable or an escape sequence, if it does, the
+                                                          text cannot be joined with other text after compilation
+        '''
+        special = PonyTemplate.__special
+        tokens = []
+        closed = True
+        (i, n) = (0, len(text))
+        while i < n:
+            match = special.search(text, i)
+            if match is None:
+                tokens.append(text[i:])
+                break
+            start = match.start()
+            if start > i:
+                tokens.append(text[i : start])
+            c = text[start]
+            i = start + 1
+            if c == '\t':
+                tokens.append(['t'])
+            elif c == '\033':
+                colour = Width.getEscape(text, start)
+                tokens.append(['c', colour])
+                i = start + len(colour)
+                if (i == n) and closed:
+                    closed = PonyTemplate.isComplete(colour)
+            else:
+                (parts, dollar) = ([], '')
+                while True:
+                    if i == n:
+                        return (tokens, False)
+                    match = special.search(text, i)
+                    if match is None:
+                        return (tokens, False)
+                    start = match.start()
+                    dollar += text[i : start]
+                    c = text[start]
+                    i = start + 1
+                    if c == '$':
+                        break
+                    elif c == '\t':
+                        parts.append(dollar)
+                        dollar = ''
+                    elif i == n:
+                        return (tokens, False)
+                    else:
+                        dollar += text[i] # the escape character escapes the next character
+                        i += 1
+                if len(parts) > 0:
+                    tokens.append(['$', parts + [dollar]])
+                else:
+                    tokens.append(PonyTemplate.dollarToken(dollar))
+        return (tokens, closed)
+    
+    
+    @staticmethod
+    def dollarToken(dollar):
+        '''
+        Creates the token for a variable, a variable definition or a balloon anchor
+        
+        @param   dollar:str  The text between the dollar signs
+        @return  :list       The token
+        '''
+        if '=' in dollar:
+            return ['d', dollar[:dollar.find('=')], dollar[dollar.find('=') + 1:]]
+        if not dollar.startswith('balloon'):
+            return ['v', dollar]
+        try:
+            return ['b'] + list(PonyTemplate.parseBalloon(dollar[7:]))
+        except ValueError:
+            return ['b', None, dollar[7:]]
+    
+    
+    @staticmethod
+    def parseBalloon(props):
+        '''
+        Parses the properties of a balloon anchor
+        
+        @param   props:str                            The text after `balloon` in the anchor
+        @return  (w, h, x, justify):(int, int, int, str?)  The minimum width, the minimum height, the left column of the
+                                                          required span and the justification of the balloon
+        '''
+        (w, h, x, justify) = ('0', 0, 0, None)
+        if len(props) > 0:
+            if ',' in props:
+                if props[0] != ',':
+                    w = props[:props.index(',')]
+                h = int(props[props.index(',') + 1:])
+            else:
+                w = props
+        for justify in ('l', 'c', 'r'):
+            if justify in w:
+                (x, w) = (int(w[:w.find(justify)]), int(w[w.find(justify) + 1:]))
+                return (w - x, h, x, justify)
+        return (int(w), h, x, None)
+    
+    
+    @staticmethod
+    def isComplete(colour):
+        '''
+        Checks whether an escape sequence read at the end of a text would be the
+        same if the text continued
+        
+        @param   colour:str  The escape sequence
+        @return  :bool       Whether the escape sequence is complete
+        '''
+        if len(colour) < 2:
+            return False
+        if colour[1] == '[':
+            c = colour[-1]
+            return (len(colour) > 2) and ((c == '~') or (('a' <= c) and (c <= 'z')) or (('A' <= c) and (c <= 'Z')))
+        return colour[1] != ']'
+    
+    
+    @staticmethod
+    def __getCacheFile(realfile):
+        '''
+        Gets the cache file for a pony file, and creates the cache directory if it does not exist
+        
+        @param   realfile:str  The canonical path of the pony file
+        @return  :str?         The cache file, `None` if the cache cannot be used
+        '''
+        cachedir = os.environ['XDG_CACHE_HOME'] if 'XDG_CACHE_HOME' in os.environ else ''
+        if len(cachedir) == 0:
+            home = os.environ['HOME'] if 'HOME' in os.environ else ''
+            if len(home) == 0:
+                return None
+            cachedir = home + '/.cache'
+        cachedir += '/ponysay/templates'
+        try:
+            if not os.path.isdir(cachedir):
+                os.makedirs(cachedir)
+        except:
+            return None
+        return cachedir + '/' + hashlib.sha1(realfile.encode('utf-8', 'surrogateescape')).hexdigest()
+    
+    
+    @staticmethod
+    def __loadCached(cachefile, realfile, key):
+        '''
+        Loads a template from the cache
+        
+        @param   cachefile:str           The cache file
+        @param   realfile:str            The canonical path of the pony file
+        @param   key:(int, int)          The modification time, in nanoseconds, and the size of the pony file
+        @return  :PonyTemplate?          The template, `None` if it is not cached or if the cache is out of date
+        '''
+        try:
+            with open(cachefile, 'rb') as file:
+                data = json.loads(file.read().decode('utf-8'))
+        except:
+            return None
+        if (data['version'] != TEMPLATE_VERSION) or (data['file'] != realfile):
+            return None
+        if (data['mtime'], data['size']) != key:
+            return None
+        return PonyTemplate(data['info'], data['body'])
+    
+    
+    @staticmethod
+    def __storeCached(cachefile, realfile, key, template):
+        '''
+        Stores a template in the cache, failures are ignored
+        
+        @param  cachefile:str          The cache file
+        @param  realfile:str           The canonical path of the pony file
+        @param  key:(int, int)         The modification time, in nanoseconds, and the size of the pony file
+        @param  template:PonyTemplate  The template
+        '''
+        data = {'version' : TEMPLATE_VERSION, 'file' : realfile, 'mtime' : key[0], 'size' : key[1],
+                'info' : template.info, 'body' : template.body}
+        tmpfile = '%s.%i.%i~' % (cachefile, os.getpid(), threading.get_ident())
+        try:
+            with open(tmpfile, 'wb') as file:
+                file.write(json.dumps(data, ensure_ascii = False, separators = (',', ':')).encode('utf-8', 'surrogateescape'))
+            os.replace(tmpfile, cachefile)
+        except:
+            try:
+                os.remove(tmpfile)
+            except:
+                pass
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+ponysay - Ponysay, cowsay reimplementation for ponies
+
+Copyright (C) 2012-2016  Erkin Batu Altunbaş et al.
+
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+If you intend to redistribute ponysay or a fork of it commercially,
+it contains aggregated images, some of which may not be commercially
+redistribute, you would be required to remove those. To determine
+whether or not you may commercially redistribute an image make use
+that line ‘FREE: yes’, is included inside the image between two ‘$$$’
+lines and the ‘FREE’ is and upper case and directly followed by
+the colon.
+'''
+from common import *
+
+import re
+
+
+
+class SGRMinimiser():
+    '''
+    Rewrites the SGR (colour and attribute) escape sequences in a text to as few bytes as possible
+    
+    The minimiser keeps track of the graphic rendition the text asks for and of the graphic
+    rendition the terminal is in, and only when something is printed does it emit one escape
+    sequence that takes the terminal to the asked rendition, either by changing what differs
+    or by resetting, whichever is shorter. The rendition is stored as the foreground colour,
+    the background colour, and the attributes (SGR parameters 1 to 5 and 7 to 9) packed into
+    an integer, bit i being set if the attribute i is used. After an SGR parameter whose effect
+    is not known, for example 21 which is bold off on some terminals and double underline on
+    others, the rendition is unknown and the escape sequences are passed on unchanged until
+    the next reset. Line breaks and escape sequences other than SGR and OSC, which can use the
+    background colour, take the terminal to the asked rendition just like printed text
+    '''
+    
+    DEFAULT = (None, None, 0)
+    '''
+    The rendition after a reset
+    '''
+    
+    __token = re.compile('\033(?:\\[([^~A-Za-z]*)m|(\\](?:P[0-9A-Fa-f]{0,7}|R|[^\007\033\n]*(?:\007|\033\\\\)?))|\\[[^~A-Za-z]*[~A-Za-z]?|.?)|\n', re.S)
+    '''
+    Escape sequences, with the parameters of SGR sequences in the first group and OSC sequences in
+    the second group, and line breaks
+    '''
+    
+    __parameters = re.compile('[0-9;]*')
+    '''
+    The SGR parameters whose effect can be known
+    '''
+    
+    __intensity = (1 << 1) | (1 << 2)
+    '''
+    The attributes bold and dim, both are removed by the SGR parameter 22
+    '''
+    
+    __effects = {}
+    '''
+    Map from renditions and SGR parameters to the rendition they give
+    '''
+    
+    __changes = {}
+    '''
+    Map from pairs of renditions to the escape sequence that changes the former to the latter
+    '''
+    
+    
+    def __init__(self):
+        '''
+        Constructor
+        '''
+        self.wanted = SGRMinimiser.DEFAULT
+        self.actual = SGRMinimiser.DEFAULT
+    
+    
+    def process(self, text):
+        '''
+        Minimise the escape sequences in a text, which can be done in any number of parts, as long
+        as no escape sequence is split between two parts
+        
+        @param   text:str  The text
+        @return  :str      The text with minimised escape sequences, except for the sequence that
+                           takes the terminal to the rendition in effect at the end of the text
+        '''
+        (rc, last) = ([], 0)
+        for match in SGRMinimiser.__token.finditer(text):
+            start = match.start()
+            if last < start:
+                self.__sync(rc)
+                rc.append(text[last : start])
+            last = match.end()
+            if match.group(1) is not None:
+                rendition = SGRMinimiser.apply(self.wanted, match.group(1))
+                if (self.wanted is None) or (rendition is None):
+                    ## The sequence is passed on unchanged if the rendition is or becomes unknown
+                    self.__sync(rc)
+                    rc.append(match.group())
+                    self.actual = rendition
+                self.wanted = rendition
+            elif match.group(2) is not None:
+                rc.append(match.group())
+            else:
+                self.__sync(rc)
+                rc.append(match.group())
+        if last < len(text):
+            self.__sync(rc)
+            rc.append(text[last:])
+        return ''.join(rc)
+    
+    
+    def end(self):
+        '''
+        Get the escape sequence that takes the terminal to the rendition in effect at the end of
+        the processed text, this should be printed after the processed text
+        
+        @return  :str  The escape sequence, empty if none is needed
+        '''
+        rc = []
+        self.__sync(rc)
+        return ''.join(rc)
+    
+    
+    def __sync(self, buf):
+        '''
+        Take the terminal to the asked rendition
+        
+        @param  buf:list<str>  The list to which the escape sequence, if one is needed, shall be appended
+        '''
+        if self.actual != self.wanted:
+            key = (self.actual, self.wanted)
+            if key not in SGRMinimiser.__changes:
+                SGRMinimiser.__changes[key] = '\033[%sm' % SGRMinimiser.change(self.actual, self.wanted)
+            buf.append(SGRMinimiser.__changes[key])
+            self.actual = self.wanted
+    
+    
+    @staticmethod
+    def apply(rendition, parameters):
+        '''
+        Get the rendition after an SGR escape sequence
+        
+        @param   rendition:(str?, str?, int)?  The rendition before the escape sequence, `None` if unknown
+        @param   parameters:str                The parameters of the escape sequence
+        @return  :(str?, str?, int)?           The rendition after the escape sequence, `None` if unknown
+        '''
+        key = (rendition, parameters)
+        if key not in SGRMinimiser.__effects:
+            SGRMinimiser.__effects[key] = SGRMinimiser.__apply(rendition, parameters)
+        return SGRMinimiser.__effects[key]
+    
+    
+    @staticmethod
+    def __apply(rendition, parameters):
+        '''
+        Get the rendition after an SGR escape sequence, without memoisation
+        
+        @param   rendition:(str?, str?, int)?  The rendition before the escape sequence, `None` if unknown
+        @param   parameters:str                The parameters of the escape sequence
+        @return  :(str?, str?, int)?           The rendition after the escape sequence, `None` if unknown
+        '''
+        if SGRMinimiser.__parameters.fullmatch(parameters) is None:
+            return None
+        known = rendition is not None
+        (foreground, background, attributes) = rendition if known else SGRMinimiser.DEFAULT
+        parts = parameters.split(';')
+        (i, n) = (0, len(parts))
+        while i < n:
+            p = 0 if parts[i] == '' else int(parts[i])
+            i += 1
+            if p == 0:
+                (known, foreground, background, attributes) = (True, None, None, 0)
+            elif p in (38, 48):
+                if (i + 1 < n) and (parts[i] == '5') and (parts[i + 1] != ''):
+                    colour = '%i;5;%i' % (p, int(parts[i + 1]))
+                    i += 2
+                elif (i + 3 < n) and (parts[i] == '2') and ('' not in parts[i + 1 : i + 4]):
+                    colour = '%i;2;%i;%i;%i' % (p, int(parts[i + 1]), int(parts[i + 2]), int(parts[i + 3]))
+                    i += 4
+                else:
+                    ## Terminals do not agree on where a malformed colour ends
+                    return None
+                if p == 38:  foreground = colour
+                else:        background = colour
+            elif (1 <= p <= 9) and (p != 6):            attributes |= 1 << p
+            elif p == 22:                               attributes &= ~SGRMinimiser.__intensity
+            elif (23 <= p <= 29) and (p != 26):         attributes &= ~(1 << (p - 20))
+            elif (30 <= p <= 37) or (90 <= p <= 97):    foreground = str(p)
+            elif (40 <= p <= 47) or (100 <= p <= 107):  background = str(p)
+            elif p == 39:                               foreground = None
+            elif p == 49:                               background = None
+            else:
+                known = False
+        return (foreground, background, attributes) if known else None
+    
+    
+    @staticmethod
+    def change(old, new):
+        '''
+        Get the shortest SGR parameters that take the terminal from one rendition to another
+        
+        @param   old:(str?, str?, int)?  The rendition the terminal is in, `None` if unknown
+        @param   new:(str?, str?, int)   The rendition to take the terminal to
+        @return  :str                    The SGR parameters
+        '''
+        reset = [str(i) for i in range(1, 10) if (new[2] >> i) & 1 == 1]
+        if new[0] is not None:  reset.append(new[0])
+        if new[1] is not None:  reset.append(new[1])
+        reset = ';'.join(['0'] + reset) if len(reset) > 0 else ''
+        if old is None:
+            return reset
+        
+        (changes, removed, added) = ([], old[2] & ~new[2], new[2] & ~old[2])
+        if removed & SGRMinimiser.__intensity != 0:
+            changes.append('22')
+            added |= new[2] & SGRMinimiser.__intensity
+        changes += [str(20 + i) for i in range(3, 10) if (removed >> i) & 1 == 1]
+        changes += [str(i) for i in range(1, 10) if (added >> i) & 1 == 1]
+        if old[0] != new[0]:  changes.append('39' if new[0] is None else new[0])
+        if old[1] != new[1]:  changes.append('49' if new[1] is None else new[1])
+        changes = ';'.join(changes)
+        return changes if len(changes) < len(reset) else reset
+    
+    
+    @staticmethod
+    def cells(text):
+        '''
+        Get the printed characters of a text, and the rendition they are printed with, this can
+        be used to check that the minimised text looks exactly like the original text
+        
+        @param   text:str  The text
+        @return  :list<list<(str, (str?, str?, int)|list<(str?, str?, int)|str>?)>>
+                           For each line, the characters and the escape sequences, other than SGR, in it, with the
+                           rendition they are printed with, `None` for OSC sequences, the line break is included
+                           and the last line ends with an empty string and the rendition in effect at the end of
+                           the text. An unknown rendition is given as the last known rendition followed by the
+                           parameters of the escape sequences that have been used since
+        '''
+        (rc, line, rendition, last) = ([], [], SGRMinimiser.DEFAULT, 0)
+        for match in SGRMinimiser.__token.finditer(text):
+            line += [(c, rendition) for c in text[last : match.start()]]
+            last = match.end()
+            if match.group(1) is not None:
+                following = SGRMinimiser.apply(None if isinstance(rendition, list) else rendition, match.group(1))
+                if following is not None:
+                    rendition = following
+                elif isinstance(rendition, list):
+                    rendition = rendition + [match.group(1)]
+                else:
+                    rendition = [rendition, match.group(1)]
+            else:
+                line.append((match.group(), None if match.group(2) is not None else rendition))
+                if match.group() == '\n':
+                    rc.append(line)
+                    line = []
+        line += [(c, rendition) for c in text[last:]]
+        rc.append(line + [('', rendition)])
+        return rc
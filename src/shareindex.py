@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+ponysay - Ponysay, cowsay reimplementation for ponies
+
+Copyright (C) 2012-2016  Erkin Batu Altunbaş et al.
+
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+If you intend to redistribute ponysay or a fork of it commercially,
+it contains aggregated images, some of which may not be commercially
+redistribute, you would be required to remove those. To determine
+whether or not you may commercially redistribute an image make use
+that line ‘FREE: yes’, is included inside the image between two ‘$$$’
+lines and the ‘FREE’ is and upper case and directly followed by
+the colon.
+'''
+from common import *
+
+import json
+import atexit
+
+
+
+SHAREINDEX_VERSION = '1'
+'''
+Share index snapshot format version constant
+'''
+
+
+
+class ShareIndex():
+    '''
+    Index of the files in the share directories
+    
+    The directories are listed at most once per process, and the listings,
+    and the targets of symlinks, are kept in a snapshot on disk that is used
+    for directories that have not been modified since it was written
+    '''
+    
+    __instance = None
+    '''
+    The process's index
+    '''
+    
+    
+    @staticmethod
+    def get():
+        '''
+        Gets the process's index, and creates it if it does not exist
+        
+        @return  :ShareIndex  The index
+        '''
+        if ShareIndex.__instance is None:
+            ShareIndex.__instance = ShareIndex()
+        return ShareIndex.__instance
+    
+    
+    def __init__(self):
+        '''
+        Constructor
+        '''
+        self.__snapshot = ShareIndex.__getSnapshotFile()
+        self.__dirs = None
+        self.__checked = set()
+        self.__dirty = False
+    
+    
+    def revalidate(self):
+        '''
+        Makes the index check again, once, whether directories have been modified
+        '''
+        self.__checked = set()
+    
+    
+    def files(self, directory):
+        '''
+        Lists the files in a directory
+        
+        @param   directory:str  The directory, must end with `os.sep`
+        @return  :tuple<str>    The files in the directory, in the order `os.listdir` lists them
+        '''
+        return self.__getDirectory(directory)['files']
+    
+    
+    def ponies(self, ponydir):
+        '''
+        Lists the ponies in a pony directory
+        
+        @param   ponydir:str  The pony directory, must end with `os.sep`
+        @return  :tuple<str>  The names of the ponies, in the order `os.listdir` lists them
+        '''
+        entry = self.__getDirectory(ponydir)
+        if 'ponies' not in entry:
+            entry['ponies'] = tuple(file[:-5] for file in entry['files'] if endswith(file, '.pony'))
+        return entry['ponies']
+    
+    
+    def link(self, directory, file):
+        '''
+        Gets the target of a file, if it is a symlink
+        
+        @param   directory:str  The directory, must end with `os.sep`
+        @param   file:str       The file in the directory
+        @return  :str?          The canonical path of the target, `None` if the file is not a symlink
+        '''
+        entry = self.__getDirectory(directory)
+        links = entry['links']
+        if file not in links:
+            links[file] = os.path.realpath(directory + file) if os.path.islink(directory + file) else None
+            self.__setDirty()
+        return links[file]
+    
+    
+    def quotes(self, quotedir):
+        '''
+        Groups the quote files in a quote directory by the ponies they are for
+        
+        @param   quotedir:str                 The quote directory, must end with `os.sep`
+        @return  :dict<str, list<str>>        Map from the ponies, joined with `+`, a quote file is for to the
+                                              quote files, with the directory; in the order `os.listdir` lists them
+        '''
+        entry = self.__getDirectory(quotedir)
+        if 'quotes' not in entry:
+            quotes = {}
+            for file in entry['files']:
+                if '.' in file:
+                    ponies = file[:file.rindex('.')]
+                    if ponies not in quotes:
+                        quotes[ponies] = []
+                    quotes[ponies].append(quotedir + file)
+            entry['quotes'] = quotes
+        return entry['quotes']
+    
+    
+    def quoted(self, quotedir):
+        '''
+        Maps ponies to their quote files in a quote directory
+        
+        A quote file is for all ponies in its name, before the last dot, separated by `+`
+        
+        @param   quotedir:str             The quote directory, must end with `os.sep`
+        @return  :dict<str, list<str>>    Map from the ponies to their quote files, with the directory
+        '''
+        entry = self.__getDirectory(quotedir)
+        if 'quoted' not in entry:
+            quoted = {}
+            quotes = self.quotes(quotedir)
+            for ponies in quotes:
+                for pony in dict.fromkeys(ponies.split('+')):
+                    if pony not in quoted:
+                        quoted[pony] = []
+                    quoted[pony] += quotes[ponies]
+            entry['quoted'] = quoted
+            self.__setDirty()
+        return entry['quoted']
+    
+    
+    def balloons(self, balloondir, isthink):
+        '''
+        Lists the balloon styles in a balloon directory
+        
+        @param   balloondir:str            The balloon directory, must end with `os.sep`
+        @param   isthink:bool              Whether to list the balloon styles for ponythink rather than ponysay
+        @return  :list<(str, str)>         The names of the balloon styles and their files, without the directory,
+                                           in the order `os.listdir` lists them
+        '''
+        entry = self.__getDirectory(balloondir)
+        key = 'think' if isthink else 'say'
+        if key not in entry:
+            ending = '.' + key
+            entry[key] = [(file[:-len(ending)], file) for file in entry['files'] if endswith(file, ending)]
+        return entry[key]
+    
+    
+    def __getDirectory(self, directory):
+        '''
+        Gets the index entry for a directory, lists the directory if it is not indexed or has been modified
+        
+        @param   directory:str  The directory, must end with `os.sep`
+        @return  :dict          The index entry
+        '''
+        if self.__dirs is None:
+            self.__dirs = self.__loadSnapshot()
+        if (directory in self.__dirs) and (directory in self.__checked):
+            return self.__dirs[directory]
+        
+        mtime = os.stat(directory).st_mtime_ns
+        self.__checked.add(directory)
+        if (directory in self.__dirs) and (self.__dirs[directory]['mtime'] == mtime):
+            return self.__dirs[directory]
+        entry = {'mtime' : mtime, 'files' : tuple(os.listdir(directory)), 'links' : {}}
+        self.__dirs[directory] = entry
+        self.__setDirty()
+        return entry
+    
+    
+    def __setDirty(self):
+        '''
+        Marks the index as modified, so that the snapshot is updated when the process exits
+        '''
+        if (not self.__dirty) and (self.__snapshot is not None):
+            self.__dirty = True
+            atexit.register(self.__saveSnapshot)
+    
+    
+    @staticmethod
+    def __getSnapshotFile():
+        '''
+        Gets the snapshot file
+        
+        @return  :str?  The snapshot file, `None` if there is no cache directory
+        '''
+        cachedir = os.environ['XDG_CACHE_HOME'] if 'XDG_CACHE_HOME' in os.environ else ''
+        if len(cachedir) == 0:
+            home = os.environ['HOME'] if 'HOME' in os.environ else ''
+            if len(home) == 0:
+                return None
+            cachedir = home + '/.cache'
+        return cachedir + '/ponysay/shareindex'
+    
+    
+    def __loadSnapshot(self):
+        '''
+        Loads the snapshot
+        
+        @return  :dict<str, dict>  The directory entries in the snapshot, empty if there is no usable snapshot
+        '''
+        if self.__snapshot is None:
+            return {}
+        try:
+            with open(self.__snapshot, 'rb') as file:
+                data = json.loads(file.read().decode('utf-8', 'surrogateescape'))
+            if data['version'] != SHAREINDEX_VERSION:
+                return {}
+            dirs = data['dirs']
+            for directory in dirs:
+                dirs[directory]['files'] = tuple(dirs[directory]['files'])
+            return dirs
+        except:
+            return {}
+    
+    
+    def __saveSnapshot(self):
+        '''
+        Saves the snapshot, failures are ignored
+        '''
+        dirs = {}
+        for directory in self.__dirs:
+            entry = self.__dirs[directory]
+            dirs[directory] = {'mtime' : entry['mtime'], 'files' : entry['files'], 'links' : entry['links']}
+            if 'quoted' in entry:
+                dirs[directory]['quoted'] = entry['quoted']
+        data = json.dumps({'version' : SHAREINDEX_VERSION, 'dirs' : dirs}, separators = (',', ':'))
+        tmpfile = '%s.%i~' % (self.__snapshot, os.getpid())
+        try:
+            cachedir = os.path.dirname(self.__snapshot)
+            if not os.path.isdir(cachedir):
+                os.makedirs(cachedir)
+            with open(tmpfile, 'wb') as file:
+                file.write(data.encode('utf-8', 'surrogateescape'))
+            os.replace(tmpfile, self.__snapshot)
+        except:
+            try:
+                os.remove(tmpfile)
+            except:
+                pass
@@ -30,17 +30,41 @@ lines and the ‘FREE’ is and upper case and directly followed by
 the colon.
 '''
 from common import *
+from shareindex import *
 
+import json
+import heapq
+import hashlib
 
 
-class SpelloCorrecter(): # Naïvely and quickly ported and adapted from optimised Java, may not be the nicest, or even fast, Python code
+
+SPELLO_CACHE_VERSION = '1'
+'''
+Version of the format of the cached spello correction indices
+'''
+
+
+
+class SpelloCorrecter():
     '''
     Class used for correcting spellos and typos,
     
-    Note that this implementation will not find that correctly spelled word are correct faster than it corrects words.
-    It is also limited to words of size 0 to 127 (inclusive)
+    The correctly spelled words are indexed in a BK-tree, a tree where each child is
+    labeled with its edit distance to its parent, so that a lookup only needs to compare
+    the word to correct with the words in the branches that, according to the triangle
+    inequality, can contain a word that is at least as close as the closest one found
+    so far. A tree is built once per set of words, and is kept for the rest of the
+    process and cached on disk.
+    
+    It is limited to words of size 0 to 127 (inclusive)
     '''
     
+    __trees = {}
+    '''
+    Map from the digests of sets of correctly spelled words to their BK-trees
+    '''
+    
+    
     def __init__(self, directories, ending = None):
         '''
         Constructor
@@ -65,196 +89,347 @@ class SpelloCorrecter(): # Naïvely and quickly ported and adapted from optimise
                         'q' : {'c' : 0.125, 'k' : 0.125, 'g' : 0.9}}
         
         self.corrections = None
-        self.dictionary = [None] * 513
-        self.reusable = [0] * 512
-        self.dictionaryEnd = 512
         self.closestDistance = 0
         
-        self.M = [None] * 128
-        for y in range(0, 128):
-            self.M[y] = [0] * 128
-            self.M[y][0] = y
-        m0 = self.M[0]
-        x = 127
-        while x > -1:
-            m0[x] = x
-            x -= 1
-        
-        previous = ''
-        self.dictionary[-1] = previous;
-        
+        words = set()
         if ending is not None:
             for directory in directories:
-                files = os.listdir(directory)
-                files.sort()
-                for filename in files:
-                    if (not endswith(filename, ending)) or (len(filename) - len(ending) > 127):
-                        continue
-                    proper = filename[:-len(ending)]
-                    
-                    if self.dictionaryEnd == 0:
-                        self.dictionaryEnd = len(self.dictionary)
-                        self.reusable = [0] * self.dictionaryEnd + self.reusable
-                        self.dictionary = [None] * self.dictionaryEnd + self.dictionary
-                    
-                    self.dictionaryEnd -= 1
-                    self.dictionary[self.dictionaryEnd] = proper
-                    
-                    prevCommon = min(len(previous), len(proper))
-                    for i in range(0, prevCommon):
-                        if previous[i] != proper[i]:
-                            prevCommon = i
-                            break
-                    previous = proper
-                    self.reusable[self.dictionaryEnd] = prevCommon
+                for filename in ShareIndex.get().files(directory):
+                    if endswith(filename, ending) and (len(filename) - len(ending) <= 127):
+                        words.add(filename[:-len(ending)])
         else:
-            files = directories
-            files.sort()
-            for proper in files:
-                if len(proper) > 127:
-                    continue
-                
-                if self.dictionaryEnd == 0:
-                    self.dictionaryEnd = len(self.dictionary)
-                    self.reusable = [0] * self.dictionaryEnd + self.reusable
-                    self.dictionary = [None] * self.dictionaryEnd + self.dictionary
-                
-                self.dictionaryEnd -= 1
-                self.dictionary[self.dictionaryEnd] = proper
-                
-                prevCommon = min(len(previous), len(proper))
-                for i in range(0, prevCommon):
-                    if previous[i] != proper[i]:
-                        prevCommon = i
-                        break
-                previous = proper
-                self.reusable[self.dictionaryEnd] = prevCommon
-        #part = self.dictionary[self.dictionaryEnd : len(self.dictionary) - 1]
-        #part.sort()
-        #self.dictionary[self.dictionaryEnd : len(self.dictionary) - 1] = part
-        #
-        #index = len(self.dictionary) - 1
-        #while index >= self.dictionaryEnd:
-        #    proper = self.dictionary[index]
-        #    prevCommon = min(len(previous), len(proper))
-        #    for i in range(0, prevCommon):
-        #        if previous[i] != proper[i]:
-        #            prevCommon = i
-        #            break
-        #    previous = proper
-        #    self.reusable[self.dictionaryEnd] = prevCommon
-        #    index -= 1;    
+            for proper in directories:
+                if len(proper) <= 127:
+                    words.add(proper)
+        self.tree = SpelloCorrecter.getTree(sorted(words))
+        self.known = None
     
     
-    def correct(self, used):
+    def correct(self, used, limit = None):
         '''
         Finds the closests correct spelled word
         
         @param   used:str                               The word to correct
-        @return  (words, distance):(list<string>, int)  A list the closest spellings and the weighted distance
+        @param   limit:int?                             The greatest distance of interest, words that are further
+                                                        away are not searched for, `None` for no limit
+        @return  (words, distance):(list<string>, int)  A list the closest spellings and the weighted distance,
+                                                        no words if none is within the limit
         '''
         if len(used) > 127:
             return ([used], 0)
         
-        self.__correct(used)
+        self.__correct(used, limit)
         return (self.corrections, self.closestDistance)
     
     
-    def __correct(self, used):
+    def correctAll(self, used, limit = None):
+        '''
+        Finds the closests correct spelled words for a number of words
+        
+        Correctly spelled words are recognised without searching, each distinct word is only
+        searched for once, and rather than searching the index, each word is compared with all
+        correctly spelled words at once with `__distances`
+        
+        @param   used:itr<str>                                The words to correct
+        @param   limit:int?                                   The greatest distance of interest, words that are further
+                                                              away are not searched for, `None` for no limit
+        @return  :list<(words, distance):(list<string>, int)>  For each word, in order, a list the closest spellings
+                                                              and the weighted distance, no spellings if none is within
+                                                              the limit
+        '''
+        if self.known is None:
+            self.known = set(self.tree[0])
+            self.lanes = SpelloCorrecter.__makeLanes(self.tree[0])
+        words = self.tree[0]
+        (rc, corrected) = ([], {})
+        for word in used:
+            if word not in corrected:
+                if (word in self.known) or (len(word) > 127):
+                    corrected[word] = ([word], 0)
+                else:
+                    distances = SpelloCorrecter.__distances(self.lanes, word)
+                    distance = min(distances) if len(distances) > 0 else 0x7FFFFFFF
+                    if (len(distances) == 0) or ((limit is not None) and (distance > limit)):
+                        corrected[word] = ([], 0x7FFFFFFF)
+                    else:
+                        (closest, index) = ([], distances.find(distance))
+                        while index >= 0:
+                            closest.append(words[index])
+                            index = distances.find(distance, index + 1)
+                        corrected[word] = (closest, distance)
+            rc.append(corrected[word])
+        return rc
+    
+    
+    def __correct(self, used, limit):
         '''
         Finds the closests correct spelled word
         
-        @param  used:str  The word to correct, it must satisfy all restrictions
+        @param  used:str    The word to correct, it must satisfy all restrictions
+        @param  limit:int?  The greatest distance of interest, `None` for no limit
         '''
-        self.closestDistance = 0x7FFFFFFF
-        previous = self.dictionary[-1]
-        prevLen = 0
-        usedLen = len(used)
+        self.closestDistance = 0x7FFFFFFF if limit is None else limit
+        self.corrections = []
+        (words, children) = self.tree
         
-        proper = None
-        prevCommon = 0
+        ## Visit the branches with the lowest bound for their distance first, so the closest
+        ## distance, and with it the number of branches that need to visited, drops quickly
+        pattern = SpelloCorrecter.__pattern(used)
+        queue = [(0, 0)] if len(words) > 0 else []
+        while len(queue) > 0:
+            (bound, node) = heapq.heappop(queue)
+            if bound > self.closestDistance:
+                break
+            distance = SpelloCorrecter.__distance(words[node], pattern)
+            if self.closestDistance > distance:
+                self.closestDistance = distance
+                self.corrections = [words[node]]
+            elif self.closestDistance == distance:
+                self.corrections.append(words[node])
+            edges = children[node]
+            for i in range(0, len(edges), 2):
+                bound = abs(edges[i] - distance)
+                if bound <= self.closestDistance:
+                    heapq.heappush(queue, (bound, edges[i + 1]))
         
-        d = len(self.dictionary) - 1
-        while d > self.dictionaryEnd:
-            d -= 1
-            proper = self.dictionary[d]
-            if abs(len(proper) - usedLen) <= self.closestDistance:
-                if previous == self.dictionary[d + 1]:
-                    prevCommon = self.reusable[d];
-                else:
-                    prevCommon = min(prevLen, len(proper))
-                    for i in range(0, prevCommon):
-                        if previous[i] != proper[i]:
-                            prevCommon = i
-                            break
-                
-                skip = min(prevLen, len(proper))
-                i = prevCommon
-                while i < skip:
-                    for u in range(0, usedLen):
-                        if (used[u] == previous[i]) or (used[u] == proper[i]):
-                            skip = i
-                            break
-                    i += 1
-                
-                common = min(skip, min(usedLen, len(proper)))
-                for i in range(0, common):
-                    if used[i] != proper[i]:
-                        common = i
-                        break
-                
-                distance = self.__distance(proper, skip, len(proper), used, common, usedLen)
-                
-                if self.closestDistance > distance:
-                    self.closestDistance = distance
-                    self.corrections = [proper]
-                elif self.closestDistance == distance:
-                    self.corrections.append(proper)
-                
-                previous = proper;
-                if distance >= 0x7FFFFF00:
-                    prevLen = distance & 255
-                else:
-                    prevLen = len(proper)
+        if len(self.corrections) == 0:
+            self.closestDistance = 0x7FFFFFFF
+        self.corrections.sort()
     
     
-    def __distance(self, proper, y0, yn, used, x0, xn):
+    @staticmethod
+    def distance(proper, used):
         '''
         Calculate the distance between a correct word and a incorrect word
         
         @param   proper:str  The correct word
-        @param   y0:int      The offset for `proper`
-        @param   yn:int      The length, before applying `y0`, of `proper`
         @param   used:str    The incorrect word
-        @param   x0:int      The offset for `used`
-        @param   xn:int      The length, before applying `x0`, of `used`
-        @return  :float      The distance between the words
+        @return  :int        The number of inserted, removed and changed characters
+        '''
+        return SpelloCorrecter.__distance(proper, SpelloCorrecter.__pattern(used))
+    
+    
+    @staticmethod
+    def __pattern(used):
         '''
-        my = self.M[y0]
-        for y in range(y0, yn):
-            best = 0x7FFFFFFF
-            p = proper[y]
-            myy = self.M[y + 1] # only one array bound check, and at most one + ☺
-            x = x0
-            while x < xn:
-                change = my[x]
-                u = used[x]
-                remove = myy[x]
-                add = my[x + 1]
-                
-                cw = 0 if p == u else 1
-                if my[x] in self.weights:
-                    if p in self.weights[u]:
-                      cw = self.weights[u][p]
-                x += 1
-                
-                myy[x] = min(cw + change, 1 + min(remove, add))
-                if best > myy[x]:
-                    best = myy[x]
-            
-            if best > self.closestDistance:
-                return 0x7FFFFF00 | y
-            my = myy
+        Prepares a word for `__distance`
         
-        return my[xn]
-
+        @param   used:str                            The word
+        @return  (masks, length):(dict<str, int>, int)  For each character in the word, the set of positions
+                                                        it is at as a bitset, and the length of the word
+        '''
+        masks = {}
+        for i in range(0, len(used)):
+            masks[used[i]] = masks.get(used[i], 0) | (1 << i)
+        return (masks, len(used))
+    
+    
+    @staticmethod
+    def __distance(proper, pattern):
+        '''
+        Calculate the distance between a correct word and a incorrect word, with Myers' bit-parallel
+        algorithm: the columns of the edit distance matrix are represented by two bitsets, of the
+        rows where the distance increases and where it decreases from the row above
+        
+        @param   proper:str                               The correct word
+        @param   pattern:(dict<str, int>, int)            The incorrect word, prepared with `__pattern`
+        @return  :int                                     The number of inserted, removed and changed characters
+        '''
+        (masks, length) = pattern
+        if length == 0:
+            return len(proper)
+        (full, last) = ((1 << length) - 1, 1 << (length - 1))
+        (positive, negative, distance) = (full, 0, length)
+        for p in proper:
+            equal = masks.get(p, 0)
+            vertical = equal | negative
+            horizontal = (((equal & positive) + positive) ^ positive) | equal
+            hpositive = negative | (full & ~(horizontal | positive))
+            hnegative = positive & horizontal
+            if hpositive & last:
+                distance += 1
+            elif hnegative & last:
+                distance -= 1
+            hpositive = (hpositive << 1) | 1
+            hnegative <<= 1
+            positive = full & (hnegative | ~(vertical | hpositive))
+            negative = hpositive & vertical & full
+        return distance
+    
+    
+    @staticmethod
+    def __makeLanes(words):
+        '''
+        Packs words for `__distances`
+        
+        Each word is given a lane of bits, the same number of bits for all words, a power of two
+        larger than the length of the longest word; the i:th character of a word is at the i:th
+        bit in its lane, the bits above the word's length are always zero
+        
+        @param   words:list<str>                                                      The words
+        @return  (masks, width, count, full, starts, bases):(dict<str, int>, int, int, int, int, int)
+                                                                                      For each character, the positions it is at in
+                                                                                      all words, as a bitset; the width of the lanes;
+                                                                                      the number of words; the bits used by the words;
+                                                                                      the first bit of each non-empty word; and the
+                                                                                      first bit of each lane
+        '''
+        width = 8
+        while width <= max([len(word) for word in words] + [0]):
+            width *= 2
+        size = len(words) * width // 8
+        (positions, full, starts, bases) = ({}, bytearray(size), bytearray(size), bytearray(size))
+        for (index, word) in enumerate(words):
+            offset = index * width
+            bases[offset // 8] = 1
+            if len(word) > 0:
+                starts[offset // 8] = 1
+            for i in range(0, len(word)):
+                full[(offset + i) // 8] |= 1 << ((offset + i) % 8)
+                if word[i] not in positions:
+                    positions[word[i]] = bytearray(size)
+                positions[word[i]][(offset + i) // 8] |= 1 << ((offset + i) % 8)
+        masks = dict((c, int.from_bytes(positions[c], 'little')) for c in positions)
+        (full, starts, bases) = [int.from_bytes(bits, 'little') for bits in (full, starts, bases)]
+        return (masks, width, len(words), full, starts, bases)
+    
+    
+    @staticmethod
+    def __distances(lanes, used):
+        '''
+        Calculate the distances between all correct words and an incorrect word, with Myers'
+        bit-parallel algorithm run for all correct words at once, each word in its own lane
+        of the bitsets, the rows of the edit distance matrix being the characters of the
+        correct words and the columns the characters of the incorrect word
+        
+        The distance for a correct word is the length of the incorrect word, plus the number
+        of rows in the last column where the distance increases from the row above, minus the
+        number of rows where it decreases; these are counted in each lane in parallel
+        
+        @param   lanes:(dict<str, int>, int, int, int, int, int)  The correct words, packed with `__makeLanes`
+        @param   used:str                                         The incorrect word, at most 127 characters long
+        @return  :bytes                                           The distance to each correct word, in order
+        '''
+        (masks, width, count, full, starts, bases) = lanes
+        (positive, negative) = (full, 0)
+        for u in used:
+            equal = masks.get(u, 0)
+            vertical = equal | negative
+            horizontal = ((((equal & positive) + positive) & full) ^ positive) | equal
+            hpositive = negative | (full & ~(horizontal | positive))
+            hnegative = positive & horizontal
+            hpositive = ((hpositive << 1) | starts) & full
+            hnegative = (hnegative << 1) & full
+            positive = full & (hnegative | ~(vertical | hpositive))
+            negative = hpositive & vertical
+        
+        ## Count the bits in each byte, and sum the bytes in each lane into its lowest byte
+        size = count * width // 8
+        ones = int.from_bytes(b'\x01' * size, 'little')
+        counts = []
+        for bits in (positive, negative):
+            bits -= (bits >> 1) & (ones * 0x55)
+            bits = (bits & (ones * 0x33)) + ((bits >> 2) & (ones * 0x33))
+            bits = (bits + (bits >> 4)) & (ones * 0x0F)
+            shift = 8
+            while shift < width:
+                bits += bits >> shift
+                shift *= 2
+            counts.append(bits & (bases * 0xFF))
+        distances = counts[0] + bases * len(used) - counts[1]
+        return distances.to_bytes(size, 'little')[:: width // 8]
+    
+    
+    @staticmethod
+    def getTree(words):
+        '''
+        Gets the BK-tree for a set of words, builds it if it is not cached
+        
+        @param   words:list<str>                                 The words, sorted and without duplicates
+        @return  (words, children):(list<str>, list<list<int>>)  The words, the first being the root, and for each word its
+                                                                 children as alternating distances and indices of the words
+        '''
+        digest = hashlib.sha1(('\n'.join(words)).encode('utf-8', 'surrogateescape')).hexdigest()
+        if digest in SpelloCorrecter.__trees:
+            return SpelloCorrecter.__trees[digest]
+        
+        ## Reuse the tree cached on disk, failures are ignored
+        cachefile = SpelloCorrecter.__getCacheFile(digest)
+        tree = None
+        if cachefile is not None:
+            try:
+                with open(cachefile, 'rb') as file:
+                    data = json.loads(file.read().decode('utf-8', 'surrogateescape'))
+                if (data['version'] == SPELLO_CACHE_VERSION) and (len(data['words']) == len(words)):
+                    tree = (data['words'], data['children'])
+            except:
+                pass
+        
+        if tree is None:
+            tree = SpelloCorrecter.makeTree(words)
+            if cachefile is not None:
+                data = {'version' : SPELLO_CACHE_VERSION, 'words' : tree[0], 'children' : tree[1]}
+                tmpfile = '%s.%i~' % (cachefile, os.getpid())
+                try:
+                    with open(tmpfile, 'wb') as file:
+                        file.write(json.dumps(data, separators = (',', ':')).encode('utf-8', 'surrogateescape'))
+                    os.replace(tmpfile, cachefile)
+                except:
+                    try:
+                        os.remove(tmpfile)
+                    except:
+                        pass
+        
+        SpelloCorrecter.__trees[digest] = tree
+        return tree
+    
+    
+    @staticmethod
+    def makeTree(words):
+        '''
+        Builds a BK-tree
+        
+        @param   words:list<str>                                 The words, without duplicates
+        @return  (words, children):(list<str>, list<list<int>>)  The words, the first being the root, and for each word its
+                                                                 children as alternating distances and indices of the words
+        '''
+        children = [[] for word in words]
+        for index in range(1, len(words)):
+            (pattern, node) = (SpelloCorrecter.__pattern(words[index]), 0)
+            while True:
+                distance = SpelloCorrecter.__distance(words[node], pattern)
+                edges = children[node]
+                child = None
+                for i in range(0, len(edges), 2):
+                    if edges[i] == distance:
+                        child = edges[i + 1]
+                        break
+                if child is None:
+                    edges += [distance, index]
+                    break
+                node = child
+        return (list(words), children)
+    
+    
+    @staticmethod
+    def __getCacheFile(digest):
+        '''
+        Gets the file with the cached BK-tree for a set of words, and creates
+        the cache directory if it does not exist
+        
+        @param   digest:str  The digest of the words
+        @return  :str?       The cache file, `None` if the cache cannot be used
+        '''
+        cachedir = os.environ['XDG_CACHE_HOME'] if 'XDG_CACHE_HOME' in os.environ else ''
+        if len(cachedir) == 0:
+            home = os.environ['HOME'] if 'HOME' in os.environ else ''
+            if len(home) == 0:
+                return None
+            cachedir = home + '/.cache'
+        cachedir += '/ponysay/spello'
+        try:
+            if not os.path.isdir(cachedir):
+                os.makedirs(cachedir)
+        except:
+            return None
+        return '%s/%s' % (cachedir, digest)
@@ -30,6 +30,7 @@ lines and the ‘FREE’ is and upper case and directly followed by
 the colon.
 '''
 from common import *
+from width import *
 
 
 
@@ -41,17 +42,12 @@ class UCS():
     @staticmethod
     def isCombining(char):
         '''
-        Checks whether a character is a combining character
+        Checks whether a character is a combining character, or another character without width
         
         @param   char:chr  The character to test
         @return  :bool     Whether the character is a combining character
         '''
-        o = ord(char)
-        if (0x0300 <= o) and (o <= 0x036F):  return True
-        if (0x20D0 <= o) and (o <= 0x20FF):  return True
-        if (0x1DC0 <= o) and (o <= 0x1DFF):  return True
-        if (0xFE20 <= o) and (o <= 0xFE2F):  return True
-        return False
+        return Width.char(char) == 0
     
     
     @staticmethod
@@ -62,20 +58,16 @@ class UCS():
         @param   string:str  A text to count combining characters in
         @return  :int        The number of combining characters in the string
         '''
-        rc = 0
-        for char in string:
-            if UCS.isCombining(char):
-                rc += 1
-        return rc
+        return sum(1 for char in string if Width.char(char) == 0)
     
     
     @staticmethod
     def dispLen(string):
         '''
-        Gets length of a string not counting combining characters
+        Gets the monospaced width of a string, combining characters have no width and wide characters have two columns
         
         @param   string:str  The text of which to determine the monospaced width
-        @return              The determine the monospaced width of the text, provided it does not have escape sequnces
+        @return              The determine the monospaced width of the text, escape sequences have no width
         '''
-        return len(string) - UCS.countCombining(string)
+        return Width.len(string)
 
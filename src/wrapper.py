@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+'''
+ponysay - Ponysay, cowsay reimplementation for ponies
+
+Copyright (C) 2012-2016  Erkin Batu Altunbaş et al.
+
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+If you intend to redistribute ponysay or a fork of it commercially,
+it contains aggregated images, some of which may not be commercially
+redistribute, you would be required to remove those. To determine
+whether or not you may commercially redistribute an image make use
+that line ‘FREE: yes’, is included inside the image between two ‘$$$’
+lines and the ‘FREE’ is and upper case and directly followed by
+the colon.
+'''
+from common import *
+from colourstack import *
+from width import *
+
+import re
+
+
+
+class Wrapper():
+    '''
+    Word wrapper for messages
+    
+    The message is read as lines, from any iterable, and the wrapped lines are generated one by
+    one, so the message does not have to be in memory. Each line is wrapped a word at a time,
+    a word being everything between two spaces, escape sequences included. Words are broken at
+    the wrapping column if they are longer than the limit, or if they do not fit on a line of
+    their own; if they contain soft hyphens, they are broken after the last soft hyphen before
+    the wrapping column, and if they contain no-break spaces, they are broken, without a hyphen,
+    at a no-break space that is at the wrapping column. Lines that are wrapped are indented as
+    much as the line was. Colours are carried over from one line to the next. The work done for
+    a word is proportional to its length, and words without escape sequences whose characters
+    are all below U+0300, except for the soft hyphen, are only looked at character by character
+    if they have to be broken
+    '''
+    
+    __stop = re.compile('[ \033]')
+    '''
+    The characters that end a run of printed characters in a word: space and escape
+    '''
+    
+    
+    def __init__(self, width, wraplimit, wrapexceed, hyphen):
+        '''
+        Constructor
+        
+        @param  width:int       The width at where to force wrapping
+        @param  wraplimit:int   The width under which words are not broken
+        @param  wrapexceed:int  How far words may exceed the wrapping column
+        @param  hyphen:str      The string to insert where a word is broken with a hyphen
+        '''
+        self.width = width
+        self.wraplimit = wraplimit
+        self.wrapexceed = wrapexceed
+        self.hyphen = hyphen
+    
+    
+    def wrap(self, lines):
+        '''
+        Wrap a message
+        
+        @param   lines:itr<str>  The lines of the message, without line breaks
+        @return  :itr<str>       The lines of the wrapped message, without line breaks
+        '''
+        AUTO_PUSH = '\033[01010~'
+        AUTO_POP  = '\033[10101~'
+        cstack = ColourStack(AUTO_PUSH, AUTO_POP)
+        
+        ## The colours are reset at the end of each line and restored at the start of the next
+        ## line, which line is the last is known by reading one line ahead
+        lines = iter(lines)
+        (line, first) = (next(lines, None), True)
+        while line is not None:
+            following = next(lines, None)
+            if following is None:
+                line = cstack.process(('' if first else AUTO_POP) + line)
+            else:
+                line = cstack.process(('' if first else AUTO_POP) + line + AUTO_PUSH + '\n')[:-1]
+            line = line.replace(AUTO_PUSH, '').replace(AUTO_POP, '')
+            for wrapped in self.__wrapLine(line):
+                yield wrapped.rstrip(' ').replace('­', '').replace('\0', self.hyphen)
+            (line, first) = (following, False)
+    
+    
+    def __wrapLine(self, line):
+        '''
+        Wrap a line of the message
+        
+        @param   line:str    The line, without line break
+        @return  :list<str>  The wrapped line, as lines without line breaks, trailing spaces and
+                             soft hyphens are kept and where hyphens shall be inserted there is a NUL
+        '''
+        (wrap, wraplimit, wrapexceed) = (self.width, self.wraplimit, self.wrapexceed)
+        buf = []
+        
+        ## `b` is the current word, from where it was last broken, with escape sequences split
+        ## into characters, and `map` maps numbers of columns in the word to lengths of the word
+        ## in `b`; they are reused, rather than cleared, between the words of the line
+        b = [None] * len(line)
+        map = [0]
+        (bi, cols, w) = (0, 0, wrap)
+        (indent, indentc) = (-1, 0)
+        
+        (i, n) = (0, len(line))
+        while True:
+            ## Fetch word
+            stop = Wrapper.__stop.search(line, i)
+            j = n if stop is None else stop.start()
+            word = line[i : j]
+            if ((j == n) or (line[j] == ' ')) and (word.isascii() or ((max(word) < '̀') and ('­' not in word))):
+                ## All characters have one column, they are only copied to `b` if the word is broken
+                if (indent == -1) and (i < j):
+                    indent = i
+                    indentc = line.count(' ', 0, indent)
+                (cols, copied) = (j - i, False)
+                i = j
+            else:
+                copied = True
+                while True:
+                    if i < j:
+                        if indent == -1:
+                            indent = i
+                            indentc = line.count(' ', 0, indent)
+                        run = line[i : j]
+                        if cols + len(run) >= len(map):
+                            map += [None] * (cols + len(run) + 1 - len(map))
+                        if run.isascii() or ((max(run) < '̀') and ('­' not in run)):
+                            b[bi : bi + len(run)] = run
+                            map[cols + 1 : cols + len(run) + 1] = range(bi + 1, bi + len(run) + 1)
+                            bi += len(run)
+                            cols += len(run)
+                        else:
+                            for d in run:
+                                b[bi] = d
+                                bi += 1
+                                if (Width.char(d) != 0) and (d != '­'):
+                                    cols += 1
+                                map[cols] = bi
+                        i = j
+                    if (i < n) and (line[i] == '\033'):
+                        ## Invisible stuff
+                        colourseq = Width.getEscape(line, i)
+                        b[bi : bi + len(colourseq)] = colourseq
+                        i += len(colourseq)
+                        bi += len(colourseq)
+                        stop = Wrapper.__stop.search(line, i)
+                        j = n if stop is None else stop.start()
+                    else:
+                        break
+            
+            ## Wrap?
+            iwrap = wrap - (0 if indent == 1 else indentc)
+            if ((w > wraplimit) and (cols > w + wrapexceed)) or (cols > iwrap):
+                if not copied:
+                    if cols >= len(map):
+                        map += [None] * (cols + 1 - len(map))
+                    b[:cols] = word
+                    map[1 : cols + 1] = range(1, cols + 1)
+                    (bi, copied) = (cols, True)
+                mm = 0
+                bisub = 0
+                
+                while ((w > wraplimit) and (cols > w + wrapexceed)) or (cols > iwrap):
+                    ## wrap
+                    x = w;
+                    if (not (0 <= mm + x < len(map))) or (map[mm + x] is None): # Too much whitespace?
+                        cols = 0
+                        break
+                    m = map[mm + x]
+                    nbsp = b[m] == ' ' # nbsp
+                    
+                    if ('­' in b[bisub : m]) and not nbsp: # soft hyphen
+                        hyphen = m - 1
+                        while b[hyphen] != '­': # soft hyphen
+                            hyphen -= 1
+                        h = x
+                        while (mm + h > 0) and (map[mm + h] > hyphen): ## Only looking backward, if forward is required the word is probabily not hyphenated correctly
+                            h -= 1
+                        if map[mm + h] <= hyphen:
+                            x = h + 1
+                            m = map[mm + x]
+                    
+                    if (m == bisub) and (x == (0 if nbsp else 1)) and (w == iwrap): # Nothing left to break off?
+                        cols = 0
+                        break
+                    
+                    mm += x - (0 if nbsp else 1) ## − 1 so we have space for a hythen
+                    
+                    buf.append(''.join(b[bisub : m]))
+                    buf.append('\n' if nbsp else '\0\n')
+                    cols -= x - (0 if nbsp else 1)
+                    bisub = m
+                    
+                    w = iwrap
+                    if indent != -1:
+                        buf.append(' ' * indentc)
+                
+                if bisub < bi:
+                    b[: bi - bisub] = b[bisub : bi]
+                bi -= bisub
+            
+            if cols > w:
+                buf.append('\n')
+                w = wrap
+                if indent != -1:
+                    buf.append(' ' * indentc)
+                    w -= indentc
+            buf.append(''.join(filter(None, b[:bi])) if copied else word)
+            w -= cols
+            cols = 0
+            bi = 0
+            if i >= n:
+                break
+            i += 1
+            if w > 0:
+                buf.append(' ')
+                w -= 1
+            else:
+                buf.append('\n')
+                w = wrap
+                if indent != -1:
+                    buf.append(' ' * indentc)
+                    w -= indentc
+        
+        return ''.join(buf).split('\n')